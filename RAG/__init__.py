@@ -4,7 +4,10 @@ from .text_splitter import TextSplitter
 from .embeddings import EmbeddingModel
 from .vector_store import VectorStore
 from .retriever import Retriever
-from config import DOCUMENTS_DIR, VECTOR_STORE_DIR
+from .manifest import DocumentManifest
+from config import DOCUMENTS_DIR, VECTOR_STORE_DIR, RAG_CONFIG
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
 import os
 import time
 from tqdm import tqdm
@@ -14,117 +17,197 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def initialize_rag_system(force_rebuild=False):
+def initialize_rag_system(force_rebuild=False, build_missing=True):
     """
     
     @brief 初始化整个RAG系统，包括文档加载器、分割器、嵌入模型、向量存储和检索器
     
     @param force_rebuild (bool): 是否强制重建向量库，默认为False
+    @param build_missing (bool): 向量库不存在时是否在当前线程中构建；后端服务传入False，
+                                 由其后台构建任务负责构建，保证同一时间只运行一个构建
     
     @return Retriever: 初始化完成的检索器实例
     """
-    vector_store = VectorStore(rebuild_mode=force_rebuild)  
-    if not force_rebuild and vector_store.index_path.exists() and vector_store.metadata_path.exists():
-        logger.info("Using existing vector store")
-        return Retriever()
+    if not force_rebuild:
+        # 索引只由检索器中的VectorStore加载一次
+        retriever = Retriever()
+        if retriever.vector_store.exists() or not build_missing:
+            logger.info("Using existing vector store")
+            return retriever
+        retriever.close()
     
     
     logger.info("Vector store not found or incomplete. Building new vector store...")
-    if build_vector_store():
+    if build_vector_store(full_rebuild=force_rebuild):
         return Retriever()
     else:
         logger.error("Failed to build vector store")
         return Retriever()
 
-def build_vector_store(progress_callback=None):
+def _embed_in_batches(embedding_model, texts, progress_callback):
+    """
+    
+    @brief 将文本按批次并发提交给嵌入模型，同时保持结果顺序与输入一致
+    
+    @param embedding_model (EmbeddingModel): 嵌入模型实例
+    @param texts (list): 需要生成嵌入的文本列表
+    @param progress_callback (function): 进度回调函数，按embed阶段报告进度
+    
+    @return tuple: (与texts一一对应的向量列表，无效向量以零向量填充; 嵌入失败的文本下标集合)
+    """
+    config = RAG_CONFIG["embeddings"]
+    batch_size = embedding_model.batch_size
+    max_workers = max(1, config.get("max_concurrency", 4))
+    
+    batch_starts = list(range(0, len(texts), batch_size))
+    total_batches = len(batch_starts)
+    progress_callback(
+        stage="embed",
+        total=total_batches,
+        current=0,
+        message="开始生成嵌入向量",
+        details=f"共 {len(texts)} 条文本（正文与摘要），分 {total_batches} 批处理，并发数 {max_workers}"
+    )
+    
+    embeddings = [None] * len(texts)
+    failed = set()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(embedding_model.embed_texts, texts[i:i+batch_size]): i
+            for i in batch_starts
+        }
+        
+        for done, future in enumerate(tqdm(as_completed(futures), total=total_batches, desc="生成嵌入"), 1):
+            i = futures[future]
+            try:
+                batch_embeddings = future.result()
+            except Exception as e:
+                logger.error(f"Embedding batch starting at {i} failed: {str(e)}")
+                batch_embeddings = []
+            
+            for offset in range(min(batch_size, len(texts) - i)):
+                emb = batch_embeddings[offset] if offset < len(batch_embeddings) else None
+                if emb and len(emb) == embedding_model.dim:
+                    embeddings[i + offset] = emb
+                else:
+                    logger.warning(f"Invalid embedding at index {i + offset}")
+                    embeddings[i + offset] = [0.0] * embedding_model.dim
+                    failed.add(i + offset)
+            
+            progress_callback(
+                stage="embed",
+                current=done,
+                total=total_batches,
+                message=f"正在处理第 {done}/{total_batches} 批",
+                details=f"文本块 {i+1}-{min(i+batch_size, len(texts))}"
+            )
+    
+    return embeddings, failed
+
+def build_vector_store(progress_callback=None, full_rebuild=False):
     """
     
-    @brief 手动触发整个向量存储的构建过程，包括文档加载、文本分割、向量生成和索引构建
+    @brief 手动触发向量存储的构建过程，包括文档加载、文本分割、向量生成和索引构建；
+           默认依据文档清单只处理新增、修改和删除的文件，并合并到现有索引中
     
     @param progress_callback (function, optional): 进度回调函数，用于报告构建进度
+    @param full_rebuild (bool): 是否忽略清单，全量重建整个向量库，默认为False
     
     @return bool: 构建成功返回True，否则返回False
     """
     logger.info("Building new vector store...")
+    progress_callback = progress_callback or (lambda **kw: None)
     
     
     loader = DocumentLoader()
-    documents = loader.load_documents()
-    
-    
-    progress_callback = progress_callback or (lambda **kw: None)
-    progress_callback(stage="load", total=len(documents), current=0, message="开始加载文档")
+    manifest = DocumentManifest()
+    existing_store = None if full_rebuild else VectorStore()
+    incremental = existing_store is not None and manifest.exists() and existing_store.exists()
+    if not incremental:
+        manifest.clear()
+        if existing_store is not None:
+            # 全量构建写入新的实例，不再使用现有索引的实例
+            existing_store.close()
+            existing_store = None
+    
+    changes = manifest.diff(loader.list_files())
+    logger.info(f"Document changes: {changes}")
+    if incremental and not changes.has_changes():
+        existing_store.close()
+        logger.info("No document changes detected, vector store is up to date")
+        progress_callback(stage="load", message="文档未发生变化，无需重建", status="completed")
+        return True
     
-    if not documents:
+    if not changes.changed and not (incremental and changes.deleted):
+        if existing_store is not None:
+            existing_store.close()
         logger.warning("No documents found to build vector store")
         progress_callback(stage="load", message="未找到文档", status="error")
         return False
     
+    # 文档在进程池中并行解析，解析完成一个即交给分割器处理
+    loaded_paths = []
+    streamed = []
+    
+    def tracked_documents():
+        """
+        @brief 逐个产出进程池解析完成的文档，并报告加载进度
+        
+        @return Iterator[dict]: 文档生成器
+        """
+        total = len(changes.changed)
+        progress_callback(stage="load", total=total, current=0, message="开始加载文档")
+        for doc in loader.iter_documents(changes.changed):
+            loaded_paths.append(doc["file_path"])
+            if "complete" in doc:
+                streamed.append(doc)
+            progress_callback(
+                stage="load",
+                total=total,
+                current=len(loaded_paths),
+                message=f"已加载文档: {os.path.basename(doc['file_path'])}"
+            )
+            yield doc
+    
     
     splitter = TextSplitter(progress_callback=progress_callback)
-    chunks = splitter.split_documents(documents)
+    chunks = splitter.split_documents(tracked_documents(), total=len(changes.changed))
     
+    # 流式读取的文档在分割时才读取内容，读取失败或没有内容的文档与进程池中解析失败的文档一样不记入清单，下次构建时重试
+    incomplete = {doc["file_path"] for doc in streamed if not doc["complete"]}
+    loaded_paths = [file_path for file_path in loaded_paths if file_path not in incomplete]
     
-    if not chunks:
+    if not loaded_paths and not (incremental and changes.deleted):
+        if existing_store is not None:
+            existing_store.close()
+        logger.warning("No documents found to build vector store")
+        progress_callback(stage="load", message="未找到文档", status="error")
+        return False
+    
+    if not chunks and not incremental:
         logger.warning("No text chunks created from documents")
         progress_callback(stage="split", message="未生成文本块", status="error")
         return False
     
     
+    # 正文与摘要在同一个批处理阶段生成嵌入，共享批处理、缓存与并发
     embedding_model = EmbeddingModel()
     texts = [chunk["text"] for chunk in chunks]
+    summaries = [chunk["summary"] for chunk in chunks]
     
-    
-    batch_size = 32
-    embeddings = []
     logger.info("Generating embeddings...")
     start_time = time.time()
-    
-    
-    total_batches = (len(texts) + batch_size - 1) // batch_size
-    progress_callback(
-        stage="embed",
-        total=total_batches,
-        current=0,
-        message="开始生成嵌入向量",
-        details=f"共 {len(texts)} 个文本块，分 {total_batches} 批处理"
-    )
-    
-    
-    for batch_idx, i in enumerate(tqdm(range(0, len(texts), batch_size), desc="生成嵌入")):
-        batch_texts = texts[i:i+batch_size]
-        batch_embeddings = embedding_model.embed_texts(batch_texts)
-        
-        
-        progress_callback(
-            stage="embed",
-            current=batch_idx + 1,
-            total=total_batches,
-            message=f"正在处理第 {batch_idx+1}/{total_batches} 批",
-            details=f"文本块 {i+1}-{min(i+batch_size, len(texts))}"
-        )
-        
-        
-        valid_embeddings = []
-        for emb in batch_embeddings:
-            if emb and len(emb) == embedding_model.dim:
-                valid_embeddings.append(emb)
-            else:
-                logger.warning(f"Invalid embedding at batch index {i}")
-                valid_embeddings.append([0.0] * embedding_model.dim)  
-        
-        embeddings.extend(valid_embeddings)
-    
-    
-    if len(embeddings) != len(chunks):
-        logger.warning(f"Embeddings count ({len(embeddings)}) doesn't match chunks count ({len(chunks)})")
-        
-        embeddings.extend([[0.0] * embedding_model.dim] * (len(chunks) - len(embeddings)))
+    all_embeddings, failed = _embed_in_batches(embedding_model, texts + summaries, progress_callback) if texts else ([], set())
+    # 正文或摘要嵌入失败的分块以零向量或正文向量代替，其文档在下次构建时重试
+    for i, chunk in enumerate(chunks):
+        if i in failed or len(texts) + i in failed:
+            chunk["embedding_failed"] = True
+    embeddings = all_embeddings[:len(texts)]
+    summary_embeddings = np.asarray(all_embeddings[len(texts):], dtype=np.float32).reshape(-1, embedding_model.dim)
     
     logger.info(f"Embeddings generated in {time.time()-start_time:.2f} seconds")
-    
-    
-    vector_store = VectorStore(rebuild_mode=True)  
+    if embedding_model.cache is not None:
+        logger.info(f"Embedding cache stats: {embedding_model.cache.stats()}")
     
     
     def index_progress(**kwargs):
@@ -132,11 +215,59 @@ def build_vector_store(progress_callback=None):
         progress_callback(**kwargs)
     
     
-    success = vector_store.add_chunks(chunks, embeddings, progress_callback=index_progress)
+    if incremental:
+        success = existing_store.merge_chunks(
+            chunks,
+            embeddings,
+            removed_sources=changes.removed_sources,
+            progress_callback=index_progress,
+            summary_embeddings=summary_embeddings
+        )
+        if not success:
+            # 合并成功时实例仍供后台压缩使用，只在失败时关闭
+            existing_store.close()
+    else:
+        vector_store = VectorStore(rebuild_mode=True)
+        success = vector_store.add_chunks(
+            chunks,
+            embeddings,
+            progress_callback=index_progress,
+            summary_embeddings=summary_embeddings
+        )
+        vector_store.close()
     
     if success:
+        _update_manifest(manifest, changes, loaded_paths, chunks)
         logger.info("Vector store built successfully")
         return True
     else:
         logger.error("Failed to build vector store")
-        return False
\ No newline at end of file
+        return False
+
+def _update_manifest(manifest, changes, loaded_paths, chunks):
+    """
+    
+    @brief 构建成功后将本次处理的文档写入清单
+    
+    @param manifest (DocumentManifest): 文档清单
+    @param changes (ManifestDiff): 本次构建的文档差异
+    @param loaded_paths (list): 本次成功加载的文档路径
+    @param chunks (list): 本次生成的文本块
+    """
+    chunk_ids = {}
+    needs_retry = set()
+    for chunk in chunks:
+        chunk_ids.setdefault(chunk["source"], []).append(chunk["chunk_id"])
+        if chunk.get("summary_fallback") or chunk.get("embedding_failed"):
+            needs_retry.add(chunk["source"])
+    
+    for file_path in changes.removed_sources:
+        manifest.remove(file_path)
+    for file_path in loaded_paths:
+        manifest.update(
+            file_path,
+            changes.states[file_path],
+            chunk_ids.get(file_path, []),
+            needs_retry=file_path in needs_retry
+        )
+    manifest.save()
@@ -0,0 +1,102 @@
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import httpx
+
+from config import SERVICE_CONFIG
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_client: Optional[httpx.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# 上游调用与请求结果的统计，用于观察客户端断开或超时后被取消的工作量
+_stats_lock = threading.Lock()
+_stage_stats = {}
+_request_stats = {"completed": 0, "failed": 0, "disconnected": 0, "deadline_exceeded": 0}
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    @brief 获取当前事件循环共享的异步HTTP客户端，复用到Ollama的连接（检索、重排序与生成共用）
+    
+    @return httpx.AsyncClient: 带连接池的异步客户端
+    """
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client.is_closed or _client_loop is not loop:
+        pool_size = SERVICE_CONFIG.get("async_pool_size", 32)
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(SERVICE_CONFIG["embedding_timeout"])
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_async_client():
+    """
+    @brief 关闭共享的异步HTTP客户端，在服务停止时调用
+    """
+    global _client, _client_loop
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+    _client_loop = None
+
+
+@asynccontextmanager
+async def track_upstream(stage: str):
+    """
+    @brief 统计一次上游调用（嵌入、重排序、生成）的结果与耗时，调用被取消时计入已取消的工作量
+    
+    @param stage (str): 阶段名称
+    """
+    start = time.perf_counter()
+    outcome = "completed"
+    try:
+        yield
+    except (asyncio.CancelledError, GeneratorExit):
+        outcome = "cancelled"
+        raise
+    except Exception:
+        outcome = "failed"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        with _stats_lock:
+            stats = _stage_stats.setdefault(stage, {
+                "completed": 0, "failed": 0, "cancelled": 0, "cancelled_seconds": 0.0
+            })
+            stats[outcome] += 1
+            if outcome == "cancelled":
+                stats["cancelled_seconds"] += elapsed
+
+
+def record_request(outcome: str):
+    """
+    @brief 记录一次对话请求的结局
+    
+    @param outcome (str): completed、failed、disconnected或deadline_exceeded
+    """
+    with _stats_lock:
+        _request_stats[outcome] += 1
+
+
+def cancellation_stats() -> dict:
+    """
+    @brief 获取请求结局与各阶段上游调用的统计
+    
+    @return dict: requests为各结局的请求数，stages为各阶段完成、失败、取消的次数及被取消调用已运行的秒数
+    """
+    with _stats_lock:
+        return {
+            "requests": dict(_request_stats),
+            "stages": {stage: dict(stats) for stage, stats in _stage_stats.items()}
+        }
@@ -0,0 +1,653 @@
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Hashable, Iterable, List, Optional
+
+import numpy as np
+
+from config import CACHE_DIR, RAG_CONFIG, SERVICE_CONFIG
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# SQLite单条语句允许的参数个数有限，批量查询时按此大小分段
+_SQL_BATCH = 500
+
+
+def text_hash(*parts: str) -> str:
+    """
+    @brief 计算若干字符串组合后的SHA-256摘要，作为内容寻址的缓存键
+    
+    @param parts (str): 参与计算的字符串片段
+    
+    @return str: 十六进制摘要字符串
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def normalize_query(query: str) -> str:
+    """
+    @brief 规范化查询文本作为缓存键：去掉首尾空白、合并连续空白并统一大小写
+    
+    @param query (str): 原始查询
+    
+    @return str: 规范化后的查询
+    """
+    return re.sub(r'\s+', ' ', query).strip().casefold()
+
+
+class TTLCache:
+    """
+    @brief 线程安全的进程内LRU缓存，条目超过存活时间后失效，并统计命中率
+    """
+    
+    def __init__(self, max_entries: int = 1024, ttl_seconds: Optional[float] = None):
+        """
+        @brief 初始化缓存
+        
+        @param max_entries (int): 最大条目数，超出后淘汰最久未访问的条目
+        @param ttl_seconds (float, optional): 条目存活时间（秒），None表示不过期
+        """
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        @brief 读取条目并将其标记为最近使用，过期条目视为未命中
+        
+        @param key (Hashable): 缓存键
+        @param default (Any): 未命中时的返回值
+        
+        @return Any: 缓存值
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and self.ttl_seconds is not None and time.monotonic() - entry[1] > self.ttl_seconds:
+                del self._data[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+    
+    def put(self, key: Hashable, value: Any):
+        """
+        @brief 写入条目，超过容量时淘汰最久未访问的条目
+        
+        @param key (Hashable): 缓存键
+        @param value (Any): 缓存值
+        """
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        """
+        @brief 清空缓存内容并重置统计
+        """
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = self.expirations = 0
+    
+    def __len__(self):
+        """
+        @brief 当前条目数（含尚未清理的过期条目）
+        
+        @return int: 条目数
+        """
+        return len(self._data)
+    
+    def stats(self) -> dict:
+        """
+        @brief 返回缓存的命中、淘汰与容量统计
+        
+        @return dict: 统计信息字典
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self._data),
+                "max_entries": self.max_entries
+            }
+
+
+class SemanticCache:
+    """
+    @brief 语义缓存：保存(查询向量, 上下文指纹, 回答)，新查询与已缓存查询的余弦距离在阈值内、
+           且作用域（模型、索引版本等）相同时直接返回缓存的回答；查找为一次矩阵向量乘法，
+           按条目数与总字节数进行LRU淘汰
+    """
+    
+    def __init__(self, dim: int, max_distance: float = 0.05, max_entries: int = 1000, max_size_mb: float = 64):
+        """
+        @brief 初始化空缓存
+        
+        @param dim (int): 查询向量维度
+        @param max_distance (float): 命中所需的最大余弦距离（1 - 余弦相似度）
+        @param max_entries (int): 最大条目数
+        @param max_size_mb (float): 回答文本的总大小上限（MB）
+        """
+        self.dim = dim
+        self.max_distance = max_distance
+        self.max_entries = max(1, int(max_entries))
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # 向量矩阵的前len(self._entries)行有效，删除时用最后一行填补空位
+        self._matrix = np.zeros((min(self.max_entries, 64), dim), dtype=np.float32)
+        self._entries = []
+        self._last_access = np.zeros(len(self._matrix), dtype=np.float64)
+        self._total_size = 0
+        self._lock = threading.Lock()
+    
+    def lookup(self, embedding: List[float], scope: Hashable, fingerprint: str) -> Optional[dict]:
+        """
+        @brief 查找与查询向量足够接近、作用域相同且上下文指纹一致的缓存回答；
+               相近问题检索到的上下文不同时视为未命中
+        
+        @param embedding (List[float]): 查询向量
+        @param scope (Hashable): 作用域，只有完全相同的作用域才会命中
+        @param fingerprint (str): 本次回答将使用的上下文的指纹
+        
+        @return Optional[dict]: 命中时返回包含answer、fingerprint、distance的字典
+        """
+        query = self._normalize(embedding)
+        with self._lock:
+            count = len(self._entries)
+            if query is None or count == 0:
+                self.misses += 1
+                return None
+            similarities = self._matrix[:count] @ query
+            in_scope = np.fromiter(
+                (entry["scope"] == scope and entry["fingerprint"] == fingerprint for entry in self._entries),
+                dtype=bool, count=count
+            )
+            similarities[~in_scope] = -np.inf
+            best = int(np.argmax(similarities))
+            distance = 1.0 - float(similarities[best])
+            if distance > self.max_distance:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._last_access[best] = time.monotonic()
+            entry = self._entries[best]
+            return {"answer": entry["answer"], "fingerprint": entry["fingerprint"], "distance": distance}
+    
+    def put(self, embedding: List[float], scope: Hashable, fingerprint: str, answer: str):
+        """
+        @brief 写入回答；已有作用域和上下文指纹都相同的几乎相同的查询时覆盖该条目，超过容量时按LRU淘汰；
+               单个回答超过总大小上限时不缓存
+        
+        @param embedding (List[float]): 查询向量
+        @param scope (Hashable): 作用域
+        @param fingerprint (str): 生成回答时所用上下文的指纹
+        @param answer (str): 模型生成的回答
+        """
+        query = self._normalize(embedding)
+        if query is None:
+            return
+        size = len(answer.encode("utf-8"))
+        if size > self.max_size_bytes:
+            return
+        with self._lock:
+            count = len(self._entries)
+            if count:
+                similarities = self._matrix[:count] @ query
+                for idx in np.flatnonzero(similarities >= 1.0 - 1e-6):
+                    entry = self._entries[idx]
+                    if entry["scope"] == scope and entry["fingerprint"] == fingerprint:
+                        self._remove(int(idx))
+                        break
+            
+            if len(self._entries) == len(self._matrix):
+                self._grow()
+            while self._entries and (
+                len(self._entries) >= self.max_entries or self._total_size + size > self.max_size_bytes
+            ):
+                self._remove(int(np.argmin(self._last_access[:len(self._entries)])))
+                self.evictions += 1
+            
+            idx = len(self._entries)
+            self._matrix[idx] = query
+            self._last_access[idx] = time.monotonic()
+            self._entries.append({"scope": scope, "fingerprint": fingerprint, "answer": answer, "size": size})
+            self._total_size += size
+    
+    def _normalize(self, embedding) -> Optional[np.ndarray]:
+        """
+        @brief 校验并归一化向量
+        
+        @param embedding (List[float]): 向量
+        
+        @return Optional[np.ndarray]: 归一化向量，无效时返回None
+        """
+        if embedding is None or len(embedding) != self.dim:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else None
+    
+    def _grow(self):
+        """
+        @brief 容量翻倍（不超过max_entries），调用方需持有锁
+        """
+        capacity = min(self.max_entries, len(self._matrix) * 2)
+        if capacity <= len(self._matrix):
+            return
+        matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+        matrix[:len(self._matrix)] = self._matrix
+        last_access = np.zeros(capacity, dtype=np.float64)
+        last_access[:len(self._last_access)] = self._last_access
+        self._matrix, self._last_access = matrix, last_access
+    
+    def _remove(self, idx: int):
+        """
+        @brief 删除条目并用最后一行填补空位，调用方需持有锁
+        
+        @param idx (int): 条目下标
+        """
+        last = len(self._entries) - 1
+        self._total_size -= self._entries[idx]["size"]
+        if idx != last:
+            self._matrix[idx] = self._matrix[last]
+            self._last_access[idx] = self._last_access[last]
+            self._entries[idx] = self._entries[last]
+        self._entries.pop()
+    
+    def clear(self):
+        """
+        @brief 清空缓存内容并重置统计
+        """
+        with self._lock:
+            self._entries = []
+            self._total_size = 0
+            self.hits = self.misses = self.evictions = 0
+    
+    def stats(self) -> dict:
+        """
+        @brief 返回缓存的命中、淘汰与容量统计
+        
+        @return dict: 统计信息字典
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "size_bytes": self._total_size,
+                "max_size_bytes": self.max_size_bytes
+            }
+
+
+class SQLiteCache:
+    """
+    @brief 基于SQLite的持久化键值缓存，按总字节数进行LRU淘汰并统计命中率
+    """
+    
+    def __init__(self, path, max_size_mb: float = 512):
+        """
+        @brief 打开（或创建）缓存数据库
+        
+        @param path (str | Path): SQLite数据库文件路径
+        @param max_size_mb (float): 缓存值的总大小上限（MB），超过后淘汰最久未访问的条目
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON cache(last_access)")
+        self._conn.commit()
+        row = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()
+        self._total_size = row[0]
+    
+    def get_many(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        """
+        @brief 批量查询缓存，并刷新命中条目的访问时间
+        
+        @param keys (Iterable[str]): 需要查询的键
+        
+        @return Dict[str, bytes]: 命中的键值对
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), _SQL_BATCH):
+                part = keys[i:i + _SQL_BATCH]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM cache WHERE key IN ({placeholders})", part
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE cache SET last_access = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+    
+    def put_many(self, items: Dict[str, bytes]):
+        """
+        @brief 批量写入缓存，超过容量上限时按LRU淘汰
+        
+        @param items (Dict[str, bytes]): 需要写入的键值对
+        """
+        if not items:
+            return
+        with self._lock:
+            keys = list(items)
+            for i in range(0, len(keys), _SQL_BATCH):
+                part = keys[i:i + _SQL_BATCH]
+                placeholders = ",".join("?" * len(part))
+                row = self._conn.execute(
+                    f"SELECT COALESCE(SUM(size), 0) FROM cache WHERE key IN ({placeholders})", part
+                ).fetchone()
+                self._total_size -= row[0]
+            now = time.time()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                [(key, value, len(value), now) for key, value in items.items()]
+            )
+            self._total_size += sum(len(value) for value in items.values())
+            if self._total_size > self.max_size_bytes:
+                self._evict()
+            self._conn.commit()
+    
+    def _evict(self):
+        """
+        @brief 删除最久未访问的条目，直到总大小降到上限的90%以下（调用方需持有锁）
+        """
+        target = int(self.max_size_bytes * 0.9)
+        while self._total_size > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM cache ORDER BY last_access ASC LIMIT ?", (_SQL_BATCH,)
+            ).fetchall()
+            if not rows:
+                self._total_size = 0
+                break
+            victims = []
+            for key, size in rows:
+                if self._total_size <= target:
+                    break
+                victims.append((key,))
+                self._total_size -= size
+            self._conn.executemany("DELETE FROM cache WHERE key = ?", victims)
+            self.evictions += len(victims)
+    
+    def clear(self):
+        """
+        @brief 清空缓存内容并重置统计
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+            self._total_size = 0
+            self.hits = self.misses = self.evictions = 0
+    
+    def stats(self) -> dict:
+        """
+        @brief 返回缓存的命中、淘汰与容量统计
+        
+        @return dict: 统计信息字典
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+                "size_bytes": self._total_size,
+                "max_size_bytes": self.max_size_bytes
+            }
+
+
+class EmbeddingCache(SQLiteCache):
+    """
+    @brief 以(模型名, 维度, 文本哈希)为键的嵌入向量缓存，向量按float32存储
+    """
+    
+    def key(self, model_name: str, dim: int, text: str) -> str:
+        """
+        @brief 生成文本对应的缓存键
+        
+        @param model_name (str): 嵌入模型名称
+        @param dim (int): 嵌入维度
+        @param text (str): 原始文本
+        
+        @return str: 缓存键
+        """
+        return text_hash(model_name, dim, text)
+    
+    def get_embeddings(self, model_name: str, dim: int, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        @brief 批量读取文本的缓存向量
+        
+        @param model_name (str): 嵌入模型名称
+        @param dim (int): 嵌入维度
+        @param texts (List[str]): 文本列表
+        
+        @return List[Optional[List[float]]]: 与输入对应的向量，未命中的项为None
+        """
+        keys = [self.key(model_name, dim, text) for text in texts]
+        found = self.get_many(keys)
+        results = []
+        for key in keys:
+            value = found.get(key)
+            results.append(np.frombuffer(value, dtype=np.float32).tolist() if value is not None else None)
+        return results
+    
+    def put_embeddings(self, model_name: str, dim: int, texts: List[str], embeddings: List[List[float]]):
+        """
+        @brief 批量写入有效的嵌入向量，空向量或维度不符的向量不会被缓存
+        
+        @param model_name (str): 嵌入模型名称
+        @param dim (int): 嵌入维度
+        @param texts (List[str]): 文本列表
+        @param embeddings (List[List[float]]): 与文本对应的向量列表
+        """
+        items = {}
+        for text, embedding in zip(texts, embeddings):
+            if embedding and len(embedding) == dim:
+                items[self.key(model_name, dim, text)] = np.asarray(embedding, dtype=np.float32).tobytes()
+        self.put_many(items)
+
+
+class SummaryCache(SQLiteCache):
+    """
+    @brief 以(摘要模型, 提示词版本, 文本哈希)为键的摘要缓存
+    """
+    
+    def key(self, model_name: str, prompt_version: str, text: str) -> str:
+        """
+        @brief 生成文本块对应的摘要缓存键
+        
+        @param model_name (str): 摘要模型名称
+        @param prompt_version (str): 摘要提示词版本，提示词变化时应同步修改
+        @param text (str): 文本块内容
+        
+        @return str: 缓存键
+        """
+        return text_hash(model_name, prompt_version, text)
+    
+    def get_summary(self, model_name: str, prompt_version: str, text: str) -> Optional[str]:
+        """
+        @brief 读取文本块的缓存摘要
+        
+        @param model_name (str): 摘要模型名称
+        @param prompt_version (str): 摘要提示词版本
+        @param text (str): 文本块内容
+        
+        @return Optional[str]: 缓存的摘要，未命中时返回None
+        """
+        key = self.key(model_name, prompt_version, text)
+        value = self.get_many([key]).get(key)
+        return value.decode("utf-8") if value is not None else None
+    
+    def put_summary(self, model_name: str, prompt_version: str, text: str, summary: str):
+        """
+        @brief 写入由模型成功生成的摘要
+        
+        @param model_name (str): 摘要模型名称
+        @param prompt_version (str): 摘要提示词版本
+        @param text (str): 文本块内容
+        @param summary (str): 模型生成的摘要
+        """
+        self.put_many({self.key(model_name, prompt_version, text): summary.encode("utf-8")})
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _get_cache(name: str, cache_cls, config: dict, default_file: str):
+    """
+    @brief 按名称获取进程内共享的缓存实例，配置关闭或打开失败时返回None
+    
+    @param name (str): 缓存名称
+    @param cache_cls (type): 缓存类
+    @param config (dict): 缓存配置，包含enable、file_name、max_size_mb
+    @param default_file (str): 未配置file_name时使用的文件名
+    
+    @return Optional[SQLiteCache]: 缓存实例
+    """
+    if not config.get("enable", False):
+        return None
+    if name not in _caches:
+        with _caches_lock:
+            if name not in _caches:
+                try:
+                    _caches[name] = cache_cls(
+                        Path(CACHE_DIR) / config.get("file_name", default_file),
+                        max_size_mb=config.get("max_size_mb", 512)
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to open {name} cache: {str(e)}")
+                    return None
+    return _caches[name]
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    @brief 获取进程内共享的嵌入缓存实例，配置关闭时返回None
+    
+    @return Optional[EmbeddingCache]: 嵌入缓存实例
+    """
+    config = RAG_CONFIG["embeddings"].get("cache", {})
+    return _get_cache("embedding", EmbeddingCache, config, "embeddings.sqlite")
+
+
+def get_summary_cache() -> Optional[SummaryCache]:
+    """
+    @brief 获取进程内共享的摘要缓存实例，配置关闭时返回None
+    
+    @return Optional[SummaryCache]: 摘要缓存实例
+    """
+    config = RAG_CONFIG.get("summarizer", {}).get("cache", {})
+    return _get_cache("summary", SummaryCache, config, "summaries.sqlite")
+
+
+def _get_memory_cache(name: str, config: dict) -> Optional[TTLCache]:
+    """
+    @brief 按名称获取进程内共享的内存缓存，检索器重建后依然保留，配置关闭时返回None
+    
+    @param name (str): 缓存名称
+    @param config (dict): 缓存配置，包含enable、max_entries、ttl_seconds
+    
+    @return Optional[TTLCache]: 缓存实例
+    """
+    if not config.get("enable", False):
+        return None
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = TTLCache(
+                max_entries=config.get("max_entries", 1024),
+                ttl_seconds=config.get("ttl_seconds")
+            )
+    return _caches[name]
+
+
+def get_query_embedding_cache() -> Optional[TTLCache]:
+    """
+    @brief 获取进程内共享的查询向量缓存，配置关闭时返回None
+    
+    @return Optional[TTLCache]: 查询向量缓存实例
+    """
+    return _get_memory_cache("query_embedding", RAG_CONFIG["retriever"].get("query_embedding_cache", {}))
+
+
+def get_retrieval_cache() -> Optional[TTLCache]:
+    """
+    @brief 获取进程内共享的检索结果缓存，键中包含索引版本，配置关闭时返回None
+    
+    @return Optional[TTLCache]: 检索结果缓存实例
+    """
+    return _get_memory_cache("retrieval", RAG_CONFIG["retriever"].get("result_cache", {}))
+
+
+def get_answer_cache() -> Optional[SemanticCache]:
+    """
+    @brief 获取进程内共享的语义回答缓存，配置关闭时返回None
+    
+    @return Optional[SemanticCache]: 语义回答缓存实例
+    """
+    config = SERVICE_CONFIG.get("answer_cache", {})
+    if not config.get("enable", False):
+        return None
+    with _caches_lock:
+        if "answer" not in _caches:
+            _caches["answer"] = SemanticCache(
+                dim=RAG_CONFIG["embeddings"].get("dim", 384),
+                max_distance=config.get("max_distance", 0.05),
+                max_entries=config.get("max_entries", 1000),
+                max_size_mb=config.get("max_size_mb", 64)
+            )
+    return _caches["answer"]
@@ -1,90 +1,297 @@
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 from config import DOCUMENTS_DIR, RAG_CONFIG
 import PyPDF2
 from docx import Document
 import markdown
+import csv
 import re
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def _pool_context():
+    """
+    @brief 解析进程池的启动方式；构建在后端服务的工作线程中运行，fork多线程进程可能继承被其他线程
+           持有的锁，因此使用forkserver（不支持时使用spawn）
+    
+    @return multiprocessing.context.BaseContext: 进程启动上下文
+    """
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return multiprocessing.get_context(method)
+
+
 class DocumentLoader:
     def __init__(self):
         """
         @brief 初始化文档加载器
         """
-        self.extensions = RAG_CONFIG["document_loader"]["extensions"]
+        config = RAG_CONFIG["document_loader"]
+        self.extensions = config["extensions"]
+        self.max_workers = config.get("max_workers", os.cpu_count() or 1)
+        self.max_in_flight = max(1, config.get("max_in_flight", self.max_workers * 2))
+        self.pdf_stream_threshold = config.get("pdf_stream_threshold_mb", 20) * 1024 * 1024
+        self.csv_rows_per_unit = max(1, config.get("csv_rows_per_unit", 50))
         self.documents_dir = Path(DOCUMENTS_DIR)
         self.documents_dir.mkdir(parents=True, exist_ok=True)
     
-    def load_documents(self):
+    def list_files(self):
         """
+        @brief 列出文档目录中所有支持格式的文件
         
-        @brief 从配置的文档目录中查找并加载所有支持格式的文档文件
-        
-        @return list: 文档列表，每个元素包含文件路径和内容的字典
+        @return list: 文件路径字符串列表
         """
-        documents = []
-        
+        files = []
         for ext in self.extensions:
             for file_path in self.documents_dir.glob(f"*{ext}"):
-                content = self._load_file(file_path)
-                if content:
-                    documents.append({
-                        "file_path": str(file_path),
-                        "content": content
-                    })
-                    logger.info(f"Loaded document: {file_path.name}")
-        
-        return documents
+                files.append(str(file_path))
+        return files
     
-    def _load_file(self, file_path):
+    def load_documents(self, file_paths=None):
         """
-        @brief 根据文件扩展名识别文件类型并使用相应方法加载文件内容
         
-        @param file_path (Path): 需要加载的文件路径对象
+        @brief 加载指定的文档文件，未指定时从配置的文档目录中查找并加载所有支持格式的文档文件
+        
+        @param file_paths (list, optional): 需要加载的文件路径列表，默认为文档目录中的全部文件
         
-        @return str: 文件内容字符串，加载失败时返回None
+        @return list: 文档列表，每个元素包含文件路径和内容的字典
+        """
+        return list(self.iter_documents(file_paths))
+    
+    def iter_documents(self, file_paths=None):
         """
-        ext = file_path.suffix.lower()
         
-        try:
-            if ext == ".txt":
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    return f.read()
+        @brief 使用进程池并行解析文档，按完成顺序逐个产出，在途文档数不超过max_in_flight
+        
+        @param file_paths (list, optional): 需要加载的文件路径列表，默认为文档目录中的全部文件
+        
+        @return Iterator[dict]: 文档生成器，每个元素包含文件路径和内容的字典
+        """
+        if file_paths is None:
+            file_paths = self.list_files()
+        
+        # 超大PDF和CSV在消费端按页/按行批流式读取，不进入进程池，其余文件在进程池中整体解析
+        streamed = []
+        parsed = []
+        for file_path in map(Path, file_paths):
+            units = self._stream_units(file_path)
+            if units is not None:
+                streamed.append(self._to_streamed_document(file_path, units))
+            else:
+                parsed.append(file_path)
+        
+        if self.max_workers <= 1 or len(parsed) <= 1:
+            yield from streamed
+            for file_path in parsed:
+                document = self._to_document(file_path, _load_file(file_path, self.csv_rows_per_unit))
+                if document:
+                    yield document
+            return
+        
+        pending_paths = iter(parsed)
+        with ProcessPoolExecutor(max_workers=self.max_workers, mp_context=_pool_context()) as executor:
+            in_flight = {}
             
-            elif ext == ".pdf":
-                content = []
-                with open(file_path, 'rb') as f:
-                    pdf_reader = PyPDF2.PdfReader(f)
-                    for page in pdf_reader.pages:
-                        text = page.extract_text()
-                        if text:
-                            content.append(text)
-                return "\n".join(content)
+            def submit_next():
+                """
+                @brief 提交下一个待解析的文件
+                
+                @return bool: 还有文件可提交时返回True
+                """
+                file_path = next(pending_paths, None)
+                if file_path is not None:
+                    in_flight[executor.submit(_load_file, file_path, self.csv_rows_per_unit)] = file_path
+                    return True
+                return False
             
-            elif ext == ".json":  
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    import json
-                    data = json.load(f)
-                    return str(data)  
-            elif ext == ".docx":
-                doc = Document(file_path)
-                return "\n".join([para.text for para in doc.paragraphs])
+            while len(in_flight) < self.max_in_flight and submit_next():
+                pass
             
-            elif ext == ".md":
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    return markdown.markdown(f.read())
+            yield from streamed
             
-            else:
-                logger.warning(f"Unsupported file type: {ext}")
-                return None
-        except Exception as e:
-            logger.error(f"Error loading {file_path}: {str(e)}")
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_path = in_flight.pop(future)
+                    try:
+                        content = future.result()
+                    except Exception as e:
+                        logger.error(f"Error loading {file_path}: {str(e)}")
+                        content = None
+                    submit_next()
+                    document = self._to_document(file_path, content)
+                    if document:
+                        yield document
+    
+    def _stream_units(self, file_path):
+        """
+        @brief 判断文件是否需要流式读取，需要时返回其内容单元生成器（此时尚未打开文件）
+        
+        @param file_path (Path): 文件路径
+        
+        @return Iterator[tuple] | None: (文本, 单元元数据)生成器，无需流式读取时返回None
+        """
+        ext = file_path.suffix.lower()
+        try:
+            if ext == ".pdf" and file_path.stat().st_size >= self.pdf_stream_threshold:
+                return self._iter_pdf_pages(file_path)
+            if ext == ".csv":
+                return self._iter_csv_rows(file_path, self.csv_rows_per_unit)
+        except OSError as e:
+            logger.error(f"Error reading {file_path}: {str(e)}")
+        return None
+    
+    def _to_document(self, file_path, content):
+        """
+        @brief 将解析结果包装为文档字典；整体内容放在content中，分页等单元放在units中
+        
+        @param file_path (Path): 文件路径
+        @param content (str | list): 文件内容字符串，或(文本, 单元元数据)列表，解析失败时为None
+        
+        @return dict: 文档字典，内容为空时返回None
+        """
+        if not content:
             return None
-
+        logger.info(f"Loaded document: {file_path.name}")
+        if isinstance(content, str):
+            return {
+                "file_path": str(file_path),
+                "content": content
+            }
+        return {
+            "file_path": str(file_path),
+            "units": content
+        }
+    
+    def _to_streamed_document(self, file_path, units):
+        """
+        @brief 将流式读取的单元包装为文档字典。文件在分割时才真正读取，读取结束后complete记录
+               是否读到了至少一个单元且没有出错，读取失败或内容为空的文件不应记为已入库
+        
+        @param file_path (Path): 文件路径
+        @param units (Iterator[tuple]): (文本, 单元元数据)生成器
+        
+        @return dict: 文档字典，包含units与complete
+        """
+        document = {
+            "file_path": str(file_path),
+            "complete": False
+        }
+        
+        def tracked_units():
+            """
+            @brief 逐个产出单元，读取出错时记录日志并结束，不中断整个构建
+            
+            @return Iterator[tuple]: (文本, 单元元数据)生成器
+            """
+            count = 0
+            try:
+                for unit in units:
+                    count += 1
+                    yield unit
+            except Exception as e:
+                logger.error(f"Error streaming {file_path}: {str(e)}")
+                return
+            if count:
+                document["complete"] = True
+            else:
+                logger.warning(f"No content streamed from {file_path.name}")
+        
+        document["units"] = tracked_units()
+        logger.info(f"Streaming document: {file_path.name}")
+        return document
+    
+    @staticmethod
+    def _iter_pdf_pages(file_path):
+        """
+        @brief 逐页读取PDF文本，每次只持有一页内容
+        
+        @param file_path (Path): PDF文件路径
+        
+        @return Iterator[tuple]: (页面文本, {"page": 页码})生成器，页码从1开始；读取出错时抛出异常
+        """
+        with open(file_path, 'rb') as f:
+            pdf_reader = PyPDF2.PdfReader(f)
+            for page_number, page in enumerate(pdf_reader.pages, 1):
+                text = page.extract_text()
+                if text and text.strip():
+                    yield text, {"page": page_number}
+    
+    @staticmethod
+    def _iter_csv_rows(file_path, rows_per_unit):
+        """
+        @brief 逐行读取CSV，每rows_per_unit行组成一个单元，每行以"列名: 值"的形式展开
+        
+        @param file_path (Path): CSV文件路径
+        @param rows_per_unit (int): 每个单元包含的数据行数
+        
+        @return Iterator[tuple]: (单元文本, {"rows": "起始行-结束行"})生成器，行号从1开始且不含表头；
+                                 读取出错时抛出异常
+        """
+        with open(file_path, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if not header:
+                return
+            lines = []
+            first_row = 1
+            for row_number, row in enumerate(reader, 1):
+                if not any(cell.strip() for cell in row):
+                    continue
+                lines.append(DocumentLoader._format_csv_row(header, row))
+                if len(lines) >= rows_per_unit:
+                    yield "\n".join(lines), {"rows": f"{first_row}-{row_number}"}
+                    lines = []
+                    first_row = row_number + 1
+            if lines:
+                yield "\n".join(lines), {"rows": f"{first_row}-{row_number}"}
+    
+    @staticmethod
+    def _format_csv_row(header, row):
+        """
+        @brief 将一行CSV展开为"列名: 值"的单行文本；超出表头宽度的单元格以列序号命名，
+               单元格内的换行折叠为空格，保证每行数据只占一行
+        
+        @param header (list): 表头
+        @param row (list): 数据行
+        
+        @return str: 以"; "连接的单元格文本，空单元格被跳过
+        """
+        names = header + [f"column_{index}" for index in range(len(header) + 1, len(row) + 1)]
+        cells = []
+        for name, value in zip(names, row):
+            value = " ".join(value.split())
+            if value:
+                cells.append(f"{name}: {value}" if name.strip() else value)
+        return "; ".join(cells)
+    
+    @staticmethod
+    def _iter_pptx_slides(file_path):
+        """
+        @brief 逐张幻灯片提取文本框与表格中的文字
+        
+        @param file_path (Path): PPTX文件路径
+        
+        @return Iterator[tuple]: (幻灯片文本, {"slide": 序号})生成器，序号从1开始
+        """
+        from pptx import Presentation
+        
+        presentation = Presentation(file_path)
+        for slide_number, slide in enumerate(presentation.slides, 1):
+            texts = []
+            for shape in slide.shapes:
+                if shape.has_text_frame:
+                    texts.append(shape.text_frame.text)
+                elif getattr(shape, "has_table", False) and shape.has_table:
+                    for row in shape.table.rows:
+                        texts.append(" | ".join(cell.text for cell in row.cells))
+            text = "\n".join(t for t in texts if t.strip())
+            if text:
+                yield text, {"slide": slide_number}
+    
     def add_document(self, file_path):
         """
         @brief 将指定的文档文件复制到文档存储目录中
@@ -101,4 +308,50 @@ class DocumentLoader:
             return str(dest_path)
         except Exception as e:
             logger.error(f"Failed to add document: {str(e)}")
-            return None
\ No newline at end of file
+            return None
+
+
+def _load_file(file_path, csv_rows_per_unit=50):
+    """
+    @brief 根据文件扩展名识别文件类型并使用相应方法加载文件内容
+    
+    @param file_path (Path): 需要加载的文件路径对象
+    @param csv_rows_per_unit (int): CSV每个单元包含的数据行数
+    
+    @return str | list: 文件内容字符串，分页文件返回(文本, 单元元数据)列表，加载失败时返回None
+    """
+    ext = file_path.suffix.lower()
+    
+    try:
+        if ext == ".txt":
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return f.read()
+        
+        elif ext == ".pdf":
+            return list(DocumentLoader._iter_pdf_pages(file_path))
+        
+        elif ext == ".json":  
+            with open(file_path, 'r', encoding='utf-8') as f:
+                import json
+                data = json.load(f)
+                return str(data)  
+        elif ext == ".docx":
+            doc = Document(file_path)
+            return "\n".join([para.text for para in doc.paragraphs])
+        
+        elif ext == ".md":
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return markdown.markdown(f.read())
+        
+        elif ext == ".pptx":
+            return list(DocumentLoader._iter_pptx_slides(file_path))
+        
+        elif ext == ".csv":
+            return list(DocumentLoader._iter_csv_rows(file_path, csv_rows_per_unit))
+        
+        else:
+            logger.warning(f"Unsupported file type: {ext}")
+            return None
+    except Exception as e:
+        logger.error(f"Error loading {file_path}: {str(e)}")
+        return None
@@ -1,14 +1,42 @@
 import requests
+from requests.adapters import HTTPAdapter
 import numpy as np
-from typing import List
-from config import RAG_CONFIG
+from typing import List, Optional
+from config import RAG_CONFIG, SERVICE_CONFIG
+from .cache import get_embedding_cache
+from .async_http import get_async_client, track_upstream
+import asyncio
 import logging
+import threading
 import time
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    """
+    @brief 获取进程内共享的HTTP会话，复用到Ollama的TCP连接
+    
+    @return requests.Session: 带连接池的会话对象
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                pool_size = RAG_CONFIG["embeddings"].get("pool_size", 8)
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
 class EmbeddingModel:
     def __init__(self):
         """
@@ -18,7 +46,13 @@ class EmbeddingModel:
         self.model_type = config["model_type"]
         self.model_name = config["model_name"]
         self.dim = config.get("dim", 384)
-        self.api_url = "http://localhost:11434/api/embeddings"
+        self.batch_size = max(1, config.get("batch_size", 32))
+        self.ollama_host = SERVICE_CONFIG["ollama_host"]
+        self.api_url = f"{self.ollama_host}/api/embeddings"
+        self.batch_api_url = f"{self.ollama_host}/api/embed"
+        self.timeout = SERVICE_CONFIG["embedding_timeout"]
+        self.session = _get_session()
+        self.cache = get_embedding_cache()
     
     def embed_texts(self, texts: List[str]) -> List[List[float]]:
         """
@@ -30,7 +64,79 @@ class EmbeddingModel:
         """
         if not texts:
             return []
-            
+        
+        embeddings, missing = self._lookup_cache(texts)
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            self._store_cache(embeddings, missing, missing_texts, self._embed_uncached(missing_texts))
+        return embeddings
+    
+    async def aembed_texts(self, texts: List[str]) -> List[List[float]]:
+        """
+        @brief embed_texts的异步版本，通过共享的异步HTTP客户端请求Ollama，不阻塞事件循环
+        
+        @param texts (List[str]): 需要转换为向量的文本列表
+        
+        @return List[List[float]]: 对应的向量表示列表
+        """
+        if not texts:
+            return []
+        
+        # 缓存读写是同步的SQLite操作，放到线程中执行
+        embeddings, missing = await asyncio.to_thread(self._lookup_cache, texts)
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            if self.model_type == "ollama":
+                computed = await self._aembed_with_ollama(missing_texts)
+            else:
+                computed = await asyncio.to_thread(self._embed_uncached, missing_texts)
+            await asyncio.to_thread(self._store_cache, embeddings, missing, missing_texts, computed)
+        return embeddings
+    
+    def _lookup_cache(self, texts: List[str]):
+        """
+        @brief 从缓存读取已有向量，空白文本不参与缓存
+        
+        @param texts (List[str]): 文本列表
+        
+        @return tuple: (与输入对应的向量列表（未命中为空列表）, 需要生成嵌入的下标列表)
+        """
+        if self.cache is None:
+            return [[] for _ in texts], list(range(len(texts)))
+        
+        embeddings = [[] for _ in texts]
+        keyed = [i for i, text in enumerate(texts) if text and text.strip()]
+        cached = self.cache.get_embeddings(self.model_name, self.dim, [texts[i] for i in keyed])
+        missing = []
+        for i, emb in zip(keyed, cached):
+            if emb is None:
+                missing.append(i)
+            else:
+                embeddings[i] = emb
+        return embeddings, missing
+    
+    def _store_cache(self, embeddings: list, missing: List[int], missing_texts: List[str], computed: list):
+        """
+        @brief 将新生成的向量填回结果并写入缓存
+        
+        @param embeddings (list): 结果列表
+        @param missing (List[int]): 新生成向量对应的下标
+        @param missing_texts (List[str]): 新生成向量对应的文本
+        @param computed (list): 新生成的向量
+        """
+        if self.cache is not None:
+            self.cache.put_embeddings(self.model_name, self.dim, missing_texts, computed)
+        for i, emb in zip(missing, computed):
+            embeddings[i] = emb
+    
+    def _embed_uncached(self, texts: List[str]) -> List[List[float]]:
+        """
+        @brief 不经过缓存，直接调用配置的后端生成嵌入
+        
+        @param texts (List[str]): 需要转换为向量的文本列表
+        
+        @return List[List[float]]: 对应的向量表示列表
+        """
         if self.model_type == "ollama":
             return self._embed_with_ollama(texts)
         elif self.model_type == "huggingface":
@@ -40,55 +146,187 @@ class EmbeddingModel:
     
     def _embed_with_ollama(self, texts: List[str]) -> List[List[float]]:
         """
-        @brief 通过HTTP请求调用Ollama的嵌入API，将文本转换为向量表示，并包含重试机制
+        @brief 按batch_size分批调用Ollama的多输入嵌入API，批次中失败的文本再逐条重试
         
         @param texts (List[str]): 需要生成嵌入的文本列表
         
-        @return List[List[float]]: 文本对应的向量表示列表
+        @return List[List[float]]: 文本对应的向量表示列表，顺序与输入一致，失败项为空列表
         """
-        embeddings = []
-        for text in texts:
-            if not text.strip():
-                embeddings.append([])
-                continue
-                
-            for attempt in range(3):  
-                try:
-                    response = requests.post(
+        embeddings = [[] for _ in texts]
+        pending = [i for i, text in enumerate(texts) if text and text.strip()]
+        
+        for start in range(0, len(pending), self.batch_size):
+            batch_indices = pending[start:start + self.batch_size]
+            batch_embeddings = self._embed_batch([texts[i] for i in batch_indices])
+            
+            for i, embedding in zip(batch_indices, batch_embeddings):
+                if embedding is None:
+                    embedding = self._embed_single(texts[i])
+                embeddings[i] = embedding
+        return embeddings
+    
+    async def _aembed_with_ollama(self, texts: List[str]) -> List[List[float]]:
+        """
+        @brief _embed_with_ollama的异步版本
+        
+        @param texts (List[str]): 需要生成嵌入的文本列表
+        
+        @return List[List[float]]: 文本对应的向量表示列表，顺序与输入一致，失败项为空列表
+        """
+        embeddings = [[] for _ in texts]
+        pending = [i for i, text in enumerate(texts) if text and text.strip()]
+        
+        for start in range(0, len(pending), self.batch_size):
+            batch_indices = pending[start:start + self.batch_size]
+            batch_embeddings = await self._aembed_batch([texts[i] for i in batch_indices])
+            
+            for i, embedding in zip(batch_indices, batch_embeddings):
+                if embedding is None:
+                    embedding = await self._aembed_single(texts[i])
+                embeddings[i] = embedding
+        return embeddings
+    
+    def _embed_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        @brief 通过一次/api/embed请求为一批文本生成嵌入
+        
+        @param texts (List[str]): 同一批次的非空文本列表
+        
+        @return List[Optional[List[float]]]: 与输入对应的向量列表，未成功的项为None
+        """
+        try:
+            response = self.session.post(
+                self.batch_api_url,
+                json={
+                    "model": self.model_name,
+                    "input": texts
+                },
+                timeout=self.timeout
+            )
+            return self._parse_batch_response(response, len(texts))
+        except Exception as e:
+            logger.warning(f"Ollama batch embedding error: {str(e)}")
+        return [None] * len(texts)
+    
+    async def _aembed_batch(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        @brief _embed_batch的异步版本
+        
+        @param texts (List[str]): 同一批次的非空文本列表
+        
+        @return List[Optional[List[float]]]: 与输入对应的向量列表，未成功的项为None
+        """
+        try:
+            async with track_upstream("embed"):
+                response = await get_async_client().post(
+                    self.batch_api_url,
+                    json={
+                        "model": self.model_name,
+                        "input": texts
+                    },
+                    timeout=self.timeout
+                )
+            return self._parse_batch_response(response, len(texts))
+        except Exception as e:
+            logger.warning(f"Ollama batch embedding error: {str(e)}")
+        return [None] * len(texts)
+    
+    def _parse_batch_response(self, response, count: int) -> List[Optional[List[float]]]:
+        """
+        @brief 解析/api/embed的响应
+        
+        @param response (requests.Response | httpx.Response): HTTP响应
+        @param count (int): 请求中的文本数量
+        
+        @return List[Optional[List[float]]]: 与输入对应的向量列表，未成功的项为None
+        """
+        if response.status_code == 200:
+            data = response.json().get("embeddings") or []
+            if len(data) == count:
+                return [emb if emb and len(emb) == self.dim else None for emb in data]
+            logger.warning(f"Batch embedding count mismatch: expected {count}, got {len(data)}")
+        else:
+            logger.warning(f"Batch embedding failed: {response.status_code} - {response.text}")
+        return [None] * count
+    
+    def _embed_single(self, text: str) -> List[float]:
+        """
+        @brief 通过/api/embeddings为单条文本生成嵌入，并包含重试机制
+        
+        @param text (str): 需要生成嵌入的文本
+        
+        @return List[float]: 文本的向量表示，失败时返回空列表
+        """
+        for attempt in range(3):  
+            try:
+                response = self.session.post(
+                    self.api_url,
+                    json={
+                        "model": self.model_name,
+                        "prompt": text
+                    },
+                    timeout=self.timeout
+                )
+                embedding = self._parse_single_response(response, text)
+                if embedding is not None:
+                    return embedding
+            except Exception as e:
+                logger.error(f"Ollama embedding error: {str(e)}")
+        
+        logger.error(f"Failed to generate embedding after 3 attempts for text: {text[:50]}...")
+        return []
+    
+    async def _aembed_single(self, text: str) -> List[float]:
+        """
+        @brief _embed_single的异步版本
+        
+        @param text (str): 需要生成嵌入的文本
+        
+        @return List[float]: 文本的向量表示，失败时返回空列表
+        """
+        for attempt in range(3):  
+            try:
+                async with track_upstream("embed"):
+                    response = await get_async_client().post(
                         self.api_url,
                         json={
                             "model": self.model_name,
                             "prompt": text
                         },
-                        timeout=30
+                        timeout=self.timeout
                     )
-                    
-                    if response.status_code == 200:
-                        data = response.json()
-                        if "embedding" in data and data["embedding"]:
-                            embedding = data["embedding"]
-                            
-                            if len(embedding) == self.dim:
-                                embeddings.append(embedding)
-                                break
-                            else:
-                                logger.warning(f"Embedding dimension mismatch: expected {self.dim}, got {len(embedding)}")
-                                embeddings.append([])
-                                break
-                        else:
-                            logger.warning(f"Empty embedding for text: {text[:50]}...")
-                    else:
-                        logger.error(f"Error embedding text: {response.status_code} - {response.text}")
-                    
-                   
-                    if attempt == 2:
-                        logger.error(f"Failed to generate embedding after 3 attempts for text: {text[:50]}...")
-                        embeddings.append([])
-                except Exception as e:
-                    logger.error(f"Ollama embedding error: {str(e)}")
-                    if attempt == 2:
-                        embeddings.append([])
-        return embeddings
+                embedding = self._parse_single_response(response, text)
+                if embedding is not None:
+                    return embedding
+            except Exception as e:
+                logger.error(f"Ollama embedding error: {str(e)}")
+        
+        logger.error(f"Failed to generate embedding after 3 attempts for text: {text[:50]}...")
+        return []
+    
+    def _parse_single_response(self, response, text: str) -> Optional[List[float]]:
+        """
+        @brief 解析/api/embeddings的响应
+        
+        @param response (requests.Response | httpx.Response): HTTP响应
+        @param text (str): 请求的文本，用于日志
+        
+        @return Optional[List[float]]: 向量；维度不符时返回空列表（不再重试）；其他失败返回None（需要重试）
+        """
+        if response.status_code == 200:
+            data = response.json()
+            if "embedding" in data and data["embedding"]:
+                embedding = data["embedding"]
+                
+                if len(embedding) == self.dim:
+                    return embedding
+                logger.warning(f"Embedding dimension mismatch: expected {self.dim}, got {len(embedding)}")
+                return []
+            else:
+                logger.warning(f"Empty embedding for text: {text[:50]}...")
+        else:
+            logger.error(f"Error embedding text: {response.status_code} - {response.text}")
+        return None
     
     def _embed_with_huggingface(self, texts: List[str]) -> List[List[float]]:
         """
@@ -98,4 +336,4 @@ class EmbeddingModel:
         
         @return List[List[float]]: 空向量列表，每个元素都是空列表
         """
-        return [[] for _ in texts]
\ No newline at end of file
+        return [[] for _ in texts]
@@ -0,0 +1,710 @@
+import logging
+import os
+import struct
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+from annoy import AnnoyIndex
+
+from config import RAG_CONFIG
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class IndexBackend:
+    """
+    @brief 向量索引后端接口：追加归一化向量、构建、按余弦相似度检索、保存与加载
+    """
+    
+    name = ""
+    suffix = ""
+    
+    def __init__(self, dim: int):
+        """
+        @brief 初始化空索引
+        
+        @param dim (int): 向量维度
+        """
+        self.dim = dim
+    
+    def add(self, vectors: np.ndarray):
+        """
+        @brief 在构建前追加一批归一化向量，条目ID按追加顺序从0递增
+        
+        @param vectors (np.ndarray): 形状为(n, dim)的float32矩阵
+        """
+        raise NotImplementedError
+    
+    def build(self):
+        """
+        @brief 完成索引构建，之后才能检索和保存
+        """
+        raise NotImplementedError
+    
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        @brief 检索与查询向量最相似的k个条目
+        
+        @param query (np.ndarray): 归一化的查询向量
+        @param k (int): 返回的条目数
+        
+        @return Tuple[np.ndarray, np.ndarray]: (条目ID, 余弦相似度)，按相似度降序
+        """
+        raise NotImplementedError
+    
+    def search_batch(self, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        @brief 批量检索，默认逐条调用search，可以矩阵运算的后端应重写
+        
+        @param queries (np.ndarray): 形状为(q, dim)的归一化查询矩阵
+        @param k (int): 每个查询返回的条目数
+        
+        @return List[Tuple[np.ndarray, np.ndarray]]: 与查询一一对应的(条目ID, 余弦相似度)
+        """
+        return [self.search(query, k) for query in queries]
+    
+    def get_vector(self, idx: int) -> np.ndarray:
+        """
+        @brief 取出条目的向量
+        
+        @param idx (int): 条目ID
+        
+        @return np.ndarray: 向量
+        """
+        raise NotImplementedError
+    
+    def get_vectors(self, rows: np.ndarray) -> np.ndarray:
+        """
+        @brief 批量取出条目的向量，默认逐条调用get_vector，向量以矩阵保存的后端应重写
+        
+        @param rows (np.ndarray): 条目ID数组
+        
+        @return np.ndarray: 形状为(len(rows), dim)的float32矩阵
+        """
+        if len(rows) == 0:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([self.get_vector(row) for row in rows]).astype(np.float32)
+    
+    def __len__(self):
+        """
+        @brief 索引中的条目数
+        
+        @return int: 条目数
+        """
+        raise NotImplementedError
+    
+    def save(self, prefix: Path):
+        """
+        @brief 保存到以prefix为前缀、suffix为后缀的文件
+        
+        @param prefix (Path): 文件路径前缀（不含后缀）
+        """
+        raise NotImplementedError
+    
+    def load(self, prefix: Path):
+        """
+        @brief 从以prefix为前缀的文件加载
+        
+        @param prefix (Path): 文件路径前缀（不含后缀）
+        """
+        raise NotImplementedError
+    
+    @classmethod
+    def path_for(cls, prefix: Path) -> Path:
+        """
+        @brief 获取该后端在给定前缀下的文件路径
+        
+        @param prefix (Path): 文件路径前缀
+        
+        @return Path: 索引文件路径
+        """
+        return Path(f"{prefix}{cls.suffix}")
+
+
+class AnnoyBackend(IndexBackend):
+    """
+    @brief 基于Annoy的近似最近邻索引，适合大规模语料
+    """
+    
+    name = "annoy"
+    suffix = ".ann"
+    
+    def __init__(self, dim: int):
+        """
+        @brief 初始化空的Annoy索引
+        
+        @param dim (int): 向量维度
+        """
+        super().__init__(dim)
+        config = RAG_CONFIG["vector_store"]
+        self.n_trees = config.get("build_trees", 10)
+        self.search_k = config.get("annoy_search_k", -1)
+        self.index = AnnoyIndex(dim, "angular")
+        self._count = 0
+    
+    def add(self, vectors):
+        """
+        @brief 逐条加入Annoy索引，条目ID按追加顺序从0递增
+        
+        @param vectors (np.ndarray): 形状为(n, dim)的归一化向量
+        """
+        for vector in vectors:
+            self.index.add_item(self._count, vector)
+            self._count += 1
+    
+    def build(self):
+        """
+        @brief 按配置的树数量构建Annoy索引，构建后不能再追加条目
+        """
+        self.index.build(self.n_trees)
+    
+    def search(self, query, k):
+        """
+        @brief 近似检索，search_k控制检查的节点数；angular距离换算为余弦相似度
+        
+        @param query (np.ndarray): 归一化的查询向量
+        @param k (int): 返回的条目数
+        
+        @return Tuple[np.ndarray, np.ndarray]: (条目ID, 余弦相似度)，按相似度降序
+        """
+        indices, distances = self.index.get_nns_by_vector(
+            query, k, include_distances=True, search_k=self.search_k
+        )
+        # Annoy的angular距离为归一化向量间的欧氏距离，换算为余弦相似度
+        scores = 1 - np.asarray(distances, dtype=np.float32) ** 2 / 2.0
+        return np.asarray(indices, dtype=np.int64), np.clip(scores, -1.0, 1.0)
+    
+    def get_vector(self, idx):
+        """
+        @brief 从Annoy索引读取条目的向量
+        
+        @param idx (int): 条目ID
+        
+        @return np.ndarray: float32向量
+        """
+        return np.asarray(self.index.get_item_vector(int(idx)), dtype=np.float32)
+    
+    def __len__(self):
+        """
+        @brief 已加入Annoy索引的条目数
+        
+        @return int: 条目数
+        """
+        return self.index.get_n_items()
+    
+    def save(self, prefix):
+        """
+        @brief 保存为.ann文件
+        
+        @param prefix (Path): 文件路径前缀（不含后缀）
+        """
+        self.index.save(str(self.path_for(prefix)))
+    
+    def load(self, prefix):
+        """
+        @brief 以内存映射方式加载.ann文件
+        
+        @param prefix (Path): 文件路径前缀（不含后缀）
+        """
+        self.index = AnnoyIndex(self.dim, "angular")
+        self.index.load(str(self.path_for(prefix)))
+        self._count = self.index.get_n_items()
+
+
+class BruteForceBackend(IndexBackend):
+    """
+    @brief 基于内存映射矩阵的精确检索：一次BLAS矩阵向量乘加argpartition取top-k，适合中小规模语料
+    """
+    
+    name = "brute_force"
+    suffix = ".npy"
+    
+    def __init__(self, dim: int):
+        """
+        @brief 初始化空矩阵
+        
+        @param dim (int): 向量维度
+        """
+        super().__init__(dim)
+        self._pending = []
+        self.matrix = np.zeros((0, dim), dtype=np.float32)
+    
+    def add(self, vectors):
+        """
+        @brief 暂存一批向量，build时合并到矩阵中
+        
+        @param vectors (np.ndarray): 形状为(n, dim)的归一化向量
+        """
+        self._pending.append(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+    
+    def build(self):
+        """
+        @brief 把暂存的向量拼接到矩阵末尾
+        """
+        if self._pending:
+            self.matrix = np.concatenate([self.matrix] + self._pending)
+            self._pending = []
+    
+    def search(self, query, k):
+        """
+        @brief 精确检索：一次矩阵向量乘得到全部分数，argpartition取top-k后排序
+        
+        @param query (np.ndarray): 归一化的查询向量
+        @param k (int): 返回的条目数
+        
+        @return Tuple[np.ndarray, np.ndarray]: (条目ID, 余弦相似度)，按相似度降序
+        """
+        count = len(self.matrix)
+        k = min(k, count)
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        scores = self.matrix @ np.asarray(query, dtype=np.float32)
+        if k < count:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(count)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return top.astype(np.int64), np.clip(scores[top], -1.0, 1.0)
+    
+    def search_batch(self, queries, k):
+        """
+        @brief 批量精确检索：一次矩阵乘法得到所有查询的分数，再逐行取top-k
+        
+        @param queries (np.ndarray): 形状为(q, dim)的归一化查询矩阵
+        @param k (int): 每个查询返回的条目数
+        
+        @return List[Tuple[np.ndarray, np.ndarray]]: 与查询一一对应的(条目ID, 余弦相似度)
+        """
+        count = len(self.matrix)
+        k = min(k, count)
+        if k <= 0:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in queries]
+        # 一次矩阵乘法得到所有查询的分数，按行取top-k
+        scores = np.asarray(queries, dtype=np.float32) @ self.matrix.T
+        if k < count:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(count), scores.shape)
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1).astype(np.int64)
+        top_scores = np.clip(np.take_along_axis(top_scores, order, axis=1), -1.0, 1.0)
+        return list(zip(top, top_scores))
+    
+    def get_vector(self, idx):
+        """
+        @brief 从矩阵中复制出条目的向量
+        
+        @param idx (int): 条目ID
+        
+        @return np.ndarray: float32向量
+        """
+        return np.array(self.matrix[int(idx)], dtype=np.float32)
+    
+    def get_vectors(self, rows):
+        """
+        @brief 按行号整体切片取出向量
+        
+        @param rows (np.ndarray): 条目ID数组
+        
+        @return np.ndarray: 形状为(len(rows), dim)的float32矩阵
+        """
+        return np.asarray(self.matrix[np.asarray(rows, dtype=np.int64)], dtype=np.float32).reshape(-1, self.dim)
+    
+    def __len__(self):
+        """
+        @brief 矩阵行数，不含尚未build的暂存向量
+        
+        @return int: 条目数
+        """
+        return len(self.matrix)
+    
+    def save(self, prefix):
+        """
+        @brief 先写临时文件再原子替换保存.npy矩阵，保存后改为内存映射读取
+        
+        @param prefix (Path): 文件路径前缀（不含后缀）
+        """
+        path = self.path_for(prefix)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.asarray(self.matrix, dtype=np.float32))
+        os.replace(tmp_path, path)
+        self.matrix = np.load(path, mmap_mode='r')
+    
+    def load(self, prefix):
+        """
+        @brief 以只读内存映射方式加载.npy矩阵
+        
+        @param prefix (Path): 文件路径前缀（不含后缀）
+        """
+        self.matrix = np.load(self.path_for(prefix), mmap_mode='r')
+
+
+def _kmeans(data: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    @brief 欧氏距离k-means（Lloyd迭代），空簇以随机样本重新初始化
+    
+    @param data (np.ndarray): 形状为(n, d)的float32训练数据
+    @param k (int): 簇数量
+    @param iterations (int): 迭代次数
+    @param rng (np.random.Generator): 随机数生成器
+    
+    @return np.ndarray: 形状为(k, d)的簇中心
+    """
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _assign(data, centroids)
+        counts = np.bincount(assignments, minlength=k)
+        nonempty = np.flatnonzero(counts)
+        starts = (np.cumsum(counts) - counts)[nonempty]
+        sums = np.add.reduceat(data[np.argsort(assignments, kind="stable")], starts, axis=0)
+        centroids[nonempty] = sums / counts[nonempty, None]
+        empty = counts == 0
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+    return centroids
+
+
+def _assign(data: np.ndarray, centroids: np.ndarray, batch_size: int = 4096) -> np.ndarray:
+    """
+    @brief 分批计算每个向量最近的簇中心，避免一次性生成(n, k)距离矩阵
+    
+    @param data (np.ndarray): 形状为(n, d)的向量
+    @param centroids (np.ndarray): 形状为(k, d)的簇中心
+    @param batch_size (int): 每批向量数
+    
+    @return np.ndarray: 每个向量所属簇的下标
+    """
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    assignments = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), batch_size):
+        batch = np.asarray(data[start:start + batch_size], dtype=np.float32)
+        distances = centroid_norms[None, :] - 2.0 * (batch @ centroids.T)
+        assignments[start:start + batch_size] = np.argmin(distances, axis=1)
+    return assignments
+
+
+class IVFPQBackend(IndexBackend):
+    """
+    @brief 纯NumPy实现的IVF-PQ索引：k-means粗量化器划分倒排列表，残差按乘积量化编码；
+           检索时只扫描nprobe个列表的编码，再用原始向量对候选精确重排。
+           所有数组保存在同一个文件中并以内存映射方式读取，适合超出内存的语料
+    """
+    
+    name = "ivf_pq"
+    suffix = ".ivfpq"
+    
+    MAGIC = b"RAGIVFPQ"
+    # 魔数、维度、倒排列表数、子量化器数、每个子量化器的码字数、条目数，随后是6个数组的文件偏移
+    HEADER = struct.Struct("<8sIIIIQ6Q")
+    ALIGNMENT = 64
+    
+    def __init__(self, dim: int):
+        """
+        @brief 初始化空索引，训练与检索参数取自配置
+        
+        @param dim (int): 向量维度
+        """
+        super().__init__(dim)
+        config = RAG_CONFIG["vector_store"]
+        self.nlist = config.get("ivf_nlist", 0)
+        self.nprobe = config.get("ivf_nprobe", 16)
+        self.m = config.get("pq_m", 48)
+        self.rerank_factor = config.get("ivf_rerank_factor", 10)
+        self.train_size = config.get("ivf_train_size", 100000)
+        self.kmeans_iterations = config.get("ivf_kmeans_iterations", 15)
+        if dim % self.m:
+            raise ValueError(f"pq_m={self.m} must divide the vector dimension {dim}")
+        self._pending = []
+        self.centroids = None
+        self.codebooks = None
+        self.list_offsets = None
+        self.ids = None
+        self.codes = None
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+    
+    def add(self, vectors):
+        """
+        @brief 暂存一批向量，build时统一训练和编码
+        
+        @param vectors (np.ndarray): 形状为(n, dim)的归一化向量
+        """
+        self._pending.append(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+    
+    def build(self):
+        """
+        @brief 在（采样的）向量上训练粗量化器与各子空间的残差码本，为全部向量编码并按倒排列表排序
+        """
+        vectors = np.concatenate([np.asarray(self.vectors)] + self._pending)
+        self._pending = []
+        count = len(vectors)
+        if count == 0:
+            raise ValueError("Cannot build an IVF-PQ index without vectors")
+        
+        rng = np.random.default_rng(0)
+        sample = vectors
+        if count > self.train_size:
+            sample = vectors[np.sort(rng.choice(count, self.train_size, replace=False))]
+        
+        # 未配置列表数时取4*sqrt(n)，是IVF索引常用的经验值
+        nlist = self.nlist or int(4 * np.sqrt(count))
+        nlist = max(1, min(nlist, len(sample)))
+        centroids = _kmeans(sample, nlist, self.kmeans_iterations, rng)
+        
+        # 子空间按残差训练码本，每个码字用一个字节编码；每个码字有64个训练样本已足够
+        dsub = self.dim // self.m
+        ksub = min(256, len(sample))
+        pq_sample = sample[:64 * ksub]
+        residuals = pq_sample - centroids[_assign(pq_sample, centroids)]
+        codebooks = np.stack([
+            _kmeans(np.ascontiguousarray(residuals[:, j * dsub:(j + 1) * dsub]), ksub, self.kmeans_iterations, rng)
+            for j in range(self.m)
+        ])
+        
+        assignments = _assign(vectors, centroids)
+        codes = np.empty((count, self.m), dtype=np.uint8)
+        for start in range(0, count, 65536):
+            batch = vectors[start:start + 65536] - centroids[assignments[start:start + 65536]]
+            for j in range(self.m):
+                codes[start:start + 65536, j] = _assign(batch[:, j * dsub:(j + 1) * dsub], codebooks[j])
+        
+        order = np.argsort(assignments, kind="stable")
+        self.centroids = centroids.astype(np.float32)
+        self.codebooks = codebooks.astype(np.float32)
+        self.list_offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=nlist))]).astype(np.int64)
+        self.ids = order.astype(np.int64)
+        self.codes = codes[order]
+        self.vectors = vectors
+    
+    def search(self, query, k):
+        """
+        @brief 扫描与查询最接近的nprobe个倒排列表，查表求近似内积，
+               取k*rerank_factor个候选用原始向量精确重排
+        
+        @param query (np.ndarray): 归一化的查询向量
+        @param k (int): 返回的条目数
+        
+        @return Tuple[np.ndarray, np.ndarray]: (条目ID, 余弦相似度)，按相似度降序
+        """
+        count = len(self)
+        k = min(k, count)
+        if k <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        query = np.asarray(query, dtype=np.float32)
+        
+        coarse = self.centroids @ query
+        nprobe = min(self.nprobe, len(coarse))
+        probes = np.argpartition(-coarse, nprobe - 1)[:nprobe]
+        starts = self.list_offsets[probes]
+        ends = self.list_offsets[probes + 1]
+        positions = np.concatenate([np.arange(s, e) for s, e in zip(starts, ends)])
+        if len(positions) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        
+        # 内积对残差可加：q·x ≈ q·c + Σ q_j·codebook_j[code_j]，查表后按行求和
+        dsub = self.dim // self.m
+        table = np.einsum('jd,jkd->jk', query.reshape(self.m, dsub), self.codebooks)
+        codes = np.asarray(self.codes[positions])
+        approx = np.repeat(coarse[probes], ends - starts) + table[np.arange(self.m), codes].sum(axis=1)
+        
+        shortlist_size = min(len(positions), k * self.rerank_factor)
+        if shortlist_size < len(positions):
+            shortlist = np.argpartition(-approx, shortlist_size - 1)[:shortlist_size]
+        else:
+            shortlist = np.arange(len(positions))
+        candidates = np.sort(self.ids[positions[shortlist]])
+        
+        scores = np.asarray(self.vectors[candidates]) @ query
+        top = np.argsort(-scores, kind="stable")[:k]
+        return candidates[top].astype(np.int64), np.clip(scores[top], -1.0, 1.0)
+    
+    def get_vector(self, idx):
+        """
+        @brief 读取条目的原始向量
+        
+        @param idx (int): 条目ID
+        
+        @return np.ndarray: float32向量
+        """
+        return np.array(self.vectors[int(idx)], dtype=np.float32)
+    
+    def get_vectors(self, rows):
+        """
+        @brief 按行号整体切片取出原始向量
+        
+        @param rows (np.ndarray): 条目ID数组
+        
+        @return np.ndarray: 形状为(len(rows), dim)的float32矩阵
+        """
+        return np.asarray(self.vectors[np.asarray(rows, dtype=np.int64)], dtype=np.float32).reshape(-1, self.dim)
+    
+    def __len__(self):
+        """
+        @brief 已编码的条目数
+        
+        @return int: 条目数
+        """
+        return len(self.vectors)
+    
+    def _arrays(self):
+        """
+        @brief 按文件中的存放顺序列出需要保存的数组
+        
+        @return list: 粗量化中心、码本、列表偏移、条目ID、PQ编码和原始向量
+        """
+        return [self.centroids, self.codebooks, self.list_offsets, self.ids, self.codes,
+                np.asarray(self.vectors, dtype=np.float32)]
+    
+    def save(self, prefix):
+        """
+        @brief 写入文件头和按ALIGNMENT对齐的各数组，先写临时文件再原子替换，保存后以内存映射方式重新加载
+        
+        @param prefix (Path): 文件路径前缀（不含后缀）
+        """
+        path = self.path_for(prefix)
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        arrays = self._arrays()
+        
+        offsets = []
+        position = self.HEADER.size
+        for array in arrays:
+            position = -(-position // self.ALIGNMENT) * self.ALIGNMENT
+            offsets.append(position)
+            position += array.nbytes
+        
+        with open(tmp_path, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.dim, len(self.centroids), self.m,
+                                     self.codebooks.shape[1], len(self.ids), *offsets))
+            for offset, array in zip(offsets, arrays):
+                f.write(b"\0" * (offset - f.tell()))
+                f.write(np.ascontiguousarray(array).tobytes())
+        os.replace(tmp_path, path)
+        self.load(prefix)
+    
+    def load(self, prefix):
+        """
+        @brief 校验文件头后以内存映射方式加载各数组，粗量化器、码本和列表偏移读入内存
+        
+        @param prefix (Path): 文件路径前缀（不含后缀）
+        """
+        path = self.path_for(prefix)
+        with open(path, 'rb') as f:
+            header = f.read(self.HEADER.size)
+        magic, dim, nlist, m, ksub, count, *offsets = self.HEADER.unpack(header)
+        if magic != self.MAGIC:
+            raise ValueError(f"Not an IVF-PQ index file: {path}")
+        if dim != self.dim:
+            raise ValueError(f"Index dimension {dim} does not match configured dimension {self.dim}")
+        
+        self.m = m
+        layouts = [
+            (np.float32, (nlist, dim)),
+            (np.float32, (m, ksub, dim // m)),
+            (np.int64, (nlist + 1,)),
+            (np.int64, (count,)),
+            (np.uint8, (count, m)),
+            (np.float32, (count, dim))
+        ]
+        (self.centroids, self.codebooks, self.list_offsets,
+         self.ids, self.codes, self.vectors) = [
+            np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+            for (dtype, shape), offset in zip(layouts, offsets)
+        ]
+        # 粗量化器、码本和列表偏移很小且每次查询都会用到，常驻内存
+        self.centroids = np.array(self.centroids)
+        self.codebooks = np.array(self.codebooks)
+        self.list_offsets = np.array(self.list_offsets)
+
+
+BACKENDS = {
+    AnnoyBackend.name: AnnoyBackend,
+    BruteForceBackend.name: BruteForceBackend,
+    IVFPQBackend.name: IVFPQBackend
+}
+
+
+# auto模式下使用IVF-PQ的最小条目数：码本需要每个码字约64个训练样本，更小的语料召回率明显下降，
+# 即使配置的ivf_pq_min_items更小也不会选择IVF-PQ
+IVF_PQ_MIN_AUTO_ITEMS = 64 * 256
+
+
+def select_backend_type(count: int) -> str:
+    """
+    @brief 根据配置与语料规模选择后端；type为auto时，小规模用精确的暴力检索，
+           中等规模用Annoy，超大规模用内存映射的IVF-PQ（不少于IVF_PQ_MIN_AUTO_ITEMS条）
+    
+    @param count (int): 索引条目数
+    
+    @return str: 后端名称
+    """
+    config = RAG_CONFIG["vector_store"]
+    store_type = config.get("type", "auto")
+    if store_type == "auto":
+        if count <= config.get("brute_force_max_items", 50000):
+            return BruteForceBackend.name
+        if count < max(config.get("ivf_pq_min_items", 1000000), IVF_PQ_MIN_AUTO_ITEMS):
+            return AnnoyBackend.name
+        return IVFPQBackend.name
+    if store_type not in BACKENDS:
+        raise ValueError(f"Unsupported vector store type: {store_type}")
+    return store_type
+
+
+def create_backend(name: str, dim: int) -> IndexBackend:
+    """
+    @brief 按名称创建空的后端实例
+    
+    @param name (str): 后端名称
+    @param dim (int): 向量维度
+    
+    @return IndexBackend: 后端实例
+    """
+    return BACKENDS[name](dim)
+
+
+def find_backend(prefix: Path) -> Optional[type]:
+    """
+    @brief 根据磁盘上存在的索引文件判断前缀对应的后端类型
+    
+    @param prefix (Path): 文件路径前缀
+    
+    @return Optional[type]: 后端类，不存在索引文件时返回None
+    """
+    for backend_cls in BACKENDS.values():
+        if backend_cls.path_for(prefix).exists():
+            return backend_cls
+    return None
+
+
+def load_backend(prefix: Path, dim: int) -> Optional[IndexBackend]:
+    """
+    @brief 加载前缀对应的已保存索引
+    
+    @param prefix (Path): 文件路径前缀
+    @param dim (int): 向量维度
+    
+    @return Optional[IndexBackend]: 后端实例，不存在时返回None
+    """
+    backend_cls = find_backend(prefix)
+    if backend_cls is None:
+        return None
+    backend = backend_cls(dim)
+    backend.load(prefix)
+    return backend
+
+
+def remove_backend_files(prefix: Path, keep: str = None):
+    """
+    @brief 删除前缀下其他后端遗留的索引文件，避免切换后端后加载到过期索引
+    
+    @param prefix (Path): 文件路径前缀
+    @param keep (str, optional): 需要保留的后端名称
+    """
+    for name, backend_cls in BACKENDS.items():
+        path = backend_cls.path_for(prefix)
+        if name != keep and path.exists():
+            path.unlink()
@@ -0,0 +1,196 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List
+
+from config import VECTOR_STORE_DIR, RAG_CONFIG
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(file_path, block_size: int = 1024 * 1024) -> str:
+    """
+    @brief 分块读取文件并计算其SHA-256摘要
+    
+    @param file_path (str | Path): 文件路径
+    @param block_size (int): 每次读取的字节数
+    
+    @return str: 十六进制摘要字符串
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ManifestDiff:
+    """
+    @brief 文档目录与清单之间的差异：新增、修改、删除与未变化的文件
+    """
+    
+    def __init__(self):
+        """
+        @brief 初始化空差异
+        """
+        self.added: List[str] = []
+        self.modified: List[str] = []
+        self.deleted: List[str] = []
+        self.unchanged: List[str] = []
+        self.states: Dict[str, dict] = {}
+    
+    @property
+    def changed(self) -> List[str]:
+        """
+        @brief 需要重新加载的文件（新增与修改）
+        
+        @return List[str]: 文件路径列表
+        """
+        return self.added + self.modified
+    
+    @property
+    def removed_sources(self) -> List[str]:
+        """
+        @brief 旧分块需要从索引中移除的文件（修改与删除）
+        
+        @return List[str]: 文件路径列表
+        """
+        return self.modified + self.deleted
+    
+    def has_changes(self) -> bool:
+        """
+        @brief 判断是否存在需要处理的变化
+        
+        @return bool: 有变化返回True
+        """
+        return bool(self.added or self.modified or self.deleted)
+    
+    def __repr__(self):
+        """
+        @brief 各类文件数量的摘要，用于日志
+        
+        @return str: 摘要字符串
+        """
+        return (f"ManifestDiff(added={len(self.added)}, modified={len(self.modified)}, "
+                f"deleted={len(self.deleted)}, unchanged={len(self.unchanged)})")
+
+
+class DocumentManifest:
+    """
+    @brief 已入库文档的清单，记录每个文件的大小、修改时间、内容哈希和分块ID，用于增量构建
+    """
+    
+    def __init__(self, path=None):
+        """
+        @brief 加载清单文件，不存在时为空清单
+        
+        @param path (str | Path, optional): 清单文件路径，默认位于向量存储目录
+        """
+        index_name = RAG_CONFIG["vector_store"]["index_name"]
+        self.path = Path(path) if path else Path(VECTOR_STORE_DIR) / f"{index_name}_manifest.json"
+        self.entries: Dict[str, dict] = {}
+        if self.path.exists():
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f).get("documents", {})
+            except Exception as e:
+                logger.error(f"Error loading document manifest: {str(e)}")
+                self.entries = {}
+    
+    def exists(self) -> bool:
+        """
+        @brief 判断清单文件是否存在
+        
+        @return bool: 存在返回True
+        """
+        return self.path.exists()
+    
+    def _file_state(self, file_path: str) -> dict:
+        """
+        @brief 获取文件当前状态；大小与修改时间未变时沿用清单中的哈希，避免重复读取
+        
+        @param file_path (str): 文件路径
+        
+        @return dict: 包含size、mtime、sha256的状态字典
+        """
+        stat = os.stat(file_path)
+        previous = self.entries.get(file_path)
+        if previous and previous.get("size") == stat.st_size and previous.get("mtime") == stat.st_mtime:
+            sha256 = previous["sha256"]
+        else:
+            sha256 = file_sha256(file_path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256}
+    
+    def diff(self, file_paths: List[str]) -> ManifestDiff:
+        """
+        @brief 对比当前文件列表与清单，得出需要增量处理的文件
+        
+        @param file_paths (List[str]): 文档目录中当前存在的文件路径
+        
+        @return ManifestDiff: 差异结果，states中包含当前文件状态
+        """
+        result = ManifestDiff()
+        current = set()
+        for file_path in file_paths:
+            file_path = str(file_path)
+            current.add(file_path)
+            try:
+                state = self._file_state(file_path)
+            except OSError as e:
+                logger.error(f"Error reading {file_path}: {str(e)}")
+                continue
+            result.states[file_path] = state
+            
+            previous = self.entries.get(file_path)
+            if previous is None:
+                result.added.append(file_path)
+            elif previous.get("sha256") != state["sha256"] or previous.get("needs_retry"):
+                result.modified.append(file_path)
+            else:
+                result.unchanged.append(file_path)
+        
+        result.deleted = [path for path in self.entries if path not in current]
+        return result
+    
+    def update(self, file_path: str, state: dict, chunk_ids: List[str], needs_retry: bool = False):
+        """
+        @brief 记录文件入库后的状态
+        
+        @param file_path (str): 文件路径
+        @param state (dict): diff得到的文件状态
+        @param chunk_ids (List[str]): 该文件生成的分块ID
+        @param needs_retry (bool): 是否含有回退摘要或嵌入失败的分块，需要在下次构建时重新处理
+        """
+        entry = dict(state)
+        entry["chunk_ids"] = list(chunk_ids)
+        if needs_retry:
+            entry["needs_retry"] = True
+        self.entries[str(file_path)] = entry
+    
+    def remove(self, file_path: str):
+        """
+        @brief 从清单中移除文件
+        
+        @param file_path (str): 文件路径
+        """
+        self.entries.pop(str(file_path), None)
+    
+    def clear(self):
+        """
+        @brief 清空清单（全量重建时使用）
+        """
+        self.entries = {}
+    
+    def save(self):
+        """
+        @brief 先写临时文件再原子替换，避免构建中断时留下损坏的清单
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"documents": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,191 @@
+import json
+import logging
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Iterable, List
+
+import numpy as np
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 文件格式：魔数(8字节) + 条目数n(uint64) + 元数据偏移表(n+1个uint64) + 分块ID偏移表(n+1个uint64) + 数据区
+# 数据区依次存放每条元数据的紧凑JSON(UTF-8)和每个分块ID(UTF-8)，偏移量相对于数据区起点
+MAGIC = b"RAGMETA1"
+_HEADER = struct.Struct("<8sQ")
+
+
+def write_metadata(path, records: Iterable[dict], chunk_ids: List[str]):
+    """
+    @brief 以偏移表加字符串数据区的紧凑二进制格式写出元数据，先写临时文件再原子替换
+    
+    @param path (str | Path): 目标文件路径
+    @param records (Iterable[dict]): 分块元数据，与chunk_ids一一对应
+    @param chunk_ids (List[str]): 分块ID列表
+    """
+    path = Path(path)
+    count = len(chunk_ids)
+    record_offsets = np.zeros(count + 1, dtype="<u8")
+    id_offsets = np.zeros(count + 1, dtype="<u8")
+    data_start = _HEADER.size + 2 * (count + 1) * 8
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    
+    try:
+        _write_file(tmp_path, data_start, records, chunk_ids, record_offsets, id_offsets)
+    except Exception:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_path, path)
+
+
+def _write_file(tmp_path, data_start, records, chunk_ids, record_offsets, id_offsets):
+    """
+    @brief 写出元数据临时文件：先写数据区并填充偏移表，最后回到文件头写入头部与偏移表
+    
+    @param tmp_path (Path): 临时文件路径
+    @param data_start (int): 数据区起点
+    @param records (Iterable[dict]): 分块元数据
+    @param chunk_ids (List[str]): 分块ID列表
+    @param record_offsets (np.ndarray): 元数据偏移表（n+1项）
+    @param id_offsets (np.ndarray): 分块ID偏移表（n+1项）
+    """
+    count = len(chunk_ids)
+    with open(tmp_path, 'wb') as f:
+        f.seek(data_start)
+        position = 0
+        written = 0
+        for i, record in enumerate(records):
+            if i >= count:
+                raise ValueError(f"Metadata count exceeds chunk id count ({count})")
+            blob = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            f.write(blob)
+            position += len(blob)
+            record_offsets[i + 1] = position
+            written += 1
+        if written != count:
+            raise ValueError(f"Metadata count ({written}) doesn't match chunk id count ({count})")
+        id_offsets[0] = position
+        for i, chunk_id in enumerate(chunk_ids):
+            blob = str(chunk_id).encode("utf-8")
+            f.write(blob)
+            position += len(blob)
+            id_offsets[i + 1] = position
+        
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, count))
+        f.write(record_offsets.tobytes())
+        f.write(id_offsets.tobytes())
+
+
+def migrate_json_metadata(json_path, bin_path) -> bool:
+    """
+    @brief 将旧版缩进JSON元数据文件转换为二进制格式，原JSON文件保持不变
+    
+    @param json_path (str | Path): 旧版JSON元数据路径
+    @param bin_path (str | Path): 二进制元数据输出路径
+    
+    @return bool: 转换成功返回True
+    """
+    try:
+        with open(json_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        write_metadata(bin_path, metadata.get("chunks", []), metadata.get("chunk_ids", []))
+        logger.info(f"Migrated metadata from {json_path} to {bin_path}")
+        return True
+    except Exception as e:
+        logger.error(f"Error migrating metadata {json_path}: {str(e)}")
+        return False
+
+
+class _LazyColumn:
+    """
+    @brief 只读的惰性序列，按下标访问时才从内存映射中解码对应条目
+    """
+    
+    def __init__(self, buffer, data_start: int, offsets: np.ndarray, decode):
+        """
+        @brief 初始化惰性序列
+        
+        @param buffer (mmap.mmap): 元数据文件的内存映射
+        @param data_start (int): 数据区起点
+        @param offsets (np.ndarray): 偏移表（n+1项）
+        @param decode (function): 将字节串解码为条目的函数
+        """
+        self._buffer = buffer
+        self._data_start = data_start
+        self._offsets = offsets
+        self._decode = decode
+    
+    def __len__(self):
+        """
+        @brief 列中的条目数
+        
+        @return int: 条目数
+        """
+        return len(self._offsets) - 1
+    
+    def __getitem__(self, index):
+        """
+        @brief 按下标或切片读取并解码条目
+        
+        @param index (int | slice): 下标，支持负数与切片
+        
+        @return Any: 解码后的条目，切片时为列表
+        """
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("metadata index out of range")
+        start = self._data_start + int(self._offsets[index])
+        end = self._data_start + int(self._offsets[index + 1])
+        return self._decode(self._buffer[start:end])
+    
+    def __iter__(self):
+        """
+        @brief 依次解码全部条目
+        
+        @return Iterator: 条目生成器
+        """
+        for i in range(len(self)):
+            yield self[i]
+
+
+class MetadataReader:
+    """
+    @brief 内存映射的二进制元数据读取器，打开文件时只读取偏移表，条目在访问时才解码
+    """
+    
+    def __init__(self, path):
+        """
+        @brief 打开二进制元数据文件
+        
+        @param path (str | Path): 元数据文件路径
+        """
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count = _HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC:
+            self._buffer.close()
+            raise ValueError(f"Invalid metadata file: {self.path}")
+        
+        table_size = (count + 1) * 8
+        record_offsets = np.frombuffer(self._buffer, dtype="<u8", count=count + 1, offset=_HEADER.size)
+        id_offsets = np.frombuffer(self._buffer, dtype="<u8", count=count + 1, offset=_HEADER.size + table_size)
+        data_start = _HEADER.size + 2 * table_size
+        
+        self.records = _LazyColumn(self._buffer, data_start, record_offsets, lambda b: json.loads(b))
+        self.chunk_ids = _LazyColumn(self._buffer, data_start, id_offsets, lambda b: b.decode("utf-8"))
+    
+    def __len__(self):
+        """
+        @brief 文件中的条目数
+        
+        @return int: 条目数
+        """
+        return len(self.chunk_ids)
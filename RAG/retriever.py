@@ -1,7 +1,10 @@
 from .embeddings import EmbeddingModel
-from .vector_store import VectorStore
+from .vector_store import VectorStore, LOCATOR_KEYS
+from .cache import get_query_embedding_cache, get_retrieval_cache, normalize_query
+from .async_http import get_async_client, track_upstream
 from config import RAG_CONFIG, SERVICE_CONFIG
 from pathlib import Path
+import asyncio
 import logging
 import json
 import requests
@@ -17,8 +20,10 @@ class Retriever:
         @brief 初始化检索器
         """
         self.embedding_model = EmbeddingModel()
+        # VectorStore在构造时已加载索引
         self.vector_store = VectorStore()
-        self.vector_store.load_index()
+        self.query_cache = get_query_embedding_cache()
+        self.result_cache = get_retrieval_cache()
         
         
         retriever_config = RAG_CONFIG["retriever"]
@@ -36,6 +41,12 @@ class Retriever:
         self.ollama_host = SERVICE_CONFIG["ollama_host"]
         self.rerank_timeout = SERVICE_CONFIG["rerank_timeout"]
     
+    def close(self):
+        """
+        @brief 释放向量存储持有的段引用；检索器被替换后调用，进行中的检索各自持有引用，不受影响
+        """
+        self.vector_store.close()
+    
     def retrieve(self, query: str, use_rerank: bool = None) -> str:
         """
         @brief 根据输入查询检索相关文档片段，可选择是否进行重排序，并返回格式化的上下文字符串
@@ -45,46 +56,49 @@ class Retriever:
         
         @return str: 格式化的上下文信息字符串
         """
+        return self.retrieve_context(query, use_rerank)[0]
+    
+    async def aretrieve(self, query: str, use_rerank: bool = None) -> str:
+        """
+        @brief retrieve的异步版本：嵌入与重排序请求走共享的异步HTTP客户端，索引检索在线程池中执行
         
-        if use_rerank is None:
-            use_rerank = self.reranker_enable or self.enable_rerank
-            
-        
-        query_embedding = self.embedding_model.embed_texts([query])
-        if not query_embedding or not query_embedding[0]:
-            logger.warning(f"Failed to generate embedding for query: '{query}'")
-            return ""
-        
-        
-        if not isinstance(query_embedding[0], list) or not all(isinstance(x, float) for x in query_embedding[0]):
-            logger.error(f"Invalid embedding format for query: '{query}'")
-            return ""
-        
+        @param query (str): 用户的查询字符串
+        @param use_rerank (bool, optional): 是否启用重排序功能，默认为None时使用配置值
         
-        results = self.vector_store.similarity_search(
-            query_embedding[0], 
-            top_k=self.top_k
-        )
+        @return str: 格式化的上下文信息字符串
+        """
+        return (await self.aretrieve_context(query, use_rerank))[0]
+    
+    def retrieve_context(self, query: str, use_rerank: bool = None) -> tuple:
+        """
+        @brief 检索并返回格式化的上下文字符串及其所用分块的ID。分块ID的有序列表标识了上下文的内容，
+               不受上下文字符串中相似度分数微小差异的影响
         
+        @param query (str): 用户的查询字符串
+        @param use_rerank (bool, optional): 是否启用重排序功能，默认为None时使用配置值
         
-        if use_rerank and results:
-            reranked_results = self._rerank_documents(query, results)
-            if reranked_results:
-                results = reranked_results
+        @return tuple: (格式化的上下文信息字符串, 按上下文顺序排列的分块ID列表)
+        """
+        context = self._retrieve_items([query], use_rerank)[0]
+        if context is None:
+            return "", []
         
         
-        context = []
-        for score, chunk_id, chunk_data in results:
-            if score >= self.score_threshold:
-                context.append({
-                    "text": chunk_data["text"],
-                    "summary": chunk_data["summary"],
-                    "source": chunk_data["source"],
-                    "score": round(score, 3)
-                })
+        return self._format_context(context), [item["chunk_id"] for item in context]
+    
+    async def aretrieve_context(self, query: str, use_rerank: bool = None) -> tuple:
+        """
+        @brief retrieve_context的异步版本
         
+        @param query (str): 用户的查询字符串
+        @param use_rerank (bool, optional): 是否启用重排序功能，默认为None时使用配置值
         
-        return self._format_context(context)
+        @return tuple: (格式化的上下文信息字符串, 按上下文顺序排列的分块ID列表)
+        """
+        context = (await self._aretrieve_items([query], use_rerank))[0]
+        if context is None:
+            return "", []
+        return self._format_context(context), [item["chunk_id"] for item in context]
     
     def retrieve_raw(self, query: str, use_rerank: bool = None) -> list:
         """
@@ -95,32 +109,274 @@ class Retriever:
         
         @return list: 包含检索结果的列表，每个元素是包含文本、摘要等信息的字典
         """
-        if use_rerank is None:
-            use_rerank = self.reranker_enable or self.enable_rerank
-        query_embedding = self.embedding_model.embed_texts([query])
-        if not query_embedding or not query_embedding[0]:
-            logger.warning(f"Failed to generate embedding for query: '{query}'")
+        return self._retrieve_items([query], use_rerank)[0] or []
+    
+    def retrieve_batch(self, queries: list, use_rerank: bool = None) -> list:
+        """
+        @brief 批量检索：所有查询在一次批处理中生成嵌入，并在索引中一起检索
+        
+        @param queries (list): 查询字符串列表
+        @param use_rerank (bool, optional): 是否启用重排序功能，默认为None时使用配置值
+        
+        @return list: 与查询一一对应的结果列表，每个元素的格式与retrieve_raw的返回值相同
+        """
+        if not queries:
             return []
-        if not isinstance(query_embedding[0], list) or not all(isinstance(x, float) for x in query_embedding[0]):
-            logger.error(f"Invalid embedding format for query: '{query}'")
+        return [context or [] for context in self._retrieve_items(list(queries), use_rerank)]
+    
+    async def aretrieve_batch(self, queries: list, use_rerank: bool = None) -> list:
+        """
+        @brief retrieve_batch的异步版本，各查询的重排序请求并发执行
+        
+        @param queries (list): 查询字符串列表
+        @param use_rerank (bool, optional): 是否启用重排序功能，默认为None时使用配置值
+        
+        @return list: 与查询一一对应的结果列表，每个元素的格式与retrieve_raw的返回值相同
+        """
+        if not queries:
             return []
-        results = self.vector_store.similarity_search(
-            query_embedding[0],
-            top_k=self.top_k
+        return [context or [] for context in await self._aretrieve_items(list(queries), use_rerank)]
+    
+    def _retrieve_items(self, queries: list, use_rerank: bool = None) -> list:
+        """
+        @brief 检索流程：先查结果缓存，未命中的查询批量生成嵌入、检索、按需重排序并过滤，
+               结果按(规范化查询, 是否重排序, top_k, 阈值, 索引版本)缓存，索引更新后旧结果自然失效
+        
+        @param queries (list): 查询字符串列表
+        @param use_rerank (bool, optional): 是否启用重排序功能，默认为None时使用配置值
+        
+        @return list: 与查询一一对应的上下文项列表，嵌入生成失败的查询为None
+        """
+        use_rerank, keys, contexts, pending = self._lookup_results(queries, use_rerank)
+        if not pending:
+            return contexts
+        
+        query_embeddings = self._embed_queries([queries[i] for i in pending])
+        batch_results = self.vector_store.similarity_search_batch(query_embeddings, top_k=self.top_k)
+        
+        for i, query_embedding, results in zip(pending, query_embeddings, batch_results):
+            if query_embedding is None:
+                logger.warning(f"Failed to generate embedding for query: '{queries[i]}'")
+                continue
+            reranked_results = self._rerank_documents(queries[i], results) if use_rerank and results else None
+            self._store_result(contexts, keys, i, results, reranked_results, use_rerank)
+        return contexts
+    
+    async def _aretrieve_items(self, queries: list, use_rerank: bool = None) -> list:
+        """
+        @brief _retrieve_items的异步版本
+        
+        @param queries (list): 查询字符串列表
+        @param use_rerank (bool, optional): 是否启用重排序功能，默认为None时使用配置值
+        
+        @return list: 与查询一一对应的上下文项列表，嵌入生成失败的查询为None
+        """
+        use_rerank, keys, contexts, pending = self._lookup_results(queries, use_rerank)
+        if not pending:
+            return contexts
+        
+        query_embeddings = await self._aembed_queries([queries[i] for i in pending])
+        # 索引检索是CPU密集的矩阵运算，放到线程池中执行，不阻塞事件循环
+        batch_results = await asyncio.get_running_loop().run_in_executor(
+            None, self.vector_store.similarity_search_batch, query_embeddings, self.top_k
         )
-        if use_rerank and results:
-            reranked_results = self._rerank_documents(query, results)
-            if reranked_results:
-                results = reranked_results
+        
+        async def rerank(i, results):
+            """
+            @brief 对单个查询的结果重排序，未启用或没有结果时跳过
+            
+            @param i (int): 查询下标
+            @param results (list): 该查询的检索结果
+            
+            @return list | None: 重排序结果，跳过时为None
+            """
+            return await self._arerank_documents(queries[i], results) if use_rerank and results else None
+        
+        valid = []
+        for i, query_embedding, results in zip(pending, query_embeddings, batch_results):
+            if query_embedding is None:
+                logger.warning(f"Failed to generate embedding for query: '{queries[i]}'")
+                continue
+            valid.append((i, results))
+        
+        # 各查询的重排序请求并发执行
+        reranked = await asyncio.gather(*(rerank(i, results) for i, results in valid))
+        for (i, results), reranked_results in zip(valid, reranked):
+            self._store_result(contexts, keys, i, results, reranked_results, use_rerank)
+        return contexts
+    
+    def _lookup_results(self, queries: list, use_rerank: bool = None):
+        """
+        @brief 在结果缓存中查找各查询的检索结果
+        
+        @param queries (list): 查询字符串列表
+        @param use_rerank (bool, optional): 是否启用重排序功能，默认为None时使用配置值
+        
+        @return tuple: (实际的use_rerank, 缓存键列表, 上下文项列表（未命中为None）, 未命中的下标列表)
+        """
+        if use_rerank is None:
+            use_rerank = self.reranker_enable or self.enable_rerank
+        use_rerank = bool(use_rerank)
+        
+        version = self.vector_store.version
+        keys = [
+            (normalize_query(query), use_rerank, self.top_k, self.score_threshold, version)
+            for query in queries
+        ]
+        contexts = [None] * len(queries)
+        pending = []
+        for i, key in enumerate(keys):
+            cached = self.result_cache.get(key) if self.result_cache is not None else None
+            if cached is not None:
+                contexts[i] = [dict(item) for item in cached]
+            else:
+                pending.append(i)
+        return use_rerank, keys, contexts, pending
+    
+    def _store_result(self, contexts: list, keys: list, i: int, results: list, reranked_results, use_rerank: bool):
+        """
+        @brief 过滤检索结果并写入结果缓存
+        
+        @param contexts (list): 上下文项列表，结果写入第i项
+        @param keys (list): 缓存键列表
+        @param i (int): 查询下标
+        @param results (list): 相似度检索结果
+        @param reranked_results (list | None): 重排序结果，未重排序或失败时为None
+        @param use_rerank (bool): 是否请求了重排序
+        """
+        cacheable = True
+        if reranked_results:
+            results = reranked_results
+        elif use_rerank and len(results) >= 2:
+            # 重排序失败时退回相似度顺序，但不缓存，避免之后一直返回未重排的结果
+            cacheable = False
+        
+        contexts[i] = self._to_context_items(results)
+        if cacheable and self.result_cache is not None:
+            self.result_cache.put(keys[i], [dict(item) for item in contexts[i]])
+    
+    def embed_query(self, query: str):
+        """
+        @brief 生成单个查询的向量（经过查询向量缓存）
+        
+        @param query (str): 查询字符串
+        
+        @return list | None: 查询向量，生成失败时返回None
+        """
+        return self._embed_queries([query])[0]
+    
+    async def aembed_query(self, query: str):
+        """
+        @brief embed_query的异步版本
+        
+        @param query (str): 查询字符串
+        
+        @return list | None: 查询向量，生成失败时返回None
+        """
+        return (await self._aembed_queries([query]))[0]
+    
+    def _embed_queries(self, queries: list) -> list:
+        """
+        @brief 生成查询向量：先查进程内缓存（按模型与规范化查询），未命中的查询一次批量请求嵌入服务
+        
+        @param queries (list): 查询字符串列表
+        
+        @return list: 与查询一一对应的向量，生成失败或格式无效的项为None
+        """
+        keys, embeddings, positions = self._lookup_query_embeddings(queries)
+        if positions:
+            computed = self.embedding_model.embed_texts([queries[indices[0]] for indices in positions])
+            self._store_query_embeddings(queries, keys, embeddings, positions, computed)
+        return embeddings
+    
+    async def _aembed_queries(self, queries: list) -> list:
+        """
+        @brief _embed_queries的异步版本
+        
+        @param queries (list): 查询字符串列表
+        
+        @return list: 与查询一一对应的向量，生成失败或格式无效的项为None
+        """
+        keys, embeddings, positions = self._lookup_query_embeddings(queries)
+        if positions:
+            computed = await self.embedding_model.aembed_texts([queries[indices[0]] for indices in positions])
+            self._store_query_embeddings(queries, keys, embeddings, positions, computed)
+        return embeddings
+    
+    def _lookup_query_embeddings(self, queries: list):
+        """
+        @brief 在查询向量缓存中查找，相同的未命中查询只需生成一次
+        
+        @param queries (list): 查询字符串列表
+        
+        @return tuple: (缓存键列表, 向量列表（未命中为None）, 每个待生成查询对应的下标列表)
+        """
+        model_name = self.embedding_model.model_name
+        keys = [(model_name, normalize_query(query)) for query in queries]
+        embeddings = [None] * len(queries)
+        
+        missing = {}
+        for i, key in enumerate(keys):
+            cached = self.query_cache.get(key) if self.query_cache is not None else None
+            if cached is not None:
+                embeddings[i] = cached
+            else:
+                missing.setdefault(key, []).append(i)
+        return keys, embeddings, list(missing.values())
+    
+    def _store_query_embeddings(self, queries: list, keys: list, embeddings: list, positions: list, computed: list):
+        """
+        @brief 校验新生成的查询向量，填回结果并写入缓存
+        
+        @param queries (list): 查询字符串列表
+        @param keys (list): 缓存键列表
+        @param embeddings (list): 向量列表
+        @param positions (list): 每个待生成查询对应的下标列表
+        @param computed (list): 与positions对应的新向量
+        """
+        for indices, embedding in zip(positions, computed):
+            if not embedding:
+                continue
+            if not isinstance(embedding, list) or not all(isinstance(x, float) for x in embedding):
+                logger.error(f"Invalid embedding format for query: '{queries[indices[0]]}'")
+                continue
+            if self.query_cache is not None:
+                self.query_cache.put(keys[indices[0]], embedding)
+            for i in indices:
+                embeddings[i] = embedding
+    
+    def cache_stats(self) -> dict:
+        """
+        @brief 返回检索相关缓存的命中统计
+        
+        @return dict: 各缓存的统计信息，未启用的缓存为None
+        """
+        return {
+            "query_embedding": self.query_cache.stats() if self.query_cache is not None else None,
+            "retrieval": self.result_cache.stats() if self.result_cache is not None else None,
+            "index_version": self.vector_store.version
+        }
+    
+    def _to_context_items(self, results: list) -> list:
+        """
+        @brief 过滤低于阈值的检索结果，并转换为包含分块ID、文本、摘要、来源和分数的字典
+        
+        @param results (list): 相似度搜索结果列表，每个元素为(分数, 块ID, 元数据)
+        
+        @return list: 上下文项列表
+        """
         context = []
         for score, chunk_id, chunk_data in results:
             if score >= self.score_threshold:
-                context.append({
+                item = {
+                    "chunk_id": chunk_id,
                     "text": chunk_data["text"],
                     "summary": chunk_data["summary"],
                     "source": chunk_data["source"],
                     "score": round(score, 3)
-                })
+                }
+                item.update({key: chunk_data[key] for key in LOCATOR_KEYS if key in chunk_data})
+                context.append(item)
         return context
     
     def _rerank_documents(self, query: str, results: list) -> list:
@@ -132,20 +388,10 @@ class Retriever:
         
         @return list: 重排序后的结果列表，格式与输入相同
         """
-        if len(results) < 2:  
+        prompt = self._build_rerank_prompt(query, results)
+        if prompt is None:
             return None
         
-        
-        summaries = []
-        for i, (score, _, chunk_data) in enumerate(results[:self.top_n_for_rerank]):
-            summaries.append(f"[{i+1}] {chunk_data['summary']}")
-        
-        
-        prompt = self.reranker_prompt_template.format(
-            query=query,
-            summaries="\n".join(summaries)
-        )
-        
         try:
             
             response = requests.post(
@@ -157,50 +403,116 @@ class Retriever:
                 },
                 timeout=self.rerank_timeout
             )
-            
-            if response.status_code == 200:
-                
-                response_text = response.json().get("response", "").strip()
-                logger.info(f"大模型原始返回: {response_text}")
-                ranked_pairs = self._parse_rerank_response(response_text)
-                
-                if not ranked_pairs:
-                    logger.info("重排序未返回有效结果")
-                    return None
-                
-                
-                reranked = []
-                for idx, score in ranked_pairs:
-                    
-                    if 1 <= idx <= len(summaries):
-                        
-                        original_index = idx - 1  
-                        reranked.append((
-                            results[original_index][0],  
-                            score,                      
-                            results[original_index][1],  
-                            results[original_index][2]   
-                        ))
-                
-                
-                reranked.sort(key=lambda x: x[1], reverse=True)
-                
-                
-                final_results = []
-                for item in reranked:
-                    
-                    final_results.append((item[0], item[2], item[3]))
-                
-                
-                if self.top_n_for_rerank < len(results):
-                    final_results.extend(results[self.top_n_for_rerank:])
-                
-                return final_results
+            return self._apply_rerank_response(response, results)
         except Exception as e:
             logger.error(f"重排序失败: {str(e)}")
         
         return None
     
+    async def _arerank_documents(self, query: str, results: list) -> list:
+        """
+        @brief _rerank_documents的异步版本，通过共享的异步HTTP客户端调用大语言模型
+        
+        @param query (str): 用户的原始查询
+        @param results (list): 初步检索结果列表
+        
+        @return list: 重排序后的结果列表，格式与输入相同
+        """
+        prompt = self._build_rerank_prompt(query, results)
+        if prompt is None:
+            return None
+        
+        try:
+            async with track_upstream("rerank"):
+                response = await get_async_client().post(
+                    f"{self.ollama_host}/api/generate",
+                    json={
+                        "model": self.reranker_model,
+                        "prompt": prompt,
+                        "stream": False
+                    },
+                    timeout=self.rerank_timeout
+                )
+            return self._apply_rerank_response(response, results)
+        except Exception as e:
+            logger.error(f"重排序失败: {str(e) or type(e).__name__}")
+        
+        return None
+    
+    def _build_rerank_prompt(self, query: str, results: list):
+        """
+        @brief 用前top_n_for_rerank个结果的摘要构建重排序提示词
+        
+        @param query (str): 用户的原始查询
+        @param results (list): 初步检索结果列表
+        
+        @return str | None: 提示词，结果少于2个时无需重排序，返回None
+        """
+        if len(results) < 2:  
+            return None
+        
+        
+        summaries = []
+        for i, (score, _, chunk_data) in enumerate(results[:self.top_n_for_rerank]):
+            summaries.append(f"[{i+1}] {chunk_data['summary']}")
+        
+        
+        return self.reranker_prompt_template.format(
+            query=query,
+            summaries="\n".join(summaries)
+        )
+    
+    def _apply_rerank_response(self, response, results: list) -> list:
+        """
+        @brief 解析重排序模型的响应，并按返回的分数重新排列参与重排序的结果
+        
+        @param response (requests.Response | httpx.Response): /api/generate的响应
+        @param results (list): 初步检索结果列表
+        
+        @return list: 重排序后的结果列表，无有效结果时返回None
+        """
+        if response.status_code != 200:
+            return None
+        
+        
+        response_text = response.json().get("response", "").strip()
+        logger.info(f"大模型原始返回: {response_text}")
+        ranked_pairs = self._parse_rerank_response(response_text)
+        
+        if not ranked_pairs:
+            logger.info("重排序未返回有效结果")
+            return None
+        
+        
+        summary_count = min(len(results), self.top_n_for_rerank)
+        reranked = []
+        for idx, score in ranked_pairs:
+            
+            if 1 <= idx <= summary_count:
+                
+                original_index = idx - 1  
+                reranked.append((
+                    results[original_index][0],  
+                    score,                      
+                    results[original_index][1],  
+                    results[original_index][2]   
+                ))
+        
+        
+        reranked.sort(key=lambda x: x[1], reverse=True)
+        
+        
+        final_results = []
+        for item in reranked:
+            
+            final_results.append((item[0], item[2], item[3]))
+        
+        
+        if self.top_n_for_rerank < len(results):
+            final_results.extend(results[self.top_n_for_rerank:])
+        
+        return final_results
+    
     def _parse_rerank_response(self, response: str) -> list:
         """
         @brief 解析大语言模型返回的重排序结果，提取索引-分数对
@@ -264,6 +576,12 @@ class Retriever:
         context_str = "检索到的相关上下文信息：\n\n"
         for i, item in enumerate(context_items, 1):
             source_name = Path(item["source"]).name
+            if "page" in item:
+                source_name += f" 第{item['page']}页"
+            elif "slide" in item:
+                source_name += f" 第{item['slide']}张幻灯片"
+            elif "rows" in item:
+                source_name += f" 第{item['rows']}行"
             context_str += f"===上下文片段 {i} (来源: {source_name}, 相似度: {item['score']}, 摘要: {item['summary']})\n"
             context_str += f"{item['text']}\n\n"
         
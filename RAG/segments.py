@@ -0,0 +1,295 @@
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+from annoy import AnnoyIndex
+
+from .metadata_store import MetadataReader, write_metadata, migrate_json_metadata
+from .index_backends import select_backend_type, create_backend, find_backend, load_backend, remove_backend_files, BACKENDS
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def save_matrix(path: Path, matrix: np.ndarray):
+    """
+    @brief 先写临时文件再原子替换，保存.npy矩阵
+    
+    @param path (Path): 目标路径
+    @param matrix (np.ndarray): 需要保存的矩阵
+    """
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, 'wb') as f:
+        np.save(f, matrix)
+    os.replace(tmp_path, path)
+
+
+def rows_to_ranges(rows: List[int]) -> List[List[int]]:
+    """
+    @brief 将有序行号压缩为左闭右开区间列表
+    
+    @param rows (List[int]): 升序行号
+    
+    @return List[List[int]]: [[起始, 结束), ...]
+    """
+    ranges = []
+    for row in rows:
+        if ranges and ranges[-1][1] == row:
+            ranges[-1][1] = row + 1
+        else:
+            ranges.append([row, row + 1])
+    return ranges
+
+
+class IndexSegment:
+    """
+    @brief 不可变的索引段：摘要索引、正文向量矩阵和二进制元数据，删除以墓碑（行号集合）记录
+    """
+    
+    def __init__(self, store_dir: Path, name: str, dim: int):
+        """
+        @brief 初始化索引段，文件均以store_dir/name为前缀
+        
+        @param store_dir (Path): 向量存储目录
+        @param name (str): 段名称
+        @param dim (int): 向量维度
+        """
+        self.store_dir = Path(store_dir)
+        self.name = name
+        self.dim = dim
+        prefix = self.store_dir / name
+        self.summary_index_prefix = Path(f"{prefix}_summary")
+        self.metadata_path = Path(f"{prefix}_metadata.bin")
+        self.legacy_metadata_path = Path(f"{prefix}_metadata.json")
+        self.vectors_path = Path(f"{prefix}_vectors.npy")
+        # 旧版索引额外保存了正文Annoy索引，仅在导出向量矩阵时使用
+        self.legacy_index_path = Path(f"{prefix}.ann")
+        
+        self.summary_index = None
+        self.metadata = []
+        self.chunk_ids = []
+        self.vectors = None
+        self.deleted = set()
+        self.sources: Dict[str, List[List[int]]] = {}
+    
+    def exists(self) -> bool:
+        """
+        @brief 判断段文件是否完整
+        
+        @return bool: 摘要索引、正文向量（或旧版正文索引）和元数据（或旧版JSON）均存在时返回True
+        """
+        has_metadata = self.metadata_path.exists() or self.legacy_metadata_path.exists()
+        has_vectors = self.vectors_path.exists() or self.legacy_index_path.exists()
+        return find_backend(self.summary_index_prefix) is not None and has_vectors and has_metadata
+    
+    def load(self):
+        """
+        @brief 加载段文件，旧版JSON元数据与正文Annoy索引在首次加载时转换为新格式
+        """
+        self.summary_index = load_backend(self.summary_index_prefix, self.dim)
+        
+        if not self.metadata_path.exists():
+            migrate_json_metadata(self.legacy_metadata_path, self.metadata_path)
+        reader = MetadataReader(self.metadata_path)
+        self.metadata = reader.records
+        self.chunk_ids = reader.chunk_ids
+        
+        if not self.vectors_path.exists():
+            legacy_index = AnnoyIndex(self.dim, "angular")
+            legacy_index.load(str(self.legacy_index_path))
+            count = legacy_index.get_n_items()
+            logger.info(f"Exporting {count} chunk vectors to {self.vectors_path}")
+            matrix = np.array(
+                [legacy_index.get_item_vector(i) for i in range(count)], dtype=np.float32
+            ).reshape(count, self.dim)
+            legacy_index.unload()
+            save_matrix(self.vectors_path, matrix)
+        self.vectors = np.load(self.vectors_path, mmap_mode='r')
+    
+    @classmethod
+    def write(cls, store_dir: Path, name: str, dim: int, metadata: List[dict], chunk_ids: List[str],
+              vectors: np.ndarray, summary_vectors: np.ndarray) -> "IndexSegment":
+        """
+        @brief 按条目数选择后端，构建并保存一个新段，同名段遗留的其他后端索引文件被删除
+        
+        @param store_dir (Path): 向量存储目录
+        @param name (str): 段名称
+        @param dim (int): 向量维度
+        @param metadata (List[dict]): 分块元数据
+        @param chunk_ids (List[str]): 分块ID
+        @param vectors (np.ndarray): 归一化的正文向量矩阵
+        @param summary_vectors (np.ndarray): 归一化的摘要向量矩阵
+        
+        @return IndexSegment: 已加载的新段
+        """
+        segment = cls(store_dir, name, dim)
+        summary_index = create_backend(select_backend_type(len(chunk_ids)), dim)
+        summary_index.add(summary_vectors)
+        summary_index.build()
+        summary_index.save(segment.summary_index_prefix)
+        # 中断的构建可能留下同名段的其他后端文件，加载时会先找到它们
+        remove_backend_files(segment.summary_index_prefix, keep=summary_index.name)
+        write_metadata(segment.metadata_path, metadata, chunk_ids)
+        save_matrix(segment.vectors_path, np.asarray(vectors, dtype=np.float32).reshape(-1, dim))
+        
+        segment.load()
+        segment.sources = segment.scan_sources()
+        return segment
+    
+    def scan_sources(self) -> Dict[str, List[List[int]]]:
+        """
+        @brief 扫描元数据，得到每个来源文档在段内的行区间
+        
+        @return Dict[str, List[List[int]]]: 来源路径到行区间的映射
+        """
+        rows = {}
+        for row, chunk_data in enumerate(self.metadata):
+            rows.setdefault(chunk_data.get("source"), []).append(row)
+        return {source: rows_to_ranges(source_rows) for source, source_rows in rows.items()}
+    
+    def rows_for_source(self, source: str) -> List[int]:
+        """
+        @brief 获取来源文档在段内的全部行号
+        
+        @param source (str): 来源路径
+        
+        @return List[int]: 行号列表
+        """
+        return [row for start, end in self.sources.get(source, []) for row in range(start, end)]
+    
+    def __len__(self):
+        """
+        @brief 段内条目数，包含已删除的条目
+        
+        @return int: 条目数
+        """
+        return len(self.chunk_ids)
+    
+    @property
+    def live_count(self) -> int:
+        """
+        @brief 未被删除的条目数
+        
+        @return int: 条目数
+        """
+        return len(self) - len(self.deleted)
+    
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        @brief 在摘要索引中取k个未删除的候选，并用正文向量矩阵一次性重新打分
+        
+        @param query (np.ndarray): 归一化的查询向量
+        @param k (int): 候选数量
+        
+        @return Tuple[np.ndarray, np.ndarray]: (段内行号, 正文余弦相似度)
+        """
+        count = len(self)
+        if count == 0 or self.summary_index is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        
+        rows, summary_scores = self.summary_index.search(query, min(count, k + len(self.deleted)))
+        keep = rows < count
+        if self.deleted:
+            keep &= ~np.isin(rows, list(self.deleted))
+        rows = rows[keep][:k]
+        summary_scores = summary_scores[keep][:k]
+        
+        if self.vectors is not None and len(self.vectors) >= count:
+            scores = np.clip(self.vectors[rows] @ query, -1.0, 1.0)
+        else:
+            scores = summary_scores
+        return rows, scores
+    
+    def search_batch(self, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        @brief 批量检索：摘要索引批量取候选，所有查询的候选用一次逐行点积重新打分
+        
+        @param queries (np.ndarray): 形状为(q, dim)的归一化查询矩阵
+        @param k (int): 每个查询的候选数量
+        
+        @return List[Tuple[np.ndarray, np.ndarray]]: 与查询一一对应的(段内行号, 正文余弦相似度)
+        """
+        count = len(self)
+        if count == 0 or self.summary_index is None:
+            return [(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)) for _ in queries]
+        
+        deleted = np.fromiter(self.deleted, dtype=np.int64) if self.deleted else None
+        candidates = []
+        for rows, summary_scores in self.summary_index.search_batch(queries, min(count, k + len(self.deleted))):
+            keep = rows < count
+            if deleted is not None:
+                keep &= ~np.isin(rows, deleted)
+            candidates.append((rows[keep][:k], summary_scores[keep][:k]))
+        
+        if self.vectors is None or len(self.vectors) < count:
+            return candidates
+        
+        sizes = [len(rows) for rows, _ in candidates]
+        all_rows = np.concatenate([rows for rows, _ in candidates])
+        owners = np.repeat(np.arange(len(queries)), sizes)
+        scores = np.einsum('ij,ij->i', np.asarray(self.vectors[all_rows]), queries[owners])
+        scores = np.clip(scores, -1.0, 1.0)
+        return list(zip(np.split(all_rows, np.cumsum(sizes)[:-1]), np.split(scores, np.cumsum(sizes)[:-1])))
+    
+    def warm(self):
+        """
+        @brief 预热：顺序读取正文向量并在摘要索引上执行一次检索，把内存映射的页面载入页缓存，
+               避免切换到新版本后首批查询阻塞在磁盘IO上
+        """
+        if self.vectors is None or len(self) == 0:
+            return
+        # 分块求和，逐页读取整个向量矩阵而不额外占用一份内存
+        for start in range(0, len(self.vectors), 65536):
+            float(np.asarray(self.vectors[start:start + 65536]).sum())
+        if self.summary_index is not None:
+            self.summary_index.search(np.asarray(self.vectors[0], dtype=np.float32), 1)
+
+    def live_rows(self) -> np.ndarray:
+        """
+        @brief 未删除条目的行号
+        
+        @return np.ndarray: 升序的行号数组
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if self.deleted:
+            mask[np.fromiter(self.deleted, dtype=np.int64)] = False
+        return np.flatnonzero(mask)
+    
+    def live_items(self) -> Tuple[List[dict], List[str], np.ndarray, np.ndarray]:
+        """
+        @brief 批量取出未删除条目的元数据与向量，用于压缩合并；向量按行号整体切片而不是逐行复制
+        
+        @return Tuple[List[dict], List[str], np.ndarray, np.ndarray]: (元数据, 分块ID, 正文向量矩阵, 摘要向量矩阵)
+        """
+        rows = self.live_rows()
+        metadata = [self.metadata[row] for row in rows.tolist()]
+        chunk_ids = [self.chunk_ids[row] for row in rows.tolist()]
+        vectors = np.asarray(self.vectors[rows], dtype=np.float32).reshape(-1, self.dim)
+        summary_vectors = self.summary_index.get_vectors(rows)
+        return metadata, chunk_ids, vectors, summary_vectors
+    
+    def files(self) -> List[Path]:
+        """
+        @brief 段在磁盘上的全部文件
+        
+        @return List[Path]: 存在的文件路径
+        """
+        candidates = [self.metadata_path, self.legacy_metadata_path, self.vectors_path, self.legacy_index_path]
+        candidates += [backend_cls.path_for(self.summary_index_prefix) for backend_cls in BACKENDS.values()]
+        return [path for path in candidates if path.exists()]
+    
+    def to_entry(self) -> dict:
+        """
+        @brief 生成段在段清单中的记录
+        
+        @return dict: 段名称、条目数、墓碑与来源区间
+        """
+        return {
+            "name": self.name,
+            "count": len(self),
+            "deleted": sorted(self.deleted),
+            "sources": self.sources
+        }
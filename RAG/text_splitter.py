@@ -1,15 +1,26 @@
+import math
 import re
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from config import RAG_CONFIG
+from config import RAG_CONFIG, SERVICE_CONFIG
 from pathlib import Path
 import logging
-import requests
 import time
 from tqdm import tqdm  
-from typing import List
+from typing import Iterator, List, Optional, Tuple
+from .cache import get_summary_cache
+from .embeddings import _get_session
 
 logger = logging.getLogger(__name__)
 
+# 摘要提示词及其版本，修改提示词时需同步更新版本号以使旧的摘要缓存失效
+SUMMARY_PROMPT_VERSION = "v1"
+SUMMARY_PROMPT = "请用5-10个字的短语总结以下文本的核心内容，不要解释，只输出短语：\n{text}"
+
+# 句末标点（中英文），作为分块边界
+_SENTENCE_END = re.compile(r'[。？！；.?!;]')
+# 按行组织的单元（如CSV数据行）以换行作为分块边界
+_ROW_END = re.compile(r'\n')
+
 class TextSplitter:
     def __init__(self, progress_callback=None):
         """
@@ -24,7 +35,14 @@ class TextSplitter:
             separators=["\n\n", "\n", "。", "？", "！", "；", " ", ""],
             keep_separator=True
         )
+        self.chunk_size = config["chunk_size"]
+        self.chunk_overlap = max(0, min(config["chunk_overlap"], self.chunk_size - 1))
         self.summarizer_config = RAG_CONFIG.get("summarizer", {})
+        self.summary_model = self.summarizer_config.get("model_name", "qwen:7b")
+        self.summary_cache = get_summary_cache()
+        self.generate_url = f"{SERVICE_CONFIG['ollama_host']}/api/generate"
+        # 与嵌入请求共用带连接池的会话，复用到Ollama的TCP连接
+        self.session = _get_session()
         self.progress_callback = progress_callback or (lambda **kw: None)
     
     def generate_summary(self, text: str) -> str:
@@ -35,13 +53,45 @@ class TextSplitter:
         
         @return str: 生成的摘要文本，失败时返回前5个词的组合
         """
+        summary, _ = self._summarize(text)
+        return summary
+    
+    def _summarize(self, text: str) -> Tuple[str, bool]:
+        """
+        @brief 优先从摘要缓存读取，未命中时调用模型生成；只有模型成功生成的摘要才会写入缓存
+        
+        @param text (str): 需要生成摘要的输入文本
+        
+        @return Tuple[str, bool]: (摘要文本, 是否为回退摘要)
+        """
+        if self.summary_cache is not None:
+            cached = self.summary_cache.get_summary(self.summary_model, SUMMARY_PROMPT_VERSION, text)
+            if cached is not None:
+                return cached, False
+        
+        summary = self._request_summary(text)
+        if summary:
+            if self.summary_cache is not None:
+                self.summary_cache.put_summary(self.summary_model, SUMMARY_PROMPT_VERSION, text, summary)
+            return summary, False
+        
+        return " ".join(text.split()[:5]), True
+    
+    def _request_summary(self, text: str) -> Optional[str]:
+        """
+        @brief 通过/api/generate请求摘要模型
+        
+        @param text (str): 需要生成摘要的输入文本
+        
+        @return Optional[str]: 模型返回的摘要，失败或为空时返回None
+        """
         try:
-            prompt = f"请用5-10个字的短语总结以下文本的核心内容，不要解释，只输出短语：\n{text}"
+            prompt = SUMMARY_PROMPT.format(text=text)
             
-            response = requests.post(
-                "http://localhost:11434/api/generate",
+            response = self.session.post(
+                self.generate_url,
                 json={
-                    "model": self.summarizer_config.get("model_name", "qwen:7b"),
+                    "model": self.summary_model,
                     "prompt": prompt,
                     "stream": False
                 },
@@ -49,14 +99,15 @@ class TextSplitter:
             )
             
             if response.status_code == 200:
-                return response.json().get("response", "").strip().replace('"', '')
+                summary = response.json().get("response", "").strip().replace('"', '')
+                if summary:
+                    return summary
+                logger.warning("摘要生成返回空结果")
             else:
                 logger.warning(f"摘要生成失败: {response.status_code} - {response.text}")
         except Exception as e:
             logger.error(f"摘要生成错误: {str(e)}")
-        
-        
-        return " ".join(text.split()[:5])
+        return None
     
     
     def _smart_split(self, text: str) -> List[str]:
@@ -67,92 +118,133 @@ class TextSplitter:
         
         @return List[str]: 分割后的文本块列表
         """
+        return [text[start:end] for start, end in self._iter_split_offsets(text)]
+    
+    def _iter_split_offsets(self, text: str, boundary: re.Pattern = _SENTENCE_END) -> Iterator[Tuple[int, int]]:
+        """
+        @brief 线性扫描句末标点，逐个产出文本块在原字符串中的(起始, 结束)偏移；
+               块长度达到70%后在第一个句末处切分，否则回退到块内最后一个句末，均无时按块大小硬切，
+               相邻块按chunk_overlap重叠
         
-        sentence_endings = {'。', '？', '！', '；', '.', '?', '!', ';'}
-        
-        chunks = []
-        current_chunk = ""
-        char_count = 0
-        
+        @param text (str): 需要分割的输入文本
+        @param boundary (re.Pattern): 块边界模式，默认为句末标点
         
-        for char in text:
-            current_chunk += char
-            char_count += 1
-            
+        @return Iterator[Tuple[int, int]]: 去除首尾空白后的块偏移
+        """
+        length = len(text)
+        # 与旧实现的 char_count >= chunk_size * 0.7 一致，非整数阈值向上取整
+        min_size = max(1, math.ceil(self.chunk_size * 0.7))
+        start = 0
+        
+        while start < length:
+            limit = start + self.chunk_size
+            match = boundary.search(text, start + min_size - 1, limit)
+            if match:
+                end = match.end()
+            elif limit > length:
+                end = length
+            else:
+                end = limit
+                for match in boundary.finditer(text, start, start + min_size - 1):
+                    end = match.end()
             
-            if char_count >= self.splitter._chunk_size * 0.7 and char in sentence_endings:
-                chunks.append(current_chunk.strip())
-                current_chunk = ""
-                char_count = 0
-                
+            chunk_start, chunk_end = start, end
+            while chunk_start < chunk_end and text[chunk_start].isspace():
+                chunk_start += 1
+            while chunk_end > chunk_start and text[chunk_end - 1].isspace():
+                chunk_end -= 1
+            if chunk_end > chunk_start:
+                yield chunk_start, chunk_end
             
-            elif char_count >= self.splitter._chunk_size:
-                
-                for i in range(len(current_chunk)-1, -1, -1):
-                    if current_chunk[i] in sentence_endings:
-                        chunks.append(current_chunk[:i+1].strip())
-                        current_chunk = current_chunk[i+1:]
-                        char_count = len(current_chunk)
-                        break
-                else:  
-                    chunks.append(current_chunk.strip())
-                    current_chunk = ""
-                    char_count = 0
-        
-        
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-        
-        return chunks
+            if end >= length:
+                break
+            start = end - self.chunk_overlap if end - self.chunk_overlap > start else end
     
-    def split_documents(self, documents):
+    def _iter_units(self, doc):
         """
-        @brief 将加载的文档列表分割为较小的文本块，并为每个块生成摘要
+        @brief 产出文档的内容单元；整体加载的文档只有一个单元
         
-        @param documents (list): 文档列表，每个元素包含文件路径和内容
+        @param doc (dict): 文档字典，包含content或units
+        
+        @return Iterator[tuple]: (文本, 单元元数据)生成器
+        """
+        if "units" in doc:
+            for text, unit_meta in doc["units"]:
+                yield text, unit_meta
+        else:
+            yield doc["content"], {}
+    
+    def split_documents(self, documents, total=None):
+        """
+        @brief 将加载的文档分割为较小的文本块，并为每个块生成摘要；支持边加载边分割的文档生成器
+        
+        @param documents (Iterable[dict]): 文档列表或生成器，每个元素包含文件路径和内容（content）
+                                           或按页等单元流式产出的内容（units）
+        @param total (int, optional): 文档总数，documents为生成器时用于报告进度
         
         @return list: 分割后的文本块列表，每个元素包含文本、摘要等信息
         """
         chunks = []
-        total_docs = len(documents)
+        total_docs = total if total is not None else len(documents)
+        doc_idx = -1
         
         
         self.progress_callback(stage="split", total=total_docs, current=0, message="开始分割文档")
         
-        for doc_idx, doc in enumerate(tqdm(documents, desc="分割文档")):
-            content = doc["content"]
+        for doc_idx, doc in enumerate(tqdm(documents, desc="分割文档", total=total_docs)):
+            source = doc["file_path"]
+            stem = Path(source).stem
+            doc_chunk_count = 0
             
-            content = re.sub(r'\s+', ' ', content).strip()
-            
-            split_texts = self._smart_split(content)
+            # 分页文档逐个单元（如PDF页）读取和分割，块不跨越单元，单元元数据（如页码）写入块中
+            for content, unit_meta in self._iter_units(doc):
+                if "rows" in unit_meta:
+                    # CSV单元每行一条数据，保留行分隔并按行切分，避免数值中的小数点被当作句末
+                    content = re.sub(r'[^\S\n]+', ' ', content)
+                    content = re.sub(r' ?\n\s*', '\n', content).strip()
+                    boundary = _ROW_END
+                else:
+                    content = re.sub(r'\s+', ' ', content).strip()
+                    boundary = _SENTENCE_END
+                
+                for start, end in self._iter_split_offsets(content, boundary):
+                    text = content[start:end]
+                    summary, is_fallback = self._summarize(text)
+                    
+                    chunk = {
+                        "text": text,
+                        "summary": summary,
+                        "source": source,
+                        "chunk_id": f"{stem}_{doc_chunk_count}"
+                    }
+                    chunk.update(unit_meta)
+                    if is_fallback:
+                        chunk["summary_fallback"] = True
+                    chunks.append(chunk)
+                    doc_chunk_count += 1
             
             
             self.progress_callback(
                 stage="split",
                 current=doc_idx + 1,
                 total=total_docs,
-                message=f"正在处理文档: {Path(doc['file_path']).name}",
-                details=f"分割成 {len(split_texts)} 个片段"
+                message=f"正在处理文档: {Path(source).name}",
+                details=f"分割成 {doc_chunk_count} 个片段"
             )
-            
-            for i, text in enumerate(split_texts):
-                
-                summary = self.generate_summary(text)
-                
-                chunks.append({
-                    "text": text,
-                    "summary": summary,
-                    "source": doc["file_path"],
-                    "chunk_id": f"{Path(doc['file_path']).stem}_{i}"
-                })
         
         
         self.progress_callback(
             stage="split",
-            current=total_docs,
+            current=doc_idx + 1,
             total=total_docs,
             message=f"文档分割完成",
             details=f"共生成 {len(chunks)} 个文本块"
         )
         
+        fallback_count = sum(1 for chunk in chunks if chunk.get("summary_fallback"))
+        if fallback_count:
+            logger.warning(f"{fallback_count} chunks use fallback summaries and will be retried on next build")
+        if self.summary_cache is not None:
+            logger.info(f"Summary cache stats: {self.summary_cache.stats()}")
+        
         return chunks
\ No newline at end of file
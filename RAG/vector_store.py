@@ -1,10 +1,14 @@
 
-from annoy import AnnoyIndex
+import copy
 import json
 import numpy as np
 import os
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 from config import VECTOR_STORE_DIR, RAG_CONFIG
+from .segments import IndexSegment
 import logging
 from tqdm import tqdm
 
@@ -12,10 +16,89 @@ from tqdm import tqdm
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 分块在原文档中的定位字段（PDF页码、PPTX幻灯片序号、CSV行范围），存在时随元数据一起保存
+LOCATOR_KEYS = ("page", "slide", "rows")
+
+# 同一进程内对段清单的读-改-写（增量合并、全量替换、压缩）串行执行
+_write_lock = threading.RLock()
+
+# 进程内各段的引用计数：VectorStore实例当前的段列表与进行中的检索都持有引用。
+# 被替换的段在引用归零之前不会被删除；垃圾回收时仍被引用的段记录在_release_pending中，
+# 最后一个引用释放时删除其文件。
+# 使用可重入锁：VectorStore.__del__可能在持有该锁的线程中因垃圾回收被触发
+_refs_lock = threading.RLock()
+_segment_refs = {}
+_release_pending = {}
+
+
+def _acquire(segments):
+    """
+    @brief 增加段的引用计数，调用方需持有_refs_lock
+    
+    @param segments (list): 段列表
+    """
+    for segment in segments:
+        key = str(segment.store_dir / segment.name)
+        _segment_refs[key] = _segment_refs.get(key, 0) + 1
+
+
+def _release(segments):
+    """
+    @brief 减少段的引用计数，调用方需持有_refs_lock
+    
+    @param segments (list): 段列表
+    
+    @return list: 引用归零且等待删除的段，由调用方在锁外删除其文件
+    """
+    released = []
+    for segment in segments:
+        key = str(segment.store_dir / segment.name)
+        count = _segment_refs.get(key, 0) - 1
+        if count > 0:
+            _segment_refs[key] = count
+            continue
+        _segment_refs.pop(key, None)
+        if key in _release_pending:
+            released.append(_release_pending.pop(key))
+    return released
+
+
+def _is_referenced(store_dir, name):
+    """
+    @brief 判断段是否仍被本进程引用
+    
+    @param store_dir (Path): 向量存储目录
+    @param name (str): 段名称
+    
+    @return bool: 仍被引用时返回True
+    """
+    with _refs_lock:
+        return _segment_refs.get(str(Path(store_dir) / name), 0) > 0
+
+
+def _remove_released(segments):
+    """
+    @brief 删除引用已归零的被替换段的文件
+    
+    @param segments (list): 段列表
+    """
+    for segment in segments:
+        for path in segment.files():
+            try:
+                path.unlink()
+                logger.info(f"Removed released segment file {path}")
+            except OSError as e:
+                logger.warning(f"Failed to remove segment file {path}: {str(e)}")
+
 class VectorStore:
+    # 后台压缩线程，进程退出前可通过wait_for_compaction等待其完成
+    _compaction_threads = []
+    # 压缩发布新版本后调用的回调，例如让服务中的检索器切换到压缩后的版本
+    _compaction_listeners = []
+    
     def __init__(self, rebuild_mode=False):
         """
-        @brief 初始化向量存储
+        @brief 初始化向量存储。索引由多个不可变的段组成，段清单记录各段、删除墓碑和版本号
         
         @param rebuild_mode (bool): 是否重建模式
         """
@@ -24,14 +107,19 @@ class VectorStore:
         config = RAG_CONFIG["vector_store"]
         self.store_type = config["type"]
         self.index_name = config["index_name"]
-        self.index_path = self.store_dir / f"{self.index_name}.ann"
-        self.summary_index_path = self.store_dir / f"{self.index_name}_summary.ann"
-        self.metadata_path = self.store_dir / f"{self.index_name}_metadata.json"
-        self.index = None
-        self.summary_index = None
-        self.metadata = []
-        self.chunk_ids = []
+        self.segments_path = self.store_dir / f"{self.index_name}_segments.json"
+        self.small_segment_items = config.get("compaction_small_segment_items", 5000)
+        self.min_small_segments = max(2, config.get("compaction_min_small_segments", 4))
+        self.max_deleted_ratio = config.get("compaction_max_deleted_ratio", 0.3)
+        self.gc_grace_seconds = config.get("segment_gc_grace_seconds", 300)
+        self.candidate_multiplier = max(1, config.get("candidate_multiplier", 3))
+        self.warm_on_refresh = config.get("warm_on_refresh", True)
+        self._segments = []
+        self.version = 0
+        self._next_segment = 1
+        self._retired = {}
         self.rebuild_mode = rebuild_mode
+        self._refresh_lock = threading.Lock()
         
         
         embedding_config = RAG_CONFIG["embeddings"]
@@ -44,63 +132,329 @@ class VectorStore:
         
     def load_index(self):
         """
-        @brief 根据是否存在已保存的索引文件决定是加载现有索引还是创建新索引
+        @brief 根据段清单加载全部段；没有段清单时把旧版单一索引作为第一个段加载。
+               加载失败时以空索引提供检索
         """
         try:
-            
-            if self.rebuild_mode or not (self.index_path.exists() and self.summary_index_path.exists() and self.metadata_path.exists()):
-                logger.info("Creating new index (rebuild mode or no existing index)")
-                self.index = AnnoyIndex(self.dim, self.distance_metric)
-                self.summary_index = AnnoyIndex(self.dim, self.distance_metric)
-                self.metadata = []
-                self.chunk_ids = []
-            else:
-                logger.info(f"Loading existing index from {self.index_path}")
-                self.index = AnnoyIndex(self.dim, self.distance_metric)
-                self.index.load(str(self.index_path))
-                
-                
-                self.summary_index = AnnoyIndex(self.dim, self.distance_metric)
-                self.summary_index.load(str(self.summary_index_path))
-                
-                with open(self.metadata_path, 'r', encoding='utf-8') as f:
-                    metadata = json.load(f)
-                
-                self.metadata = metadata.get("chunks", [])
-                self.chunk_ids = metadata.get("chunk_ids", [])
-                logger.info(f"Loaded Annoy index with {len(self.metadata)} chunks")
+            self._load_published()
         except Exception as e:
             logger.error(f"Error loading index: {str(e)}")
             
-            self.index = AnnoyIndex(self.dim, self.distance_metric)
-            self.summary_index = AnnoyIndex(self.dim, self.distance_metric)
-            self.metadata = []
-            self.chunk_ids = []
+            self._reset_index()
+    
+    def _load_published(self):
+        """
+        @brief 加载磁盘上已发布的索引，读取段清单或任一段失败时抛出异常
+        """
+        if self.rebuild_mode or not self.exists():
+            logger.info("Creating new index (rebuild mode or no existing index)")
+            self._reset_index()
+        elif self.segments_path.exists():
+            logger.info(f"Loading existing index from {self.store_dir}")
+            state = self._read_state()
+            self._apply_state(state, self._load_segments(state))
+            logger.info(f"Loaded {len(self.segments)} segments with {len(self)} live chunks (version {self.version})")
+        else:
+            logger.info(f"Loading legacy index from {self.store_dir}")
+            segment = IndexSegment(self.store_dir, self.index_name, self.dim)
+            segment.load()
+            segment.sources = segment.scan_sources()
+            self.segments = [segment]
+            logger.info(f"Loaded {segment.summary_index.name} index with {len(segment)} chunks")
+    
+    def refresh(self):
+        """
+        @brief 加载磁盘上已发布的最新版本：未变化的段直接复用，新段加载并预热完成后才原子地切换，
+               切换前的检索继续使用旧版本；加载失败时保留当前版本
+        
+        @return bool: 切换到了新版本时返回True
+        """
+        # 构建完成与后台压缩完成都会触发刷新，串行执行以免较早读到的版本覆盖较新的版本
+        with self._refresh_lock:
+            if not self.segments_path.exists():
+                return False
+            try:
+                state = self._read_state()
+                if state.get("version", 0) == self.version:
+                    return False
+                segments = self._load_segments(state, warm=self.warm_on_refresh)
+            except Exception as e:
+                logger.error(f"Error loading new index version, keep serving version {self.version}: {str(e)}")
+                return False
+            
+            self._apply_state(state, segments)
+            logger.info(f"Switched to index version {self.version}: {len(segments)} segments, {len(self)} live chunks")
+            return True
     
-    def add_chunks(self, chunks, embeddings, progress_callback=None):
+    @property
+    def segments(self):
         """
-        @brief 将文本块及其对应的向量表示添加到Annoy索引中，并保存元数据
+        @brief 当前版本的段列表。整体替换（而不是原地修改）以保证正在检索的线程看到一致的快照
+        
+        @return list: 段列表
+        """
+        return self._segments
+    
+    @segments.setter
+    def segments(self, segments):
+        """
+        @brief 替换段列表：先获取新段的引用再释放旧段的引用，引用归零的被替换段随即删除
+        
+        @param segments (list): 新的段列表
+        """
+        with _refs_lock:
+            _acquire(segments)
+            released = _release(self._segments)
+            self._segments = segments
+        _remove_released(released)
+    
+    def close(self):
+        """
+        @brief 释放对当前段的引用，使被替换的段可以被回收；用于不再检索、也没有后台压缩在使用的实例
+        """
+        self.segments = []
+    
+    def __del__(self):
+        """
+        @brief 实例销毁时释放尚未释放的段引用
+        """
+        try:
+            self.close()
+        except Exception:
+            pass
+    
+    @contextmanager
+    def _reading(self):
+        """
+        @brief 检索期间持有当前段列表的引用，防止其文件在检索过程中被回收
+        
+        @return list: 段列表
+        """
+        with _refs_lock:
+            segments = self._segments
+            _acquire(segments)
+        try:
+            yield segments
+        finally:
+            with _refs_lock:
+                released = _release(segments)
+            _remove_released(released)
+    
+    def _read_state(self):
+        """
+        @brief 读取段清单
+        
+        @return dict: 段清单内容
+        """
+        with open(self.segments_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def _load_segments(self, state, warm=False):
+        """
+        @brief 按段清单构造段列表。段文件不可变，已加载的同名段只复制对象并更新墓碑，不重新读取文件
+        
+        @param state (dict): 段清单内容
+        @param warm (bool): 是否预热新加载的段
+        
+        @return list: 段列表
+        """
+        loaded = {segment.name: segment for segment in self.segments}
+        segments = []
+        for entry in state.get("segments", []):
+            previous = loaded.get(entry["name"])
+            if previous is not None:
+                segment = copy.copy(previous)
+            else:
+                segment = IndexSegment(self.store_dir, entry["name"], self.dim)
+                segment.load()
+                if warm:
+                    segment.warm()
+            segment.deleted = set(entry.get("deleted", []))
+            segment.sources = entry.get("sources") or segment.scan_sources()
+            segments.append(segment)
+        return segments
+    
+    def _apply_state(self, state, segments):
+        """
+        @brief 切换到新的段列表与段清单状态
+        
+        @param state (dict): 段清单内容
+        @param segments (list): 与段清单对应的段列表
+        """
+        # 先切换段再更新版本号：检索结果缓存以版本号为键，读到旧版本号的检索
+        # 只会把结果缓存在不再使用的旧键下，而不会把旧结果缓存在新版本号下
+        self.segments = segments
+        self.version = state.get("version", 0)
+        self._next_segment = state.get("next_segment", len(segments) + 1)
+        self._retired = state.get("retired", {})
+    
+    def exists(self):
+        """
+        @brief 判断磁盘上是否存在已保存的索引（段清单或旧版单一索引）
+        
+        @return bool: 存在时返回True
+        """
+        return self.segments_path.exists() or IndexSegment(self.store_dir, self.index_name, self.dim).exists()
+    
+    def __len__(self):
+        """
+        @brief 当前版本中未删除的条目数
+        
+        @return int: 条目数
+        """
+        return sum(segment.live_count for segment in self.segments)
+    
+    def add_chunks(self, chunks, embeddings, progress_callback=None, summary_embeddings=None):
+        """
+        @brief 全量构建：将全部文本块写入一个新段，并替换现有的所有段
         
         @param chunks (list): 文本块列表，每个元素包含文本、摘要等信息
         @param embeddings (list): 向量表示列表，与文本块一一对应
         @param progress_callback (function, optional): 进度回调函数，用于报告处理进度
+        @param summary_embeddings (np.ndarray, optional): 预先计算的摘要向量矩阵，与文本块一一对应；
+                                  缺失或无效的摘要向量以正文向量代替
         
         @return bool: 添加成功返回True，否则返回False
         """
         if not embeddings:
             logger.warning("No embeddings provided, skipping add_chunks")
             return False
-            
         
-        if self.index is None:
-            logger.warning("Index is None, creating new index")
-            self.index = AnnoyIndex(self.dim, self.distance_metric)
-        if self.summary_index is None:
-            logger.warning("Summary index is None, creating new summary index")
-            self.summary_index = AnnoyIndex(self.dim, self.distance_metric)
+        progress_callback = progress_callback or (lambda **kw: None)
+        items = self._prepare_chunks(chunks, embeddings, summary_embeddings, progress_callback)
+        if not items[1]:
+            self._report_empty(progress_callback)
+            return False
         
+        with _write_lock:
+            try:
+                replaced = self._reload_state(load_segments=False)
+            except Exception as e:
+                self._report_reload_error(e, progress_callback)
+                return False
+            segment = self._write_segment(items, progress_callback)
+            if segment is None:
+                return False
+            for name in replaced:
+                self._retired[name] = time.time()
+            self.segments = [segment]
+            self.save_index()
+        return True
+    
+    def merge_chunks(self, chunks, embeddings, removed_sources=(), progress_callback=None, summary_embeddings=None):
+        """
+        @brief 增量合并：为修改和删除文档的旧分块记录墓碑，新分块写入一个新的小段，
+               开销只与变更量相关；小段在后台压缩合并
         
+        @param chunks (list): 新增或修改文档的文本块列表
+        @param embeddings (list): 与chunks一一对应的向量表示
+        @param removed_sources (Iterable[str]): 需要移除旧分块的文档路径（修改或删除的文档）
+        @param progress_callback (function, optional): 进度回调函数，用于报告处理进度
+        @param summary_embeddings (np.ndarray, optional): 与chunks一一对应的预计算摘要向量
+        
+        @return bool: 合并成功返回True，否则返回False
+        """
         progress_callback = progress_callback or (lambda **kw: None)
+        excluded = set(removed_sources) | {chunk["source"] for chunk in chunks}
+        items = self._prepare_chunks(chunks, embeddings, summary_embeddings, progress_callback) if chunks else None
+        
+        with _write_lock:
+            try:
+                self._reload_state()
+            except Exception as e:
+                self._report_reload_error(e, progress_callback)
+                return False
+            
+            # 墓碑记录在段的副本上，新段写入成功后才替换段列表，失败时当前版本保持不变
+            deleted = 0
+            segments = []
+            for segment in self.segments:
+                rows = set()
+                for source in excluded:
+                    rows.update(segment.rows_for_source(source))
+                rows -= segment.deleted
+                if rows:
+                    segment = copy.copy(segment)
+                    segment.deleted = segment.deleted | rows
+                    deleted += len(rows)
+                segments.append(segment)
+            
+            if items is not None and items[1]:
+                segment = self._write_segment(items, progress_callback)
+                if segment is None:
+                    return False
+                segments.append(segment)
+            elif chunks:
+                self._report_empty(progress_callback)
+                return False
+            
+            logger.info(f"Merged {len(items[1]) if items else 0} new chunks, {deleted} chunks marked deleted")
+            self.segments = segments
+            self.save_index()
+        
+        self.maybe_compact(background=True)
+        return True
+    
+    def _reset_index(self):
+        """
+        @brief 清空段列表，进入构建状态
+        """
+        self.segments = []
+        self.version = 0
+        self._next_segment = 1
+        self._retired = {}
+    
+    def _reload_state(self, load_segments=True):
+        """
+        @brief 修改段清单前重新读取磁盘状态，避免覆盖其他实例（如后台压缩）已提交的修改。
+               读取失败时抛出异常：把无法读取的索引当作空索引继续写入会从发布的版本中丢掉全部已有分块
+        
+        @param load_segments (bool): 是否加载各段；全量替换只需要段名称和段清单状态，
+                                     旧段无法加载（如嵌入维度改变）时也可以替换
+        
+        @return list: 磁盘上当前版本的段名称
+        """
+        self.rebuild_mode = False
+        if load_segments:
+            self._load_published()
+            return [segment.name for segment in self.segments]
+        
+        if self.segments_path.exists():
+            state = self._read_state()
+            names = [entry["name"] for entry in state.get("segments", [])]
+        else:
+            state = {}
+            legacy = IndexSegment(self.store_dir, self.index_name, self.dim)
+            names = [self.index_name] if legacy.exists() else []
+        self._apply_state(state, [])
+        return names
+    
+    def _report_reload_error(self, error, progress_callback):
+        """
+        @brief 报告修改前读取现有索引失败，本次修改被放弃
+        
+        @param error (Exception): 读取时的异常
+        @param progress_callback (function | None): 进度回调函数
+        """
+        logger.error(f"Error reading the published index, aborting the update: {str(error)}")
+        if progress_callback:
+            progress_callback(
+                stage="index",
+                message="读取现有索引失败",
+                status="error"
+            )
+    
+    def _prepare_chunks(self, chunks, embeddings, summary_embeddings, progress_callback):
+        """
+        @brief 归一化新分块的正文向量与摘要向量，整个过程不产生网络请求
+        
+        @param chunks (list): 文本块列表
+        @param embeddings (list): 与文本块一一对应的向量表示
+        @param summary_embeddings (np.ndarray | None): 与文本块一一对应的摘要向量
+        @param progress_callback (function): 进度回调函数
+        
+        @return tuple: (元数据列表, 分块ID列表, 正文向量列表, 摘要向量列表)
+        """
         total_chunks = len(chunks)
         
         
@@ -113,11 +467,7 @@ class VectorStore:
         )
         
         
-        self.metadata = []
-        self.chunk_ids = []
-        
-        
-        valid_count = 0
+        metadata, chunk_ids, vectors, summary_vectors = [], [], [], []
         for i, (chunk, embedding) in enumerate(tqdm(zip(chunks, embeddings), desc="构建索引")):
             if not embedding or len(embedding) != self.dim:
                 logger.warning(f"Skipping invalid embedding for chunk {i}")
@@ -138,27 +488,23 @@ class VectorStore:
                     continue
                 
                 
-                self.index.add_item(valid_count, embedding_arr)
-                
-                
-                summary_embedding = self._get_summary_embedding(chunk["summary"])
-                if summary_embedding and len(summary_embedding) == self.dim:
-                    summary_arr = np.array(summary_embedding, dtype=np.float32)
-                    summary_norm = np.linalg.norm(summary_arr)
+                summary_arr = embedding_arr
+                if summary_embeddings is not None and i < len(summary_embeddings):
+                    candidate = np.asarray(summary_embeddings[i], dtype=np.float32)
+                    summary_norm = np.linalg.norm(candidate) if candidate.shape == (self.dim,) else 0
                     if summary_norm > 0:
-                        summary_arr = summary_arr / summary_norm
-                    self.summary_index.add_item(valid_count, summary_arr)
-                else:
-                    
-                    self.summary_index.add_item(valid_count, embedding_arr)
+                        summary_arr = candidate / summary_norm
                 
-                self.metadata.append({
+                chunk_data = {
                     "text": chunk["text"],
                     "summary": chunk["summary"],
                     "source": chunk["source"]
-                })
-                self.chunk_ids.append(chunk["chunk_id"])
-                valid_count += 1
+                }
+                chunk_data.update({key: chunk[key] for key in LOCATOR_KEYS if key in chunk})
+                metadata.append(chunk_data)
+                chunk_ids.append(chunk["chunk_id"])
+                vectors.append(embedding_arr)
+                summary_vectors.append(summary_arr)
                 
                 
                 if (i + 1) % 10 == 0 or (i + 1) == total_chunks:
@@ -167,31 +513,54 @@ class VectorStore:
                         current=i + 1,
                         total=total_chunks,
                         message=f"正在添加文本块 {i+1}/{total_chunks}",
-                        details=f"有效块: {valid_count}"
+                        details=f"有效块: {len(chunk_ids)}"
                     )
             except Exception as e:
                 logger.error(f"Error adding chunk {i}: {str(e)}")
+        return metadata, chunk_ids, vectors, summary_vectors
+    
+    def _report_empty(self, progress_callback):
+        """
+        @brief 报告没有可写入的有效嵌入
         
-        if valid_count == 0:
-            logger.error("No valid embeddings added to index")
-            progress_callback(
-                stage="index",
-                message="未添加有效嵌入",
-                status="error"
-            )
-            return False
-            
+        @param progress_callback (function): 进度回调函数
+        """
+        logger.error("No valid embeddings added to index")
+        progress_callback(
+            stage="index",
+            message="未添加有效嵌入",
+            status="error"
+        )
+    
+    def _write_segment(self, items, progress_callback):
+        """
+        @brief 将准备好的条目构建为一个新段并保存到磁盘（后端按段内条目数选择）
         
-        logger.info(f"Building index with {valid_count} items...")
+        @param items (tuple): _prepare_chunks返回的(元数据, 分块ID, 正文向量, 摘要向量)
+        @param progress_callback (function): 进度回调函数
+        
+        @return IndexSegment | None: 新段，构建失败时返回None
+        """
+        metadata, chunk_ids, vectors, summary_vectors = items
+        name = f"{self.index_name}_seg{self._next_segment:06d}"
+        self._next_segment += 1
+        logger.info(f"Building segment {name} with {len(chunk_ids)} items...")
         progress_callback(
             stage="index",
             message="正在构建索引结构...",
-            details=f"共 {valid_count} 个项目"
+            details=f"共 {len(chunk_ids)} 个项目，段: {name}"
         )
         
         try:
-            self.index.build(10)
-            self.summary_index.build(10)
+            segment = IndexSegment.write(
+                self.store_dir,
+                name,
+                self.dim,
+                metadata,
+                chunk_ids,
+                np.array(vectors, dtype=np.float32).reshape(-1, self.dim),
+                np.array(summary_vectors, dtype=np.float32).reshape(-1, self.dim)
+            )
         except Exception as e:
             logger.error(f"Error building index: {str(e)}")
             progress_callback(
@@ -199,128 +568,305 @@ class VectorStore:
                 message="索引构建失败",
                 status="error"
             )
-            return False
+            return None
         
-        logger.info("Index built successfully")
+        logger.info(f"Segment {name} built with {segment.summary_index.name} backend")
         progress_callback(
             stage="index",
             message="索引构建完成",
             status="completed"
         )
+        return segment
+    
+    def maybe_compact(self, background=False):
+        """
+        @brief 小段数量达到阈值或段内删除比例过高时压缩合并
         
+        @param background (bool): 是否在后台线程中执行
+        
+        @return bool: 同步执行时返回是否发生了压缩；后台执行时返回是否启动了线程
+        """
+        if not self._compaction_candidates():
+            return False
+        if not background:
+            return self.compact()
         
-        self.save_index()
+        thread = threading.Thread(target=self.compact, name="segment-compaction", daemon=True)
+        VectorStore._compaction_threads = [t for t in VectorStore._compaction_threads if t.is_alive()] + [thread]
+        thread.start()
         return True
-
-    def _get_summary_embedding(self, summary: str) -> list:
+    
+    @classmethod
+    def add_compaction_listener(cls, callback):
         """
-        @brief 为输入的摘要文本生成对应的向量表示
+        @brief 注册压缩完成后的回调；压缩在构建所用的实例上进行，其他实例（如服务中的检索器）
+               通过回调得知新版本已发布
         
-        @param summary (str): 需要生成向量的摘要文本
+        @param callback (function): 无参回调，在压缩发布新版本后于压缩线程中调用
+        """
+        cls._compaction_listeners.append(callback)
+    
+    @classmethod
+    def remove_compaction_listener(cls, callback):
+        """
+        @brief 注销压缩完成后的回调
         
-        @return list: 摘要的向量表示，失败时返回None
+        @param callback (function): 之前注册的回调
         """
-        try:
+        if callback in cls._compaction_listeners:
+            cls._compaction_listeners.remove(callback)
+    
+    @classmethod
+    def wait_for_compaction(cls, timeout=None):
+        """
+        @brief 等待后台压缩线程结束，供命令行工具在退出前调用
+        
+        @param timeout (float, optional): 每个线程的最长等待时间（秒）
+        """
+        for thread in list(cls._compaction_threads):
+            thread.join(timeout)
+    
+    def _compaction_candidates(self):
+        """
+        @brief 选出需要压缩的段
+        
+        @return list: 需要合并的段；不满足触发条件时为空
+        """
+        small = [segment for segment in self.segments if segment.live_count < self.small_segment_items]
+        dirty = [
+            segment for segment in self.segments
+            if len(segment) and len(segment.deleted) / len(segment) > self.max_deleted_ratio
+        ]
+        if len(small) < self.min_small_segments:
+            small = []
+        return [segment for segment in self.segments if segment in small or segment in dirty]
+    
+    def compact(self):
+        """
+        @brief 把小段和删除比例过高的段合并为一个新段，丢弃已删除的条目；
+               被替换的段在宽限期后由垃圾回收删除
+        
+        @return bool: 发生了压缩返回True
+        """
+        with _write_lock:
+            try:
+                self._reload_state()
+            except Exception as e:
+                self._report_reload_error(e, None)
+                return False
+            candidates = self._compaction_candidates()
+            if not candidates:
+                return False
             
-            from RAG.embeddings import EmbeddingModel
-            embedding_model = EmbeddingModel()
-            if summary and summary.strip():
-                return embedding_model.embed_texts([summary])[0]
-            return None
-        except ImportError as e:
-            logger.error(f"导入EmbeddingModel失败: {str(e)}")
-            return None
-        except Exception as e:
-            logger.error(f"生成摘要嵌入失败: {str(e)}")
-            return None
+            metadata, chunk_ids, vectors, summary_vectors = [], [], [], []
+            for segment in candidates:
+                segment_metadata, segment_ids, segment_vectors, segment_summary = segment.live_items()
+                metadata.extend(segment_metadata)
+                chunk_ids.extend(segment_ids)
+                vectors.append(segment_vectors)
+                summary_vectors.append(segment_summary)
+            vectors = np.concatenate(vectors)
+            summary_vectors = np.concatenate(summary_vectors)
+            
+            logger.info(f"Compacting {len(candidates)} segments into one with {len(chunk_ids)} live chunks")
+            merged = None
+            if chunk_ids:
+                merged = self._write_segment((metadata, chunk_ids, vectors, summary_vectors), lambda **kw: None)
+                if merged is None:
+                    return False
+            
+            # 合并后的段放在原先第一个被合并段的位置，保持段顺序稳定
+            segments = []
+            for segment in self.segments:
+                if segment not in candidates:
+                    segments.append(segment)
+                    continue
+                self._retired[segment.name] = time.time()
+                if merged is not None:
+                    segments.append(merged)
+                    merged = None
+            self.segments = segments
+            self.save_index()
+        
+        # 在写锁外通知，回调加载新版本时不阻塞其他写入
+        for callback in list(VectorStore._compaction_listeners):
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Compaction listener failed: {str(e)}")
+        return True
+    
+    def _collect_garbage(self):
+        """
+        @brief 删除已超过宽限期的被替换段文件，以及中断的构建遗留的孤立段文件
+        """
+        now = time.time()
+        live = {segment.name for segment in self.segments}
+        for name, retired_at in list(self._retired.items()):
+            if name in live:
+                del self._retired[name]
+                continue
+            if now - retired_at < self.gc_grace_seconds:
+                continue
+            segment = IndexSegment(self.store_dir, name, self.dim)
+            with _refs_lock:
+                if _segment_refs.get(str(segment.store_dir / name), 0) > 0:
+                    # 仍有检索器在使用旧版本，引用释放时再删除
+                    _release_pending[str(segment.store_dir / name)] = segment
+                    continue
+            if self._remove_segment_files(segment.files()):
+                del self._retired[name]
+        
+        prefix = f"{self.index_name}_seg"
+        orphans = []
+        for path in self.store_dir.glob(f"{prefix}*"):
+            name = prefix + path.name[len(prefix):].split("_", 1)[0].split(".", 1)[0]
+            if name in live or name in self._retired or _is_referenced(self.store_dir, name):
+                continue
+            if now - path.stat().st_mtime >= self.gc_grace_seconds:
+                orphans.append(path)
+        self._remove_segment_files(orphans)
+    
+    def _remove_segment_files(self, paths):
+        """
+        @brief 删除段文件
+        
+        @param paths (list): 文件路径
+        
+        @return bool: 全部删除成功返回True
+        """
+        success = True
+        for path in paths:
+            try:
+                path.unlink()
+                logger.info(f"Removed stale segment file {path}")
+            except OSError as e:
+                logger.warning(f"Failed to remove segment file {path}: {str(e)}")
+                success = False
+        return success
 
     def similarity_search(self, query_embedding, top_k=5):
         """
-        @brief 在向量索引中查找与查询向量最相似的文本块
+        @brief 在所有段中查找与查询向量最相似的文本块，合并各段结果后取前top_k个
         
         @param query_embedding (list): 查询文本的向量表示
         @param top_k (int): 返回最相似结果的数量，默认为5
         
         @return list: 相似度搜索结果列表，每个元素包含相似度分数、块ID和元数据
         """
-        if self.index is None or self.summary_index is None:
-            logger.warning("Index is None, cannot perform search")
-            return []
+        # 检索期间持有当前版本的引用，期间发生的版本切换不影响本次检索
+        with self._reading() as segments:
+            if not segments:
+                logger.warning("Index is None, cannot perform search")
+                return []
             
-        if not query_embedding or len(query_embedding) != self.dim:
-            logger.error(f"Invalid query embedding: expected dim={self.dim}, got {len(query_embedding) if query_embedding else 'none'}")
-            return []
+            query_embedding_arr = self._normalize_query(query_embedding)
+            if query_embedding_arr is None:
+                return []
             
+            # 每个段独立取摘要候选并用正文向量重新打分，再按分数合并
+            hits = []
+            for segment in segments:
+                try:
+                    rows, scores = segment.search(query_embedding_arr, top_k * self.candidate_multiplier)
+                except Exception as e:
+                    logger.error(f"Error searching segment {segment.name}: {str(e)}")
+                    continue
+                hits.extend((float(score), segment, int(row)) for row, score in zip(rows, scores))
+            
+            hits.sort(key=lambda hit: -hit[0])
+            return [
+                (score, segment.chunk_ids[row], segment.metadata[row])
+                for score, segment, row in hits[:top_k]
+            ]
+    
+    def similarity_search_batch(self, query_embeddings, top_k=5):
+        """
+        @brief 批量相似度搜索：各段对全部查询批量取候选、一次性重新打分，结果格式与similarity_search相同
         
-        try:
-            query_embedding = [float(x) for x in query_embedding]
-        except Exception as e:
-            logger.error(f"Error converting query embedding: {str(e)}")
-            return []
-        
+        @param query_embeddings (list): 查询向量列表
+        @param top_k (int): 每个查询返回的结果数量，默认为5
         
-        query_embedding_arr = np.array(query_embedding, dtype=np.float32)
-        query_norm = np.linalg.norm(query_embedding_arr)
-        if query_norm > 0:
-            query_embedding_arr = query_embedding_arr / query_norm
-        else:
+        @return list: 与查询一一对应的结果列表，无效查询对应空列表
+        """
+        results = [[] for _ in query_embeddings]
+        # 检索期间持有当前版本的引用，期间发生的版本切换不影响本次检索
+        with self._reading() as segments:
+            if not segments:
+                logger.warning("Index is None, cannot perform search")
+                return results
+            
+            valid = []
+            query_rows = []
+            for i, query_embedding in enumerate(query_embeddings):
+                if query_embedding is None:
+                    continue
+                query_embedding_arr = self._normalize_query(query_embedding)
+                if query_embedding_arr is not None:
+                    valid.append(i)
+                    query_rows.append(query_embedding_arr)
+            if not valid:
+                return results
+            queries = np.stack(query_rows)
+            
+            hits = [[] for _ in valid]
+            for segment in segments:
+                try:
+                    segment_results = segment.search_batch(queries, top_k * self.candidate_multiplier)
+                except Exception as e:
+                    logger.error(f"Error searching segment {segment.name}: {str(e)}")
+                    continue
+                for query_hits, (rows, scores) in zip(hits, segment_results):
+                    query_hits.extend((float(score), segment, int(row)) for row, score in zip(rows, scores))
             
-            query_embedding_arr = np.zeros(self.dim, dtype=np.float32)
+            for i, query_hits in zip(valid, hits):
+                query_hits.sort(key=lambda hit: -hit[0])
+                results[i] = [
+                    (score, segment.chunk_ids[row], segment.metadata[row])
+                    for score, segment, row in query_hits[:top_k]
+                ]
+            return results
+    
+    def _normalize_query(self, query_embedding):
+        """
+        @brief 校验并归一化查询向量
         
+        @param query_embedding (list): 查询文本的向量表示
+        
+        @return np.ndarray | None: 归一化的float32向量，无效时返回None
+        """
+        if query_embedding is None or len(query_embedding) != self.dim:
+            logger.error(f"Invalid query embedding: expected dim={self.dim}, got {len(query_embedding) if query_embedding is not None else 'none'}")
+            return None
+            
         
         try:
-            summary_indices, summary_distances = self.summary_index.get_nns_by_vector(
-                query_embedding_arr, 
-                top_k * 3,  
-                include_distances=True,
-                search_k=-1
-            )
+            query_embedding_arr = np.array([float(x) for x in query_embedding], dtype=np.float32)
         except Exception as e:
-            logger.error(f"Error in summary similarity search: {str(e)}")
-            summary_indices, summary_distances = [], []
-        
+            logger.error(f"Error converting query embedding: {str(e)}")
+            return None
         
-        results = []
-        for idx, angular_dist in zip(summary_indices, summary_distances):
-            if idx < len(self.metadata) and idx < len(self.chunk_ids):
-                
-                cosine_sim = 1 - (angular_dist ** 2) / 2.0
-                cosine_sim = max(-1.0, min(1.0, cosine_sim))
-                
-                
-                try:
-                    item_vector = self.index.get_item_vector(idx)
-                    main_cosine_sim = np.dot(query_embedding_arr, item_vector)
-                    main_cosine_sim = max(-1.0, min(1.0, main_cosine_sim))
-                except:
-                    main_cosine_sim = cosine_sim
-                
-                
-                results.append((
-                    main_cosine_sim,  
-                    self.chunk_ids[idx], 
-                    self.metadata[idx],
-                    cosine_sim  
-                ))
         
+        query_norm = np.linalg.norm(query_embedding_arr)
+        if query_norm > 0:
+            return query_embedding_arr / query_norm
         
-        sorted_results = sorted(results, key=lambda x: x[0], reverse=True)[:top_k]
-        return [(score, chunk_id, data) for score, chunk_id, data, _ in sorted_results]
+        return np.zeros(self.dim, dtype=np.float32)
     
     def save_index(self):
         """
-        @brief 将当前的向量索引和元数据保存到磁盘文件中
+        @brief 原子地写入段清单（段列表、删除墓碑、版本号），随后回收过期的段文件
         """
-        if self.index is None or self.summary_index is None:
-            logger.warning("Index is None, cannot save")
-            return
-            
-        self.index.save(str(self.index_path))
-        self.summary_index.save(str(self.summary_index_path))
-        
-        with open(self.metadata_path, 'w', encoding='utf-8') as f:
-            json.dump({
-                "chunks": self.metadata,
-                "chunk_ids": self.chunk_ids
-            }, f, ensure_ascii=False, indent=2)
-        logger.info(f"Saved Annoy index with {len(self.metadata)} chunks")
\ No newline at end of file
+        self.version += 1
+        self._collect_garbage()
+        state = {
+            "version": self.version,
+            "next_segment": self._next_segment,
+            "segments": [segment.to_entry() for segment in self.segments],
+            "retired": self._retired
+        }
+        tmp_path = self.segments_path.with_suffix(self.segments_path.suffix + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.segments_path)
+        logger.info(f"Saved index version {self.version}: {len(self.segments)} segments, {len(self)} live chunks")
@@ -1,6 +1,9 @@
+import json
 import requests
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator
 from RAG import initialize_rag_system
+from RAG.async_http import get_async_client, track_upstream
+from RAG.cache import get_answer_cache, text_hash
 from config import SERVICE_CONFIG
 
 class AIService:
@@ -17,8 +20,10 @@ class AIService:
         self.model_type = config.get('model_type', 'ollama')
         self.model_name = config.get('model_name', 'qwen:7b')
         self.ollama_host = SERVICE_CONFIG["ollama_host"]
-        self.embedding_timeout = SERVICE_CONFIG["embedding_timeout"]
-        self.rag_retriever = initialize_rag_system()
+        self.generation_timeout = SERVICE_CONFIG.get("generation_timeout", 300)
+        # 索引不存在时不在这里构建，由服务的后台构建任务负责
+        self.rag_retriever = initialize_rag_system(build_missing=False)
+        self.answer_cache = get_answer_cache()
         
     def generate_response(self, prompt: str, use_rag: bool = False, use_rerank: bool = None) -> str:
         """
@@ -29,18 +34,160 @@ class AIService:
         @return AI生成的回复内容
         """
         rag_context = None
+        context_ids = []
         if use_rag:
-            rag_context = self.rag_retriever.retrieve(prompt, use_rerank=use_rerank)
+            rag_context, context_ids = self.rag_retriever.retrieve_context(prompt, use_rerank=use_rerank)
+        
+        query_embedding = None
+        if self.answer_cache is not None:
+            query_embedding = self.rag_retriever.embed_query(prompt)
+            cached = self._lookup_answer(query_embedding, use_rag, use_rerank, context_ids)
+            if cached is not None:
+                return cached
+        
+        full_prompt = self._build_prompt(prompt, rag_context)
+        
+        if self.model_type == 'ollama':
+            response = self._call_ollama(full_prompt)
+        elif self.model_type == 'openai':
+            response = self._call_openai(full_prompt)
+        else:
+            return f"Unsupported model type: {self.model_type}"
+        
+        self._store_answer(query_embedding, use_rag, use_rerank, context_ids, response)
+        return response
+    
+    async def agenerate_response(self, prompt: str, use_rag: bool = False, use_rerank: bool = None) -> str:
+        """
+        @brief generate_response的异步版本，检索与生成请求都不阻塞事件循环，多个对话请求可以并发处理
+        @param prompt 用户输入的提示词
+        @param use_rag 是否使用RAG检索增强生成
+        @param use_rerank 是否使用重排序
+        @return AI生成的回复内容
+        """
+        rag_context = None
+        context_ids = []
+        if use_rag:
+            rag_context, context_ids = await self.rag_retriever.aretrieve_context(prompt, use_rerank=use_rerank)
+        
+        query_embedding = None
+        if self.answer_cache is not None:
+            query_embedding = await self.rag_retriever.aembed_query(prompt)
+            cached = self._lookup_answer(query_embedding, use_rag, use_rerank, context_ids)
+            if cached is not None:
+                return cached
         
         full_prompt = self._build_prompt(prompt, rag_context)
         
         if self.model_type == 'ollama':
-            return self._call_ollama(full_prompt)
+            response = await self._acall_ollama(full_prompt)
         elif self.model_type == 'openai':
-            return self._call_openai(full_prompt)
+            response = self._call_openai(full_prompt)
         else:
             return f"Unsupported model type: {self.model_type}"
         
+        self._store_answer(query_embedding, use_rag, use_rerank, context_ids, response)
+        return response
+    
+    async def astream_response(self, prompt: str, use_rag: bool = False, use_rerank: bool = None) -> AsyncIterator[str]:
+        """
+        @brief 流式生成AI回复，Ollama生成的token到达后立即逐段产出
+        @param prompt 用户输入的提示词
+        @param use_rag 是否使用RAG检索增强生成
+        @param use_rerank 是否使用重排序
+        @return 回复文本片段的异步迭代器，出错时最后一段以"Error:"开头
+        """
+        rag_context = None
+        context_ids = []
+        if use_rag:
+            rag_context, context_ids = await self.rag_retriever.aretrieve_context(prompt, use_rerank=use_rerank)
+        
+        query_embedding = None
+        if self.answer_cache is not None:
+            query_embedding = await self.rag_retriever.aembed_query(prompt)
+            cached = self._lookup_answer(query_embedding, use_rag, use_rerank, context_ids)
+            if cached is not None:
+                yield cached
+                return
+        
+        full_prompt = self._build_prompt(prompt, rag_context)
+        
+        if self.model_type == 'ollama':
+            chunks = []
+            try:
+                async for token in self._astream_ollama(full_prompt):
+                    chunks.append(token)
+                    yield token
+            except Exception as e:
+                yield f"Error: {str(e)}"
+                return
+            response = "".join(chunks)
+        elif self.model_type == 'openai':
+            response = self._call_openai(full_prompt)
+            yield response
+        else:
+            yield f"Unsupported model type: {self.model_type}"
+            return
+        
+        self._store_answer(query_embedding, use_rag, use_rerank, context_ids, response)
+    
+    def _answer_scope(self, use_rag: bool, use_rerank: bool) -> tuple:
+        """
+        @brief 语义缓存按模型、是否使用RAG及索引版本划分作用域，索引更新后旧回答不再命中
+        @param use_rag 是否使用RAG检索增强生成
+        @param use_rerank 是否使用重排序
+        @return 缓存作用域元组
+        """
+        return (
+            self.model_type,
+            self.model_name,
+            bool(use_rag),
+            bool(use_rerank) if use_rag else None,
+            self.rag_retriever.vector_store.version if use_rag else None
+        )
+    
+    def _lookup_answer(self, query_embedding, use_rag: bool, use_rerank: bool, context_ids: List[str]) -> Optional[str]:
+        """
+        @brief 在语义回答缓存中查找相近问题、且基于相同上下文生成的回答；因此RAG请求先检索再查缓存
+        @param query_embedding 问题向量
+        @param use_rag 是否使用RAG检索增强生成
+        @param use_rerank 是否使用重排序
+        @param context_ids 本次检索到的上下文分块ID
+        @return 命中时返回缓存的回答，否则返回None
+        """
+        cached = self.answer_cache.lookup(
+            query_embedding,
+            self._answer_scope(use_rag, use_rerank),
+            self._context_fingerprint(context_ids)
+        )
+        return cached["answer"] if cached is not None else None
+    
+    def _store_answer(self, query_embedding, use_rag: bool, use_rerank: bool, context_ids: List[str], response: str):
+        """
+        @brief 将成功生成的回答写入语义回答缓存
+        @param query_embedding 问题向量，为None时不缓存
+        @param use_rag 是否使用RAG检索增强生成
+        @param use_rerank 是否使用重排序
+        @param context_ids 生成时使用的上下文分块ID
+        @param response 生成的回答
+        """
+        if query_embedding is not None and response and not response.startswith("Error:"):
+            self.answer_cache.put(
+                query_embedding,
+                self._answer_scope(use_rag, use_rerank),
+                self._context_fingerprint(context_ids),
+                response
+            )
+    
+    def _context_fingerprint(self, context_ids: List[str]) -> str:
+        """
+        @brief 以上下文分块ID的有序列表作为上下文指纹；措辞相近的问题检索到相同分块时，
+               即使相似度分数略有不同也能命中
+        @param context_ids 上下文分块ID
+        @return 指纹字符串
+        """
+        return text_hash("\n".join(context_ids))
+        
     def _build_prompt(self, prompt: str, context: Optional[str]) -> str:
         """
         @brief 构建最终提示词，整合RAG内容
@@ -79,11 +226,56 @@ class AIService:
                 "prompt": prompt,
                 "stream": False
             }
-            response = requests.post(url, json=payload, timeout=self.embedding_timeout)
+            response = requests.post(url, json=payload, timeout=self.generation_timeout)
+            return response.json().get("response", "")
+        except Exception as e:
+            return f"Error: {str(e)}"
+    
+    async def _acall_ollama(self, prompt: str) -> str:
+        """
+        @brief 通过共享的异步HTTP客户端调用本地Ollama服务
+        @param prompt 完整的提示词
+        @return AI模型的回复内容
+        """
+        try:
+            url = f"{self.ollama_host}/api/generate"
+            payload = {
+                "model": self.model_name,
+                "prompt": prompt,
+                "stream": False
+            }
+            async with track_upstream("generate"):
+                response = await get_async_client().post(url, json=payload, timeout=self.generation_timeout)
             return response.json().get("response", "")
         except Exception as e:
             return f"Error: {str(e)}"
     
+    async def _astream_ollama(self, prompt: str) -> AsyncIterator[str]:
+        """
+        @brief 以流式模式调用本地Ollama服务，逐行解析NDJSON响应
+        @param prompt 完整的提示词
+        @return 生成token的异步迭代器
+        """
+        url = f"{self.ollama_host}/api/generate"
+        payload = {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": True
+        }
+        async with track_upstream("generate"), \
+                get_async_client().stream("POST", url, json=payload, timeout=self.generation_timeout) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                if "error" in data:
+                    raise RuntimeError(data["error"])
+                if data.get("response"):
+                    yield data["response"]
+                if data.get("done"):
+                    break
+    
     def _call_openai(self, prompt: str) -> str:
         """
         @brief 调用OpenAI API（预留）
@@ -93,6 +285,15 @@ class AIService:
         # 实际使用时替换为真实API调用
         return f"OpenAI response to: {prompt}"
     
+    def cache_stats(self) -> Dict[str, Any]:
+        """
+        @brief 汇总检索缓存与语义回答缓存的命中统计
+        @return 各缓存的统计信息，未启用的缓存为None
+        """
+        stats = self.rag_retriever.cache_stats()
+        stats["answer"] = self.answer_cache.stats() if self.answer_cache is not None else None
+        return stats
+    
     def update_config(self, new_config: Dict[str, Any]):
         """
         @brief 更新服务配置
@@ -101,5 +302,7 @@ class AIService:
         self.config.update(new_config)
         self.model_type = self.config.get('model_type', self.model_type)
         self.model_name = self.config.get('model_name', self.model_name)
-        # 重新初始化 Retriever
-        self.rag_retriever = initialize_rag_system()
\ No newline at end of file
+        # 重新初始化 Retriever，并释放旧检索器持有的段引用
+        old_retriever = self.rag_retriever
+        self.rag_retriever = initialize_rag_system(build_missing=False)
+        old_retriever.close()
\ No newline at end of file
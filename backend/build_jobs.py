@@ -0,0 +1,216 @@
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional
+
+from RAG import build_vector_store
+from config import SERVICE_CONFIG
+
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class BuildJob:
+    """
+    @brief 一次向量库构建任务，记录状态与build_vector_store报告的进度事件
+    """
+
+    def __init__(self, full_rebuild: bool, max_events: int):
+        """
+        @brief 初始化排队中的构建任务
+        @param full_rebuild (bool): 是否全量重建
+        @param max_events (int): 保留的最近进度事件数
+        """
+        self.id = uuid.uuid4().hex[:12]
+        self.full_rebuild = full_rebuild
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.reload_status: Optional[str] = None
+        self.reload_error: Optional[str] = None
+        self.coalesced = 0
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._events = deque(maxlen=max_events)
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        """
+        @brief 任务是否已结束（成功或失败）
+        @return bool: 已结束时返回True
+        """
+        return self.status in ("succeeded", "failed")
+
+    def record(self, **kwargs):
+        """
+        @brief 作为build_vector_store的progress_callback，记录一条进度事件
+        @param kwargs (dict): 进度信息：stage、total、current、message、details、status
+        """
+        with self._lock:
+            self._seq += 1
+            self._events.append({"seq": self._seq, "time": time.time(), **kwargs})
+
+    def events_since(self, seq: int = 0) -> List[Dict[str, Any]]:
+        """
+        @brief 获取序号大于seq的进度事件
+        @param seq (int): 调用方已收到的最后一个事件序号
+        @return List[Dict[str, Any]]: 进度事件列表，过早的事件可能已被丢弃
+        """
+        with self._lock:
+            return [event for event in self._events if event["seq"] > seq]
+
+    def run(self, on_success: Optional[Callable[[], None]] = None):
+        """
+        @brief 执行构建，成功后调用on_success（例如重新加载检索器）。构建状态与重新加载状态分别记录：
+               构建已发布新版本后重新加载失败，任务仍是succeeded，失败记录在reload_status中
+        @param on_success (Callable[[], None], optional): 构建成功后的回调
+        """
+        self.status = "running"
+        self.started_at = time.time()
+        try:
+            success = build_vector_store(progress_callback=self.record, full_rebuild=self.full_rebuild)
+        except Exception as e:
+            logger.error(f"Build job {self.id} failed: {str(e)}")
+            success = False
+            self.error = str(e)
+
+        if not success:
+            self.error = self.error or self._failure_reason()
+        elif on_success is not None:
+            try:
+                on_success()
+                self.reload_status = "succeeded"
+            except Exception as e:
+                logger.error(f"Reloading after build job {self.id} failed: {str(e)}")
+                self.reload_status = "failed"
+                self.reload_error = str(e)
+        # 重新加载结束后才标记为结束，轮询方看到succeeded时检索器已切换到新版本
+        self.finished_at = time.time()
+        self.status = "succeeded" if success else "failed"
+
+    def _failure_reason(self) -> str:
+        """
+        @brief 构建返回失败时，以最后一条错误进度事件的消息作为失败原因
+        @return str: 失败原因
+        """
+        with self._lock:
+            errors = [event for event in self._events if event.get("status") == "error"]
+        if errors:
+            return errors[-1].get("message") or "build failed"
+        return "build failed"
+
+    def to_dict(self, since: Optional[int] = None) -> Dict[str, Any]:
+        """
+        @brief 任务状态的字典表示
+        @param since (int, optional): 提供时附带序号大于since的进度事件
+        @return Dict[str, Any]: 状态字典
+        """
+        with self._lock:
+            last_seq = self._seq
+        info = {
+            "job_id": self.id,
+            "status": self.status,
+            "full_rebuild": self.full_rebuild,
+            "coalesced": self.coalesced,
+            "error": self.error,
+            "reload_status": self.reload_status,
+            "reload_error": self.reload_error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "last_seq": last_seq
+        }
+        if since is not None:
+            info["events"] = self.events_since(since)
+        return info
+
+
+class BuildJobManager:
+    """
+    @brief 后台构建任务队列：同一时间只运行一个构建，运行期间到达的请求合并为一个排队任务
+    """
+
+    def __init__(self, on_success: Optional[Callable[[], None]] = None):
+        """
+        @brief 初始化任务管理器
+        @param on_success (Callable[[], None], optional): 每次构建成功后的回调
+        """
+        config = SERVICE_CONFIG.get("build_jobs", {})
+        self.history = config.get("history", 50)
+        self.max_events = config.get("max_events", 2000)
+        self.on_success = on_success
+        self._jobs: "OrderedDict[str, BuildJob]" = OrderedDict()
+        self._queued: Optional[BuildJob] = None
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, full_rebuild: bool = False) -> BuildJob:
+        """
+        @brief 提交构建请求；已有排队任务时合并进去（任一请求要求全量重建则全量重建），否则新建任务
+        @param full_rebuild (bool): 是否全量重建
+        @return BuildJob: 负责本次请求的任务
+        """
+        with self._lock:
+            job = self._queued
+            if job is not None:
+                job.full_rebuild = job.full_rebuild or full_rebuild
+                job.coalesced += 1
+            else:
+                # 正在运行的构建可能没有看到新文档，因此排队一个新任务而不是直接合并到运行中的任务
+                job = BuildJob(full_rebuild, self.max_events)
+                self._jobs[job.id] = job
+                self._queued = job
+                self._trim_history()
+
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="index-build", daemon=True)
+                self._worker.start()
+            return job
+
+    def get(self, job_id: str) -> Optional[BuildJob]:
+        """
+        @brief 按id查找任务
+        @param job_id (str): 任务id
+        @return Optional[BuildJob]: 任务，不存在或已从历史中移除时返回None
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        """
+        @brief 列出历史中的任务，最新的在前
+        @return List[Dict[str, Any]]: 任务状态字典列表
+        """
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict() for job in reversed(jobs)]
+
+    def _run(self):
+        """
+        @brief 工作线程：依次执行排队的任务，队列为空时退出
+        """
+        while True:
+            with self._lock:
+                job = self._queued
+                if job is None:
+                    self._worker = None
+                    return
+                self._queued = None
+
+            logger.info(f"Build job {job.id} started (full_rebuild={job.full_rebuild}, coalesced={job.coalesced})")
+            job.run(self.on_success)
+            logger.info(f"Build job {job.id} {job.status} in {job.finished_at - job.started_at:.1f}s")
+
+    def _trim_history(self):
+        """
+        @brief 丢弃超出历史上限的已结束任务
+        """
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished]:
+            if len(self._jobs) <= self.history:
+                break
+            del self._jobs[job_id]
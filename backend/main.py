@@ -1,18 +1,26 @@
 # backend/main.py
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
+from fastapi.responses import FileResponse, StreamingResponse, Response
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import json
 import sys
+from contextlib import aclosing
 from pathlib import Path
+from typing import List
 from config import SERVICE_CONFIG
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 sys.path.append(str(BASE_DIR / "backend"))
 
 from ai_service import AIService
-from RAG import initialize_rag_system, build_vector_store
+from build_jobs import BuildJobManager
+from request_guard import guard_request
+from RAG import VectorStore
+from RAG.async_http import close_async_client, cancellation_stats
 
 app = FastAPI()
 
@@ -29,7 +37,43 @@ app.add_middleware(
 
 # 初始化服务
 ai_config = {"model_type": "ollama", "model_name": "qwen:7b"}
-ai_service = AIService(ai_config)
+ai_service: AIService = None
+
+@app.on_event("startup")
+def startup():
+    """
+    @brief 服务启动时初始化AI服务并加载索引，索引不存在时提交后台构建任务；文档解析子进程以
+           forkserver/spawn方式重新导入本模块，放在启动事件中可避免子进程重复加载索引
+    """
+    global ai_service
+    ai_service = AIService(ai_config)
+    # 后台压缩在构建任务结束后才发布新版本，由监听回调切换检索器
+    VectorStore.add_compaction_listener(reload_retriever)
+    submit_missing_index_build()
+
+def submit_missing_index_build():
+    """
+    @brief 索引不存在时提交后台构建任务；服务中的构建都经过任务队列，同一时间只运行一个
+    """
+    if not ai_service.rag_retriever.vector_store.exists():
+        build_jobs.submit()
+
+def reload_retriever():
+    """
+    @brief 构建成功或后台压缩完成后切换到新发布的索引版本：新段加载并预热完成前，检索继续使用旧版本
+    """
+    ai_service.rag_retriever.vector_store.refresh()
+
+# 后台构建任务，同一时间只运行一个构建
+build_jobs = BuildJobManager(on_success=reload_retriever)
+
+@app.on_event("shutdown")
+async def shutdown():
+    """
+    @brief 服务停止时注销压缩回调并关闭共享的异步HTTP客户端
+    """
+    VectorStore.remove_compaction_listener(reload_retriever)
+    await close_async_client()
 
 class ChatRequest(BaseModel):
     """
@@ -43,22 +87,107 @@ class ChatRequest(BaseModel):
     use_rerank: bool = False  # 新增重排序参数
 
 @app.post("/chat")
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(request: ChatRequest, http_request: Request):
     """
     @brief 处理聊天请求的端点
     @param request ChatRequest对象，包含用户消息和配置选项
+    @param http_request 原始HTTP请求，用于检测客户端断开
     @return 返回AI生成的回复
     """
-    try:
-        response = ai_service.generate_response(
+    async def generate():
+        """
+        @brief 生成完整回复，作为guard_request的单元素流
+        @return 回复文本
+        """
+        yield await ai_service.agenerate_response(
             request.message, 
             request.use_rag,
             use_rerank=request.use_rerank
         )
-        return {"response": response}
+    
+    try:
+        responses = [response async for response in guard_request(http_request, generate())]
+        if not responses:
+            # 客户端已断开，回复不会被读取
+            return Response(status_code=499)
+        return {"response": responses[0]}
+    except asyncio.TimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/chat_stream")
+async def chat_stream_endpoint(request: ChatRequest, http_request: Request):
+    """
+    @brief 流式聊天端点，以Server-Sent Events逐段推送生成的token
+    @param request ChatRequest对象，包含用户消息和配置选项
+    @param http_request 原始HTTP请求，用于检测客户端断开
+    @return text/event-stream响应，每个事件为{"token": ...}，结束时发送{"done": true}
+    """
+    async def events():
+        """
+        @brief 把token包装为SSE事件，结束或出错时发送最后一个事件
+        @return SSE事件字符串的异步迭代器
+        """
+        tokens = ai_service.astream_response(
+            request.message,
+            request.use_rag,
+            use_rerank=request.use_rerank
+        )
+        try:
+            # 发送失败时确保立即关闭guard_request，取消上游调用
+            async with aclosing(guard_request(http_request, tokens)) as guarded:
+                async for token in guarded:
+                    yield f"data: {json.dumps({'token': token}, ensure_ascii=False)}\n\n"
+        except Exception as e:
+            yield f"data: {json.dumps({'error': str(e) or type(e).__name__}, ensure_ascii=False)}\n\n"
+        yield f"data: {json.dumps({'done': True})}\n\n"
+    
+    # 禁止代理缓冲，保证token到达后立即发送给客户端
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+@app.get("/cancellation_stats")
+async def get_cancellation_stats():
+    """
+    @brief 查询请求取消统计的端点
+    @return 各结局的请求数，以及各阶段上游调用被取消的次数与已运行的秒数
+    """
+    return cancellation_stats()
+
+class RetrieveBatchRequest(BaseModel):
+    """
+    @brief 批量检索请求数据模型
+    @param queries 查询字符串列表，数量不超过retrieve_batch_max_queries，超出时返回422
+    @param use_rerank 是否使用重排序功能
+    """
+    queries: List[str] = Field(max_length=SERVICE_CONFIG.get("retrieve_batch_max_queries", 256))
+    use_rerank: bool = False
+
+@app.post("/retrieve_batch")
+async def retrieve_batch_endpoint(request: RetrieveBatchRequest):
+    """
+    @brief 批量检索端点，供评测和离线任务一次提交多个查询
+    @param request RetrieveBatchRequest对象，包含查询列表和重排序选项
+    @return 与查询一一对应的检索结果列表
+    """
+    try:
+        results = await ai_service.rag_retriever.aretrieve_batch(
+            request.queries,
+            use_rerank=request.use_rerank
+        )
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/cache_stats")
+async def cache_stats():
+    """
+    @brief 查询缓存命中统计的端点
+    @return 各缓存的命中、淘汰与容量统计
+    """
+    return ai_service.cache_stats()
+
 @app.post("/update_config")
 async def update_config(new_config: dict):
     """
@@ -66,46 +195,39 @@ async def update_config(new_config: dict):
     @param new_config 包含新配置的字典
     @return 配置更新状态
     """
-    ai_service.update_config(new_config)
+    # 重新初始化检索器会加载索引，在线程池中执行以免阻塞其他请求
+    await run_in_threadpool(ai_service.update_config, new_config)
+    submit_missing_index_build()
     return {"status": "config updated"}
 
 # 重建索引端点
 @app.post("/rebuild_index")
 async def rebuild_index():
     """
-    @brief 重建RAG索引的端点
-    @return 索引重建结果状态
+    @brief 全量重建RAG索引的端点，构建在后台执行
+    @return 构建任务id，可通过/jobs/{job_id}查询进度
     """
-    success = build_vector_store()
-    if success:
-        ai_service.rag_retriever = initialize_rag_system()
-        return {"status": "index rebuilt successfully"}
-    else:
-        return {"status": "failed to rebuild index", "error": "no documents or chunks found"}
+    job = build_jobs.submit(full_rebuild=True)
+    return {"status": job.status, "job_id": job.id}
 
 # 上传文档端点
 @app.post("/upload_document")
 async def upload_document(file: UploadFile = File(...)):
     """
-    @brief 上传文档并自动重建索引的端点
+    @brief 上传文档并在后台增量更新索引的端点
     @param file 上传的文件对象
-    @return 文件上传和索引重建结果
+    @return 文件保存路径与构建任务id
     """
     try:
         documents_dir = BASE_DIR / "data" / "documents"
         documents_dir.mkdir(parents=True, exist_ok=True)
         file_path = documents_dir / file.filename
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        content = await file.read()
+        await run_in_threadpool(file_path.write_bytes, content)
         
-        # 自动触发重建索引
-        success = build_vector_store()
-        if success:
-            ai_service.rag_retriever = initialize_rag_system()
-            return {"status": "success", "file_path": str(file_path)}
-        else:
-            return {"status": "file uploaded but failed to rebuild index"}
+        # 增量更新索引，只处理新上传或变化的文档
+        job = build_jobs.submit()
+        return {"status": "success", "file_path": str(file_path), "job_id": job.id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -113,16 +235,65 @@ async def upload_document(file: UploadFile = File(...)):
 @app.post("/build_embeddings")
 async def build_embeddings():
     """
-    @brief 手动触发向量嵌入构建过程的端点
-    @return 嵌入构建结果状态
+    @brief 手动触发向量嵌入构建过程的端点，构建在后台执行
+    @return 构建任务id，可通过/jobs/{job_id}查询进度
+    """
+    job = build_jobs.submit()
+    return {"status": job.status, "job_id": job.id}
+
+@app.get("/jobs")
+async def list_jobs():
+    """
+    @brief 列出最近的构建任务
+    @return 任务状态列表，最新的在前
+    """
+    return {"jobs": build_jobs.list()}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, since: int = 0):
     """
-    """手动触发向量嵌入过程"""
-    success = build_vector_store()
-    if success:
-        ai_service.rag_retriever = initialize_rag_system()
-        return {"status": "embeddings built successfully"}
-    else:
-        return {"status": "failed to build embeddings", "error": "no documents or chunks found"}
+    @brief 查询构建任务状态的端点
+    @param job_id 任务id
+    @param since 已收到的最后一个进度事件序号，只返回之后的事件
+    @return 任务状态与进度事件
+    """
+    job = build_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    return job.to_dict(since=since)
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, http_request: Request):
+    """
+    @brief 以Server-Sent Events推送构建任务的进度事件，任务结束时发送最终状态
+    @param job_id 任务id
+    @param http_request 原始HTTP请求，用于检测客户端断开
+    @return text/event-stream响应，进度事件为{"seq": ..., "stage": ...}，结束时为{"done": true, ...}
+    """
+    job = build_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="job not found")
+    
+    async def events():
+        """
+        @brief 轮询任务的新进度事件并推送，任务结束或客户端断开时停止
+        @return SSE事件字符串的异步迭代器
+        """
+        seq = 0
+        poll_interval = SERVICE_CONFIG.get("disconnect_poll_interval", 0.5)
+        while not await http_request.is_disconnected():
+            # 先读取状态再读取事件，保证任务结束前的所有事件都已发出
+            finished = job.finished
+            for event in job.events_since(seq):
+                seq = event["seq"]
+                yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+            if finished:
+                yield f"data: {json.dumps({'done': True, **job.to_dict()}, ensure_ascii=False)}\n\n"
+                return
+            await asyncio.sleep(poll_interval)
+    
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
     
 # 添加前端服务
 @app.get("/")
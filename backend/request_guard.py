@@ -0,0 +1,60 @@
+import asyncio
+from typing import AsyncIterator
+
+from RAG.async_http import record_request
+from config import SERVICE_CONFIG
+
+
+async def guard_request(request, stream: AsyncIterator) -> AsyncIterator:
+    """
+    @brief 在请求的时间预算内迭代stream，客户端断开或超出预算时取消进行中的检索、重排序与生成调用
+    @param request 当前HTTP请求（提供is_disconnected协程），用于检测客户端是否断开
+    @param stream 产生结果的异步迭代器
+    @return 透传stream产出的异步迭代器；客户端断开时静默结束，超出预算时抛出asyncio.TimeoutError，
+            上游出错时原样抛出
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SERVICE_CONFIG.get("request_deadline", 600)
+    poll_interval = SERVICE_CONFIG.get("disconnect_poll_interval", 0.5)
+    pending = None
+    outcome = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(stream.__anext__())
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                outcome = "deadline_exceeded"
+                raise asyncio.TimeoutError("request deadline exceeded")
+            
+            done, _ = await asyncio.wait({pending}, timeout=min(poll_interval, remaining))
+            if pending in done:
+                try:
+                    item = pending.result()
+                except StopAsyncIteration:
+                    outcome = "completed"
+                    return
+                except Exception:
+                    # 上游调用（检索、重排序、生成）出错，不是客户端断开
+                    outcome = "failed"
+                    raise
+                pending = None
+                yield item
+            elif await request.is_disconnected():
+                outcome = "disconnected"
+                return
+    except (GeneratorExit, asyncio.CancelledError):
+        # 在产出结果时被关闭（发送失败）或请求任务被取消，说明客户端已断开
+        outcome = outcome or "disconnected"
+        raise
+    except Exception:
+        outcome = outcome or "failed"
+        raise
+    finally:
+        # 先记录结局：被取消时finally中后续的await也可能被取消
+        record_request(outcome)
+        if pending is not None and not pending.done():
+            # 取消进行中的调用，stream随之结束
+            pending.cancel()
+        else:
+            await stream.aclose()
@@ -0,0 +1,496 @@
+# benchmark.py
+"""
+    功能：RAG组件性能基准测试
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _legacy_smart_split(text: str, chunk_size: int) -> list:
+    """
+    @brief 旧版逐字符拼接的分割实现，仅作为基准对照
+    
+    @param text (str): 需要分割的输入文本
+    @param chunk_size (int): 块大小
+    
+    @return list: 分割后的文本块列表
+    """
+    sentence_endings = {'。', '？', '！', '；', '.', '?', '!', ';'}
+    chunks = []
+    current_chunk = ""
+    char_count = 0
+    for char in text:
+        current_chunk += char
+        char_count += 1
+        if char_count >= chunk_size * 0.7 and char in sentence_endings:
+            chunks.append(current_chunk.strip())
+            current_chunk = ""
+            char_count = 0
+        elif char_count >= chunk_size:
+            for i in range(len(current_chunk)-1, -1, -1):
+                if current_chunk[i] in sentence_endings:
+                    chunks.append(current_chunk[:i+1].strip())
+                    current_chunk = current_chunk[i+1:]
+                    char_count = len(current_chunk)
+                    break
+            else:
+                chunks.append(current_chunk.strip())
+                current_chunk = ""
+                char_count = 0
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+def _synthetic_text(size_mb: float, seed: int = 0) -> str:
+    """
+    @brief 生成指定大小的中英文混合测试文本，句子长度随机，偶尔出现无标点的长段
+    
+    @param size_mb (float): 目标大小（MB，按字符数近似）
+    @param seed (int): 随机种子
+    
+    @return str: 测试文本
+    """
+    rng = random.Random(seed)
+    words = ["检索", "增强", "生成", "向量", "索引", "文档", "模型", "the", "index", "query", "vector", "data"]
+    endings = ["。", "？", "！", "；", ".", "?", "!", ";"]
+    target = int(size_mb * 1024 * 1024)
+    parts = []
+    length = 0
+    while length < target:
+        count = rng.randint(3, 600) if rng.random() < 0.02 else rng.randint(3, 40)
+        sentence = " ".join(rng.choice(words) for _ in range(count)) + rng.choice(endings) + " "
+        parts.append(sentence)
+        length += len(sentence)
+    return "".join(parts)
+
+
+def bench_splitter(args):
+    """
+    @brief 对比旧版逐字符分割与新版偏移量扫描分割在大文档上的耗时
+    
+    @param args (argparse.Namespace): 命令行参数
+    """
+    from RAG.text_splitter import TextSplitter
+    
+    splitter = TextSplitter()
+    for size_mb in args.sizes:
+        text = _synthetic_text(size_mb)
+        
+        start = time.perf_counter()
+        new_chunks = splitter._smart_split(text)
+        new_elapsed = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        legacy_chunks = _legacy_smart_split(text, splitter.chunk_size)
+        legacy_elapsed = time.perf_counter() - start
+        
+        logger.info(
+            f"{size_mb:>6.1f} MB | legacy: {legacy_elapsed:8.3f}s ({len(legacy_chunks)} chunks) | "
+            f"streaming: {new_elapsed:8.3f}s ({len(new_chunks)} chunks, overlap={splitter.chunk_overlap}) | "
+            f"speedup: {legacy_elapsed / max(new_elapsed, 1e-9):.1f}x"
+        )
+
+
+def bench_metadata(args):
+    """
+    @brief 对比旧版缩进JSON元数据与二进制内存映射元数据的加载耗时和按命中读取耗时
+    
+    @param args (argparse.Namespace): 命令行参数
+    """
+    from RAG.metadata_store import MetadataReader, migrate_json_metadata
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_path = Path(args.from_json) if args.from_json else Path(tmp_dir) / "metadata.json"
+        bin_path = Path(tmp_dir) / "metadata.bin"
+        
+        if not args.from_json:
+            rng = random.Random(0)
+            text = _synthetic_text(args.chunks * args.text_chars / (1024 * 1024))
+            records = []
+            for i in range(args.chunks):
+                offset = rng.randrange(max(1, len(text) - args.text_chars))
+                records.append({
+                    "text": text[offset:offset + args.text_chars],
+                    "summary": text[offset:offset + 15],
+                    "source": f"/data/documents/doc_{i % 500}.pdf",
+                    "page": i % 300 + 1
+                })
+            with open(json_path, 'w', encoding='utf-8') as f:
+                json.dump({"chunks": records, "chunk_ids": [f"doc_{i}" for i in range(args.chunks)]},
+                          f, ensure_ascii=False, indent=2)
+            del records, text
+        
+        start = time.perf_counter()
+        migrate_json_metadata(json_path, bin_path)
+        migrate_elapsed = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        with open(json_path, 'r', encoding='utf-8') as f:
+            metadata = json.load(f)
+        chunks = metadata["chunks"]
+        json_elapsed = time.perf_counter() - start
+        count = len(chunks)
+        
+        start = time.perf_counter()
+        reader = MetadataReader(bin_path)
+        bin_elapsed = time.perf_counter() - start
+        
+        hits = [random.randrange(count) for _ in range(args.hits)]
+        start = time.perf_counter()
+        for idx in hits:
+            reader.records[idx]
+            reader.chunk_ids[idx]
+        hit_elapsed = time.perf_counter() - start
+        
+        logger.info(f"chunks: {count} | json: {json_path.stat().st_size / 1e6:.1f} MB | "
+                    f"bin: {bin_path.stat().st_size / 1e6:.1f} MB | migration: {migrate_elapsed:.2f}s")
+        logger.info(f"json.load: {json_elapsed * 1000:.1f} ms | mmap open: {bin_elapsed * 1000:.3f} ms | "
+                    f"{args.hits} lazy hits: {hit_elapsed * 1000:.3f} ms")
+        del reader
+
+
+def _synthetic_vectors(count: int, dim: int, clusters: int = 200, seed: int = 0) -> np.ndarray:
+    """
+    @brief 生成带簇结构的归一化向量，近似真实嵌入的分布
+    
+    @param count (int): 向量数量
+    @param dim (int): 向量维度
+    @param clusters (int): 簇数量
+    @param seed (int): 随机种子
+    
+    @return np.ndarray: 形状为(count, dim)的float32矩阵
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, count)] + 0.8 * rng.standard_normal((count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _store_vectors() -> np.ndarray:
+    """
+    @brief 读取当前向量库所有段的正文向量，用于在真实语料上测试
+    
+    @return np.ndarray: 形状为(n, dim)的float32矩阵
+    """
+    from RAG.vector_store import VectorStore
+    
+    store = VectorStore()
+    if not store.segments:
+        raise SystemExit("Vector store is empty, build it first or omit --from-store")
+    return np.concatenate([np.asarray(segment.vectors, dtype=np.float32) for segment in store.segments])
+
+
+def _measure(backend, queries: np.ndarray, k: int, truth: list) -> tuple:
+    """
+    @brief 逐条查询，统计recall@k与延迟分位数
+    
+    @param backend (IndexBackend): 已构建的索引后端
+    @param queries (np.ndarray): 查询向量
+    @param k (int): 每次检索的条目数
+    @param truth (list): 每个查询的精确结果集合
+    
+    @return tuple: (recall@k, p50毫秒, p99毫秒)
+    """
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        indices, _ = backend.search(query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(expected.intersection(indices.tolist()))
+    recall = hits / sum(len(expected) for expected in truth)
+    return recall, float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))
+
+
+def bench_ann(args):
+    """
+    @brief 以精确检索为基准，比较Annoy与不同nprobe、重排倍数下IVF-PQ的召回率与延迟
+    
+    @param args (argparse.Namespace): 命令行参数
+    """
+    from config import RAG_CONFIG
+    from RAG.index_backends import create_backend
+    
+    vectors = _store_vectors() if args.from_store else _synthetic_vectors(args.items, args.dim)
+    count, dim = vectors.shape
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(count, args.queries, replace=False)]
+    queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32) / np.sqrt(dim)
+    queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+    
+    config = RAG_CONFIG["vector_store"]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        def build(name, **overrides):
+            """
+            @brief 用给定参数构建并保存索引，记录构建耗时与文件大小
+            
+            @param name (str): 后端名称
+            @param overrides (dict): 覆盖的向量存储配置
+            
+            @return IndexBackend: 已构建的后端
+            """
+            config.update(overrides)
+            backend = create_backend(name, dim)
+            start = time.perf_counter()
+            backend.add(vectors)
+            backend.build()
+            prefix = Path(tmp_dir) / name
+            backend.save(prefix)
+            size_mb = backend.path_for(prefix).stat().st_size / 1e6
+            logger.info(f"{name}: built in {time.perf_counter() - start:.1f}s, {size_mb:.1f} MB on disk")
+            return backend
+        
+        exact = build("brute_force")
+        truth = [set(exact.search(query, args.k)[0].tolist()) for query in queries]
+        recall, p50, p99 = _measure(exact, queries, args.k, truth)
+        logger.info(f"brute_force | recall@{args.k} {recall:.3f} | p50 {p50:.2f} ms | p99 {p99:.2f} ms")
+        
+        if not args.skip_annoy:
+            annoy = build("annoy")
+            recall, p50, p99 = _measure(annoy, queries, args.k, truth)
+            logger.info(f"annoy (search_k=-1) | recall@{args.k} {recall:.3f} | p50 {p50:.2f} ms | p99 {p99:.2f} ms")
+        
+        ivf = build("ivf_pq", ivf_nlist=args.nlist)
+        logger.info(f"ivf_pq: {len(ivf.centroids)} lists, {ivf.m} sub-quantizers")
+        for nprobe in args.nprobe:
+            for factor in args.rerank_factors:
+                ivf.nprobe, ivf.rerank_factor = nprobe, factor
+                recall, p50, p99 = _measure(ivf, queries, args.k, truth)
+                logger.info(f"ivf_pq nprobe={nprobe} rerank_factor={factor} | recall@{args.k} {recall:.3f} | "
+                            f"p50 {p50:.2f} ms | p99 {p99:.2f} ms")
+
+
+def _live_index_vectors() -> tuple:
+    """
+    @brief 读取当前向量库所有段中未删除条目的摘要向量与正文向量
+    
+    @return tuple: (摘要向量矩阵, 正文向量矩阵)
+    """
+    from RAG.vector_store import VectorStore
+    
+    store = VectorStore()
+    summary_vectors, chunk_vectors = [], []
+    for segment in store.segments:
+        _, _, segment_vectors, segment_summary = segment.live_items()
+        chunk_vectors.append(segment_vectors)
+        summary_vectors.append(segment_summary)
+    if not chunk_vectors or not sum(len(vectors) for vectors in chunk_vectors):
+        raise SystemExit("Vector store is empty, build it first or use --synthetic")
+    return np.concatenate(summary_vectors), np.concatenate(chunk_vectors)
+
+
+def bench_tune_annoy(args):
+    """
+    @brief 在当前索引上扫描Annoy的树数量、search_k与候选倍数，按检索器的实际流程
+           （摘要索引取候选、正文向量重新打分）测量recall@k与p50/p99延迟，
+           选出满足目标召回率且p99最低的组合并写入调优配置
+    
+    @param args (argparse.Namespace): 命令行参数
+    """
+    from config import RAG_CONFIG, VECTOR_STORE_TUNING_FILE, load_tuning_file
+    from RAG.index_backends import AnnoyBackend
+    
+    if args.synthetic:
+        chunk_vectors = _synthetic_vectors(args.synthetic, RAG_CONFIG["embeddings"].get("dim", 384))
+        noise = 0.5 * np.random.default_rng(2).standard_normal(chunk_vectors.shape).astype(np.float32)
+        summary_vectors = chunk_vectors + noise / np.sqrt(chunk_vectors.shape[1])
+        summary_vectors /= np.linalg.norm(summary_vectors, axis=1, keepdims=True)
+    else:
+        summary_vectors, chunk_vectors = _live_index_vectors()
+    count, dim = chunk_vectors.shape
+    k = args.k or RAG_CONFIG["retriever"]["top_k"]
+    
+    rng = np.random.default_rng(1)
+    queries = summary_vectors[rng.choice(count, min(args.queries, count), replace=False)]
+    queries = queries + 0.3 * rng.standard_normal(queries.shape).astype(np.float32) / np.sqrt(dim)
+    queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+    
+    # 基准为正文向量上的精确top-k，即检索器最终排序依据的分数
+    truth = []
+    for query in queries:
+        scores = chunk_vectors @ query
+        truth.append(set(np.argsort(-scores, kind="stable")[:k].tolist()))
+    logger.info(f"Tuning on {count} items, {len(queries)} queries, recall@{k}")
+    
+    config = RAG_CONFIG["vector_store"]
+    results = []
+    for n_trees in args.trees:
+        config["build_trees"] = n_trees
+        backend = AnnoyBackend(dim)
+        start = time.perf_counter()
+        backend.add(summary_vectors)
+        backend.build()
+        logger.info(f"n_trees={n_trees}: built in {time.perf_counter() - start:.1f}s")
+        
+        for search_k in args.search_k:
+            backend.search_k = search_k
+            for multiplier in args.multipliers:
+                latencies = []
+                hits = 0
+                for query, expected in zip(queries, truth):
+                    start = time.perf_counter()
+                    candidates, _ = backend.search(query, k * multiplier)
+                    scores = chunk_vectors[candidates] @ query
+                    top = candidates[np.argsort(-scores, kind="stable")[:k]]
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    hits += len(expected.intersection(top.tolist()))
+                recall = hits / sum(len(expected) for expected in truth)
+                p50, p99 = float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99))
+                results.append({
+                    "build_trees": n_trees,
+                    "annoy_search_k": search_k,
+                    "candidate_multiplier": multiplier,
+                    "recall": recall,
+                    "p50": p50,
+                    "p99": p99
+                })
+                logger.info(f"n_trees={n_trees} search_k={search_k} multiplier={multiplier} | "
+                            f"recall@{k} {recall:.3f} | p50 {p50:.2f} ms | p99 {p99:.2f} ms")
+    
+    qualified = [result for result in results if result["recall"] >= args.target_recall]
+    if qualified:
+        best = min(qualified, key=lambda result: (result["p99"], -result["recall"]))
+    else:
+        # 召回率差距在0.5%以内视为相同，优先选延迟低的
+        top_recall = max(result["recall"] for result in results)
+        logger.warning(f"No setting reached recall {args.target_recall}, choosing the fastest near {top_recall:.3f}")
+        best = min((result for result in results if result["recall"] >= top_recall - 0.005),
+                   key=lambda result: result["p99"])
+    logger.info(f"Chosen: {best}")
+    
+    if args.dry_run:
+        return
+    tuning_path = Path(VECTOR_STORE_TUNING_FILE)
+    tuning = load_tuning_file(str(tuning_path))
+    tuning.update({key: best[key] for key in ("build_trees", "annoy_search_k", "candidate_multiplier")})
+    # 先写临时文件再原子替换，服务在写入过程中启动也不会读到不完整的文件
+    tmp_path = tuning_path.with_suffix(tuning_path.suffix + ".tmp")
+    tmp_path.write_text(json.dumps(tuning, indent=2), encoding='utf-8')
+    os.replace(tmp_path, tuning_path)
+    logger.info(f"Wrote {tuning_path}; rebuild the index (build_embeddings.py --full) for build_trees to take effect")
+
+
+
+def bench_load(args):
+    """
+    @brief 向运行中的后端并发发送对话请求，对比总耗时与各请求耗时之和，衡量请求间的重叠程度；
+           流式模式下同时统计首token延迟
+    
+    @param args (argparse.Namespace): 命令行参数
+    """
+    import asyncio
+    import httpx
+    
+    async def run():
+        """
+        @brief 并发发送全部请求
+        
+        @return tuple: (总耗时, 各请求的(耗时, 首token延迟)列表)
+        """
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+            async def chat(i):
+                """
+                @brief 发送第i个聊天请求并记录延迟
+                
+                @param i (int): 请求序号
+                
+                @return tuple: (请求耗时, 首token延迟)，非流式模式下首token延迟为None
+                """
+                payload = {"message": f"{args.message} #{i}", "use_rag": args.use_rag, "use_rerank": args.use_rerank}
+                start = time.perf_counter()
+                if not args.stream:
+                    response = await client.post("/chat", json=payload)
+                    response.raise_for_status()
+                    return time.perf_counter() - start, None
+                
+                # 流式端点额外记录首个token到达的时间
+                first_token = None
+                async with client.stream("POST", "/chat_stream", json=payload) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if first_token is None and line.startswith("data: ") and "token" in json.loads(line[6:]):
+                            first_token = time.perf_counter() - start
+                return time.perf_counter() - start, first_token
+            
+            start = time.perf_counter()
+            results = await asyncio.gather(*(chat(i) for i in range(args.requests)))
+            return time.perf_counter() - start, results
+    
+    wall, results = asyncio.run(run())
+    latencies = np.array([latency for latency, _ in results]) * 1000
+    # 完全串行时重叠度为1，N个请求完全并发时接近N
+    overlap = latencies.sum() / 1000 / wall
+    endpoint = "/chat_stream" if args.stream else "/chat"
+    logger.info(f"{args.requests} concurrent {endpoint} requests | wall {wall:.2f}s | "
+                f"p50 {np.percentile(latencies, 50):.0f} ms | p99 {np.percentile(latencies, 99):.0f} ms | "
+                f"overlap {overlap:.1f}x")
+    first_tokens = np.array([first for _, first in results if first is not None]) * 1000
+    if len(first_tokens):
+        logger.info(f"time to first token | p50 {np.percentile(first_tokens, 50):.0f} ms | "
+                    f"p99 {np.percentile(first_tokens, 99):.0f} ms")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='RAG组件性能基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    splitter_parser = subparsers.add_parser('splitter', help='文本分割器基准')
+    splitter_parser.add_argument('--sizes', type=float, nargs='+', default=[1, 4, 16],
+                                 help='测试文本大小（MB）')
+    splitter_parser.set_defaults(func=bench_splitter)
+    
+    metadata_parser = subparsers.add_parser('metadata', help='元数据加载基准')
+    metadata_parser.add_argument('--chunks', type=int, default=200000, help='合成元数据的分块数')
+    metadata_parser.add_argument('--text-chars', type=int, default=1000, help='每个分块的文本长度')
+    metadata_parser.add_argument('--hits', type=int, default=20, help='随机读取的条目数')
+    metadata_parser.add_argument('--from-json', type=str, default=None,
+                                 help='使用已有的JSON元数据文件代替合成数据')
+    metadata_parser.set_defaults(func=bench_metadata)
+    
+    ann_parser = subparsers.add_parser('ann', help='近似最近邻后端召回率与延迟基准')
+    ann_parser.add_argument('--items', type=int, default=200000, help='合成向量数量')
+    ann_parser.add_argument('--dim', type=int, default=384, help='合成向量维度')
+    ann_parser.add_argument('--queries', type=int, default=200, help='查询数量')
+    ann_parser.add_argument('--k', type=int, default=60, help='每次检索的条目数（检索器按top_k*3取候选）')
+    ann_parser.add_argument('--nlist', type=int, default=0, help='IVF倒排列表数，0表示按4*sqrt(n)自动选择')
+    ann_parser.add_argument('--nprobe', type=int, nargs='+', default=[8, 16, 32, 64], help='测试的nprobe取值')
+    ann_parser.add_argument('--rerank-factors', type=int, nargs='+', default=[4, 10], help='测试的重排倍数')
+    ann_parser.add_argument('--skip-annoy', action='store_true', help='跳过Annoy（大规模时构建较慢）')
+    ann_parser.add_argument('--from-store', action='store_true', help='使用当前向量库中的向量代替合成数据')
+    ann_parser.set_defaults(func=bench_ann)
+    
+    tune_parser = subparsers.add_parser('tune-annoy', help='在当前索引上调优Annoy参数并写入配置')
+    tune_parser.add_argument('--trees', type=int, nargs='+', default=[10, 25, 50, 100], help='测试的树数量')
+    tune_parser.add_argument('--search-k', type=int, nargs='+', default=[-1, 2000, 5000, 10000, 20000],
+                             help='测试的search_k取值，-1表示树数量*候选数')
+    tune_parser.add_argument('--multipliers', type=int, nargs='+', default=[2, 3, 5], help='测试的候选倍数')
+    tune_parser.add_argument('--k', type=int, default=0, help='recall@k中的k，0表示使用检索器的top_k')
+    tune_parser.add_argument('--queries', type=int, default=200, help='查询数量')
+    tune_parser.add_argument('--target-recall', type=float, default=0.95, help='目标召回率')
+    tune_parser.add_argument('--synthetic', type=int, default=0, help='使用指定数量的合成向量代替当前索引')
+    tune_parser.add_argument('--dry-run', action='store_true', help='只输出结果，不写入配置')
+    tune_parser.set_defaults(func=bench_tune_annoy)
+    
+    load_parser = subparsers.add_parser('load', help='并发对话负载测试（需先启动后端）')
+    load_parser.add_argument('--url', type=str, default='http://localhost:8000', help='后端地址')
+    load_parser.add_argument('--requests', type=int, default=16, help='并发请求数')
+    load_parser.add_argument('--message', type=str, default='介绍一下这个项目', help='请求消息')
+    load_parser.add_argument('--use-rag', action='store_true', help='启用RAG检索')
+    load_parser.add_argument('--use-rerank', action='store_true', help='启用重排序')
+    load_parser.add_argument('--timeout', type=float, default=300, help='单个请求超时时间（秒）')
+    load_parser.add_argument('--stream', action='store_true', help='请求流式端点/chat_stream并统计首token延迟')
+    load_parser.set_defaults(func=bench_load)
+    
+    args = parser.parse_args()
+    args.func(args)
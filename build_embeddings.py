@@ -1,8 +1,9 @@
 # build_embeddings.py
 import logging
-from RAG import build_vector_store
+from RAG import build_vector_store, VectorStore
 import time
 import sys
+import argparse
 
 # 配置日志
 logging.basicConfig(
@@ -52,11 +53,18 @@ def print_progress(**kwargs):
         print()  # 完成时换行
 
 def main():
+    parser = argparse.ArgumentParser(description='构建向量库')
+    parser.add_argument('--full', action='store_true',
+                        help='忽略文档清单，全量重建向量库')
+    args = parser.parse_args()
+    
     logger.info("Starting manual embedding process...")
     start_time = time.time()
     
-    # 调用构建函数，传入进度回调
-    success = build_vector_store(progress_callback=print_progress)
+    # 调用构建函数，传入进度回调（默认只处理变化的文档）
+    success = build_vector_store(progress_callback=print_progress, full_rebuild=args.full)
+    # 增量构建可能在后台启动段压缩，退出前等待其完成
+    VectorStore.wait_for_compaction()
     
     elapsed = time.time() - start_time
     if success:
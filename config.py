@@ -1,10 +1,17 @@
+import json
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 # 基础路径配置
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 DOCUMENTS_DIR = os.path.join(DATA_DIR, 'documents')
 VECTOR_STORE_DIR = os.path.join(DATA_DIR, 'vector_store')
+CACHE_DIR = os.path.join(DATA_DIR, 'cache')
+# `python benchmark.py tune-annoy` 写入的向量存储调优结果，加载时覆盖RAG_CONFIG["vector_store"]中的默认值
+VECTOR_STORE_TUNING_FILE = os.path.join(DATA_DIR, 'vector_store_tuning.json')
 
 # 服务配置（全局）
 SERVICE_CONFIG = {
@@ -12,14 +19,33 @@ SERVICE_CONFIG = {
     "frontend_port": 3000,     # 前端服务端口
     "ollama_host": "http://localhost:11434",  # Ollama服务地址
     "embedding_timeout": 30,   # 嵌入生成超时时间（秒）
-    "rerank_timeout": 120      # 重排序超时时间（秒）
+    "rerank_timeout": 120,     # 重排序超时时间（秒）
+    "generation_timeout": 300, # 回答生成超时时间（秒），流式生成时为相邻两个token之间的最长等待
+    "request_deadline": 600,   # 单个对话请求（检索、重排序、生成）的总时间预算（秒），超出后取消进行中的调用
+    "disconnect_poll_interval": 0.5,  # 检测客户端断开的间隔（秒）
+    "async_pool_size": 32,     # 异步HTTP客户端到Ollama的最大连接数
+    "retrieve_batch_max_queries": 256,  # 单个批量检索请求的查询数上限，超出时请求被拒绝
+    "build_jobs": {
+        "history": 50,             # 保留的最近构建任务数
+        "max_events": 2000         # 每个任务保留的最近进度事件数
+    },
+    "answer_cache": {
+        "enable": False,           # 是否启用语义回答缓存：相近的问题在索引未变化时直接返回已生成的回答
+        "max_distance": 0.05,      # 命中所需的最大余弦距离（1 - 余弦相似度）
+        "max_entries": 1000,       # 最大条目数，超出后按LRU淘汰
+        "max_size_mb": 64          # 回答文本总大小上限（MB）
+    }
 }
 
 # RAG配置（AI组件）
 RAG_CONFIG = {
     # 文档加载配置
     "document_loader": {
-        "extensions": [".txt", ".pdf", ".docx", ".pptx", ".md", ".json", ".csv"]
+        "extensions": [".txt", ".pdf", ".docx", ".pptx", ".md", ".json", ".csv"],
+        "max_workers": 4,          # 并行解析文档的进程数，<=1时在主进程中串行解析
+        "max_in_flight": 8,        # 同时在途（已提交未消费）的文档数上限，用于限制内存
+        "pdf_stream_threshold_mb": 20,  # 超过该大小的PDF在主进程中逐页流式读取
+        "csv_rows_per_unit": 50    # CSV按行批流式读取，每批行数
     },
     
     # 文本分割配置 
@@ -33,28 +59,67 @@ RAG_CONFIG = {
         "model_type": "ollama",  # ollama 或 huggingface
         "model_name": "all-minilm", 
         "dim": 384,             # 嵌入维度
-        "batch_size": 32         # 批量处理大小
+        "batch_size": 32,        # 批量处理大小（单次/api/embed请求的文本数）
+        "pool_size": 8,          # HTTP连接池大小
+        "max_concurrency": 4,    # 构建索引时同时在途的嵌入请求批次数
+        "cache": {
+            "enable": True,            # 是否启用持久化嵌入缓存
+            "file_name": "embeddings.sqlite",
+            "max_size_mb": 512         # 缓存大小上限（MB），超出后按LRU淘汰
+        }
     },
     
     # 向量存储配置
     "vector_store": {
-        "type": "annoy",  
+        "type": "auto",                # auto、brute_force、annoy 或 ivf_pq；auto时按语料规模自动选择
+        "brute_force_max_items": 50000,  # auto模式下不超过该条目数时使用精确的暴力检索
+        "ivf_pq_min_items": 1000000,     # auto模式下达到该条目数时使用内存映射的IVF-PQ
+        # IVF-PQ参数，默认值依据 `python benchmark.py ann` 的召回率/延迟对比选取
+        # （20万条384维向量：nprobe=16、重排倍数10时recall@60为0.993，p50约1.6ms，精确检索约32ms）
+        "ivf_nlist": 0,                  # 倒排列表数，0表示按4*sqrt(n)自动选择
+        "ivf_nprobe": 16,                # 每次查询扫描的倒排列表数
+        "pq_m": 48,                      # 乘积量化子空间数，需整除向量维度
+        "ivf_rerank_factor": 10,         # 用原始向量精确重排的候选数为k的倍数
+        "ivf_train_size": 100000,        # k-means训练采样数
         "index_name": "document_index",
         "distance_metric": "angular",  # 距离度量方法
-        "build_trees": 10              # Annoy索引树数量
+        "build_trees": 10,             # Annoy索引树数量
+        "annoy_search_k": -1,          # Annoy查询时检查的节点数，-1表示树数量*返回条目数
+        "candidate_multiplier": 3,     # 摘要索引取top_k的该倍数作为候选，再用正文向量重新打分
+        "compaction_small_segment_items": 5000,  # 条目数少于该值的段视为小段，参与后台压缩
+        "compaction_min_small_segments": 4,      # 小段数量达到该值时触发压缩
+        "compaction_max_deleted_ratio": 0.3,     # 段内已删除条目比例超过该值时触发压缩
+        "segment_gc_grace_seconds": 300,         # 被替换的段文件保留时长（秒），供其他仍在读取的进程使用；
+                                                 # 本进程内仍被引用的段在引用释放后才删除
+        "warm_on_refresh": True                  # 切换到新版本前预热新段（读取内存映射页面）
     },
     
     # 检索器配置
     "retriever": {
         "top_k": 20,              # 检索返回的文档数量
         "score_threshold": 0.3,   # 相似度分数阈值
-        "enable_rerank": False     # 是否默认启用重排序
+        "enable_rerank": False,    # 是否默认启用重排序
+        "query_embedding_cache": {
+            "enable": True,            # 是否缓存查询向量，重复的查询无需再请求嵌入服务
+            "max_entries": 4096,       # 最大条目数，超出后按LRU淘汰
+            "ttl_seconds": 3600        # 条目存活时间（秒）
+        },
+        "result_cache": {
+            "enable": True,            # 是否缓存最终检索结果（含重排序），键中包含索引版本，索引更新后自动失效
+            "max_entries": 1024,       # 最大条目数，超出后按LRU淘汰
+            "ttl_seconds": 600         # 条目存活时间（秒）
+        }
     },
     
     # 摘要生成配置
     "summarizer": {
         "model_name": "qwen:7b",   # 摘要生成模型
-        "max_summary_length": 15   # 摘要最大长度（字数）
+        "max_summary_length": 15,  # 摘要最大长度（字数）
+        "cache": {
+            "enable": True,            # 是否启用持久化摘要缓存
+            "file_name": "summaries.sqlite",
+            "max_size_mb": 128         # 缓存大小上限（MB），超出后按LRU淘汰
+        }
     },
     
     # 修改后的重排序配置 - 二元组格式
@@ -70,4 +135,30 @@ RAG_CONFIG = {
                 "摘要列表：\n{summaries}"
             )
     }
-}
\ No newline at end of file
+}
+
+
+def load_tuning_file(path: str) -> dict:
+    """
+    @brief 读取向量存储调优结果；文件不存在、无法读取或内容损坏时记录警告并返回空字典，使用默认参数
+    
+    @param path (str): 调优结果文件路径
+    
+    @return dict: 需要覆盖的向量存储参数
+    """
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            tuning = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Ignoring unreadable tuning file {path}, using defaults: {str(e)}")
+        return {}
+    if not isinstance(tuning, dict):
+        logger.warning(f"Ignoring tuning file {path}, expected a JSON object, using defaults")
+        return {}
+    return tuning
+
+
+# 存在调优结果时覆盖向量存储默认参数
+RAG_CONFIG["vector_store"].update(load_tuning_file(VECTOR_STORE_TUNING_FILE))
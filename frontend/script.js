@@ -11,9 +11,13 @@ async function sendMessage() {
     addMessage('user', message);
     input.value = '';
     
+    // 先创建空的AI消息，token到达后逐段渲染
+    const contentDiv = createMessage('ai');
+    let answer = '';
+    
     try {
-        // 发送到后端
-        const response = await fetch('http://localhost:8000/chat', {
+        // 发送到后端，以SSE流式接收回复
+        const response = await fetch('http://localhost:8000/chat_stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -23,12 +27,34 @@ async function sendMessage() {
                 use_rag: useRag
             })
         });
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
         
-        const data = await response.json();
-        addMessage('ai', data.response);
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            
+            // 事件之间以空行分隔，最后一段可能不完整，留到下次处理
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            for (const event of events) {
+                if (!event.startsWith('data: ')) continue;
+                const data = JSON.parse(event.slice(6));
+                if (data.token) answer += data.token;
+                if (data.error) answer += `\n\nError: ${data.error}`;
+            }
+            renderContent(contentDiv, 'ai', answer);
+        }
     } catch (error) {
-        addMessage('ai', `Error: ${error.message}`);
+        answer += `Error: ${error.message}`;
+        renderContent(contentDiv, 'ai', answer);
     }
+    
+    // 保存历史
+    chatHistory.push({ role: 'ai', content: answer });
 }
 
 async function updateConfig() {
@@ -64,11 +90,29 @@ async function buildEmbeddings() {
         });
         
         const data = await response.json();
-        statusDiv.textContent = data.status;
+        watchJob(data.job_id, statusDiv);
     } catch (error) {
         statusDiv.textContent = `生成失败: ${error.message}`;
     }
 }
+
+// 订阅后台构建任务的进度事件，实时显示在statusDiv中
+function watchJob(jobId, statusDiv, prefix = '') {
+    const source = new EventSource(`http://localhost:8000/jobs/${jobId}/events`);
+    source.onmessage = (e) => {
+        const event = JSON.parse(e.data);
+        if (event.done) {
+            statusDiv.textContent = event.status === 'succeeded'
+                ? `${prefix}index updated`
+                : `${prefix}index build failed: ${event.error || 'unknown error'}`;
+            source.close();
+            return;
+        }
+        const progress = event.total ? ` (${event.current}/${event.total})` : '';
+        statusDiv.textContent = `${prefix}${event.stage}: ${event.message || ''}${progress}`;
+    };
+    source.onerror = () => source.close();
+}
 async function uploadDocument() {
     const fileInput = document.getElementById('document-file');
     const file = fileInput.files[0];
@@ -95,6 +139,7 @@ async function uploadDocument() {
             statusDiv.textContent = `upload success: ${data.file_path}`;
             // 清空文件输入
             fileInput.value = '';
+            watchJob(data.job_id, statusDiv, 'upload success, ');
         } else {
             statusDiv.textContent = `upload failed: ${data.detail || 'unknown error'}`;
         }
@@ -110,6 +155,14 @@ document.addEventListener('DOMContentLoaded', () => {
     chatHistory.scrollTop = chatHistory.scrollHeight;
 });
 function addMessage(role, content) {
+    const contentDiv = createMessage(role);
+    renderContent(contentDiv, role, content);
+    
+    // 保存历史
+    chatHistory.push({ role, content });
+}
+
+function createMessage(role) {
     const chatHistoryElement = document.getElementById('chat-history');
     const messageDiv = document.createElement('div');
     messageDiv.className = `message ${role}-message`;
@@ -117,6 +170,12 @@ function addMessage(role, content) {
     const contentDiv = document.createElement('div');
     contentDiv.className = 'ai-message-content';
     
+    messageDiv.appendChild(contentDiv);
+    chatHistoryElement.appendChild(messageDiv);
+    return contentDiv;
+}
+
+function renderContent(contentDiv, role, content) {
     // 安全渲染Markdown
     if (role === 'ai') {
         const sanitized = DOMPurify.sanitize(marked.parse(content));
@@ -125,14 +184,9 @@ function addMessage(role, content) {
         contentDiv.textContent = content;
     }
     
-    messageDiv.appendChild(contentDiv);
-    chatHistoryElement.appendChild(messageDiv);
-    
     // 滚动到底部
+    const chatHistoryElement = document.getElementById('chat-history');
     chatHistoryElement.scrollTop = chatHistoryElement.scrollHeight;
-    
-    // 保存历史
-    chatHistory.push({ role, content });
 }
 
 // 输入框回车发送
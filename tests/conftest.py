@@ -0,0 +1,52 @@
+import sys
+from pathlib import Path
+
+# 测试从仓库根目录导入config、RAG，并与后端服务一样从backend目录导入模块
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "backend"))
+
+import numpy as np
+import pytest
+
+from config import RAG_CONFIG
+
+DIM = 8
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    """
+    @brief 把向量存储目录指向临时目录，并使用小维度向量与不触发后台压缩的配置
+    @param tmp_path pytest提供的临时目录
+    @param monkeypatch pytest的monkeypatch
+    @return 临时向量存储目录
+    """
+    from RAG import vector_store
+    monkeypatch.setattr(vector_store, "VECTOR_STORE_DIR", str(tmp_path))
+    monkeypatch.setitem(RAG_CONFIG["embeddings"], "dim", DIM)
+    monkeypatch.setitem(RAG_CONFIG["vector_store"], "type", "auto")
+    monkeypatch.setitem(RAG_CONFIG["vector_store"], "compaction_min_small_segments", 1000)
+    monkeypatch.setitem(RAG_CONFIG["vector_store"], "compaction_max_deleted_ratio", 1.0)
+    monkeypatch.setitem(RAG_CONFIG["vector_store"], "segment_gc_grace_seconds", 0)
+    monkeypatch.setitem(RAG_CONFIG["vector_store"], "warm_on_refresh", True)
+    return tmp_path
+
+
+def make_chunks(source, count, seed=0):
+    """
+    @brief 生成测试用的文本块与归一化向量
+    @param source 来源文档路径
+    @param count 文本块数量
+    @param seed 随机种子
+    @return (文本块列表, 向量列表)
+    """
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    chunks = [
+        {"text": f"{source} text {i}", "summary": f"{source} summary {i}", "source": source,
+         "chunk_id": f"{source}#{i}"}
+        for i in range(count)
+    ]
+    return chunks, vectors.tolist()
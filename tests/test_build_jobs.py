@@ -0,0 +1,139 @@
+import threading
+
+import pytest
+
+import build_jobs
+from build_jobs import BuildJobManager
+
+
+class BlockingBuild:
+    """
+    @brief 替代build_vector_store的构建函数，每次构建阻塞到测试放行，并记录同时运行的构建数
+    """
+
+    def __init__(self, results=None):
+        """
+        @brief 初始化构建函数
+        @param results 依次返回的构建结果，用完后返回True
+        """
+        self.results = list(results or [])
+        self.calls = []
+        self.running = 0
+        self.max_running = 0
+        self.started = threading.Semaphore(0)
+        self.release = threading.Semaphore(0)
+        self._lock = threading.Lock()
+
+    def __call__(self, progress_callback=None, full_rebuild=False):
+        """
+        @brief 记录一次构建并等待放行
+        @param progress_callback 进度回调
+        @param full_rebuild 是否全量重建
+        @return 构建结果
+        """
+        with self._lock:
+            self.calls.append(full_rebuild)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        self.started.release()
+        assert self.release.acquire(timeout=5)
+        with self._lock:
+            self.running -= 1
+        success = self.results.pop(0) if self.results else True
+        if not success:
+            progress_callback(stage="load", message="未找到文档", status="error")
+        return success
+
+
+@pytest.fixture
+def build(monkeypatch):
+    """
+    @brief 用阻塞的构建函数替换build_vector_store
+    @param monkeypatch pytest的monkeypatch
+    @return BlockingBuild实例
+    """
+    fake = BlockingBuild()
+    monkeypatch.setattr(build_jobs, "build_vector_store", fake)
+    return fake
+
+
+def wait_finished(manager, *jobs):
+    """
+    @brief 等待任务结束且工作线程退出
+    @param manager 任务管理器
+    @param jobs 需要等待的任务
+    """
+    worker = manager._worker
+    if worker is not None:
+        worker.join(timeout=5)
+    assert all(job.finished for job in jobs)
+
+
+def test_requests_during_a_build_are_coalesced_into_one_queued_job(build):
+    """
+    @brief 构建运行期间到达的请求合并为一个排队任务（任一请求要求全量重建则全量重建），同一时间只运行一个构建
+    @param build 阻塞的构建函数
+    """
+    manager = BuildJobManager()
+    first = manager.submit()
+    assert build.started.acquire(timeout=5)
+
+    second = manager.submit()
+    third = manager.submit(full_rebuild=True)
+    fourth = manager.submit()
+    assert second is third is fourth
+    assert second is not first
+    assert second.coalesced == 2
+    assert second.full_rebuild
+    assert second.status == "queued"
+
+    build.release.release()
+    assert build.started.acquire(timeout=5)
+    build.release.release()
+    wait_finished(manager, first, second)
+
+    assert build.calls == [False, True]
+    assert build.max_running == 1
+    assert first.status == second.status == "succeeded"
+    assert [job["job_id"] for job in manager.list()] == [second.id, first.id]
+
+
+def test_reload_failure_is_recorded_separately_from_build_status(build):
+    """
+    @brief 构建成功后重新加载失败，任务仍为succeeded，失败记录在reload_status中
+    @param build 阻塞的构建函数
+    """
+    def failing_reload():
+        """
+        @brief 模拟重新加载检索器失败
+        """
+        raise RuntimeError("index unreadable")
+
+    manager = BuildJobManager(on_success=failing_reload)
+    job = manager.submit()
+    build.release.release()
+    wait_finished(manager, job)
+
+    info = job.to_dict()
+    assert info["status"] == "succeeded"
+    assert info["error"] is None
+    assert info["reload_status"] == "failed"
+    assert info["reload_error"] == "index unreadable"
+
+
+def test_failed_build_reports_the_error_event_and_skips_reload(build):
+    """
+    @brief 构建返回失败时以错误进度事件的消息作为失败原因，且不调用重新加载
+    @param build 阻塞的构建函数
+    """
+    build.results = [False]
+    reloads = []
+    manager = BuildJobManager(on_success=lambda: reloads.append(True))
+    job = manager.submit()
+    build.release.release()
+    wait_finished(manager, job)
+
+    assert job.status == "failed"
+    assert job.error == "未找到文档"
+    assert job.reload_status is None
+    assert reloads == []
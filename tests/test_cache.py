@@ -0,0 +1,201 @@
+from types import SimpleNamespace
+
+import ai_service
+from RAG import cache as cache_module
+from RAG.cache import EmbeddingCache, SQLiteCache, SemanticCache, TTLCache, text_hash
+
+
+def test_semantic_cache_requires_matching_fingerprint():
+    """
+    @brief 同一作用域内只有上下文指纹一致的回答才会命中
+    """
+    cache = SemanticCache(dim=3)
+    cache.put([1.0, 0.0, 0.0], "scope", "context-a", "answer a")
+
+    assert cache.lookup([1.0, 0.01, 0.0], "scope", "context-a")["answer"] == "answer a"
+    assert cache.lookup([1.0, 0.0, 0.0], "scope", "context-b") is None
+    assert cache.lookup([1.0, 0.0, 0.0], "other", "context-a") is None
+    assert cache.lookup([0.0, 1.0, 0.0], "scope", "context-a") is None
+
+    # 相同问题在不同上下文下的回答分别命中
+    cache.put([1.0, 0.0, 0.0], "scope", "context-b", "answer b")
+    assert cache.lookup([1.0, 0.0, 0.0], "scope", "context-b")["answer"] == "answer b"
+    assert cache.stats()["hits"] == 2
+
+
+class FakeRetriever:
+    """
+    @brief 返回固定问题向量和可变上下文的检索器
+    """
+
+    def __init__(self):
+        """
+        @brief 初始化检索器，上下文分块由测试修改
+        """
+        self.chunk_ids = ["a.txt#0"]
+        self.calls = 0
+        self.vector_store = SimpleNamespace(version=1)
+
+    def embed_query(self, query):
+        """
+        @brief 所有问题使用同一个向量
+        @param query 问题
+        @return 问题向量
+        """
+        return [1.0, 0.0, 0.0]
+
+    def retrieve_context(self, query, use_rerank=None):
+        """
+        @brief 返回当前上下文；上下文文本中的分数每次都不同
+        @param query 问题
+        @param use_rerank 是否重排序
+        @return (上下文文本, 分块ID列表)
+        """
+        self.calls += 1
+        return f"context {self.chunk_ids} (相似度: 0.8{self.calls})", list(self.chunk_ids)
+
+
+def test_answer_is_not_reused_when_retrieved_context_changes(monkeypatch):
+    """
+    @brief 检索到相同分块时复用回答，即使分数不同；检索到的分块变化后不再复用旧回答
+    @param monkeypatch pytest的monkeypatch
+    """
+    retriever = FakeRetriever()
+    monkeypatch.setattr(ai_service, "initialize_rag_system", lambda **kwargs: retriever)
+    monkeypatch.setattr(ai_service, "get_answer_cache", lambda: SemanticCache(dim=3))
+    service = ai_service.AIService({"model_type": "ollama", "model_name": "test"})
+    prompts = []
+    monkeypatch.setattr(service, "_call_ollama", lambda prompt: prompts.append(prompt) or f"answer {len(prompts)}")
+
+    assert service.generate_response("question", use_rag=True) == "answer 1"
+    assert service.generate_response("question", use_rag=True) == "answer 1"
+    retriever.chunk_ids = ["a.txt#0", "b.txt#0"]
+    assert service.generate_response("question", use_rag=True) == "answer 2"
+    assert len(prompts) == 2
+    assert service.answer_cache.lookup([1.0, 0.0, 0.0], service._answer_scope(True, None),
+                                       text_hash("a.txt#0\nb.txt#0"))["answer"] == "answer 2"
+
+
+def test_semantic_cache_keeps_answers_for_other_contexts_and_byte_limit():
+    """
+    @brief 相同问题在不同上下文下的回答互不覆盖；超过大小上限的回答不缓存，也不淘汰已有条目
+    """
+    cache = SemanticCache(dim=3, max_size_mb=20 / (1024 * 1024))
+    cache.put([1.0, 0.0, 0.0], "scope", "context-a", "answer a")
+    cache.put([1.0, 0.0, 0.0], "scope", "context-b", "answer b")
+    assert cache.lookup([1.0, 0.0, 0.0], "scope", "context-a")["answer"] == "answer a"
+    assert cache.lookup([1.0, 0.0, 0.0], "scope", "context-b")["answer"] == "answer b"
+
+    # 相同问题、作用域和上下文的回答覆盖旧条目
+    cache.put([1.0, 0.0, 0.0], "scope", "context-a", "answer c")
+    assert cache.lookup([1.0, 0.0, 0.0], "scope", "context-a")["answer"] == "answer c"
+    assert cache.stats()["entries"] == 2
+
+    cache.put([0.0, 1.0, 0.0], "scope", "context-a", "an answer longer than twenty bytes")
+    assert cache.lookup([0.0, 1.0, 0.0], "scope", "context-a") is None
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["evictions"] == 0
+
+
+class FakeClock:
+    """
+    @brief 每次读取前进一秒的时钟，保证访问时间严格递增
+    """
+
+    def __init__(self):
+        """
+        @brief 从0开始计时
+        """
+        self.now = 0.0
+
+    def time(self):
+        """
+        @brief 返回下一个时间点
+        @return 当前时间
+        """
+        self.now += 1.0
+        return self.now
+
+    monotonic = time
+
+
+def test_sqlite_cache_evicts_least_recently_used_down_to_ninety_percent(tmp_path, monkeypatch):
+    """
+    @brief 总大小超过上限时按访问时间淘汰最久未使用的条目，直到降到上限的90%，命中与未命中分别计数
+    @param tmp_path pytest提供的临时目录
+    @param monkeypatch pytest的monkeypatch
+    """
+    monkeypatch.setattr(cache_module, "time", FakeClock())
+    cache = SQLiteCache(tmp_path / "cache.sqlite", max_size_mb=1000 / (1024 * 1024))
+    for key in "abcdefghij":
+        cache.put_many({key: b"x" * 100})
+    assert cache.stats()["size_bytes"] == 1000
+    assert cache.stats()["evictions"] == 0
+
+    # 读取a后它成为最近使用的条目，写入k时淘汰b和c
+    assert cache.get_many(["a", "missing"]) == {"a": b"x" * 100}
+    cache.put_many({"k": b"x" * 100})
+
+    stats = cache.stats()
+    assert stats["size_bytes"] == 900
+    assert stats["entries"] == 9
+    assert stats["evictions"] == 2
+    assert set(cache.get_many(list("abcdefghijk"))) == set("adefghijk")
+    assert cache.stats()["hits"] == 10
+    assert cache.stats()["misses"] == 3
+
+
+def test_sqlite_cache_persists_across_instances(tmp_path):
+    """
+    @brief 缓存写入后重新打开数据库仍可读取，总大小从数据库恢复；替换条目时大小按新值计算
+    @param tmp_path pytest提供的临时目录
+    """
+    path = tmp_path / "cache.sqlite"
+    cache = EmbeddingCache(path)
+    cache.put_embeddings("model", 3, ["a", "b", "c"], [[1.0, 2.0, 3.0], [], [1.0, 2.0]])
+    cache.put_embeddings("model", 3, ["a"], [[4.0, 5.0, 6.0]])
+
+    reopened = EmbeddingCache(path)
+    assert reopened.get_embeddings("model", 3, ["a", "b", "c"]) == [[4.0, 5.0, 6.0], None, None]
+    assert reopened.get_embeddings("other", 3, ["a"]) == [None]
+    assert reopened.stats()["size_bytes"] == 12
+    assert reopened.stats()["entries"] == 1
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    """
+    @brief 超过容量时淘汰最久未访问的条目，读取会刷新条目的访问顺序
+    """
+    cache = TTLCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["hits"] == 3
+    assert cache.stats()["misses"] == 1
+
+
+def test_ttl_cache_expires_entries(monkeypatch):
+    """
+    @brief 条目超过存活时间后视为未命中并被删除，重新写入会刷新存活时间
+    @param monkeypatch pytest的monkeypatch
+    """
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    cache = TTLCache(ttl_seconds=5)
+    cache.put("a", 1)
+    clock.now += 3
+    assert cache.get("a") == 1
+
+    clock.now += 5
+    assert cache.get("a", "gone") == "gone"
+    assert len(cache) == 0
+    assert cache.stats()["expirations"] == 1
+
+    cache.put("a", 2)
+    assert cache.get("a") == 2
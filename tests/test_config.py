@@ -0,0 +1,34 @@
+import json
+
+from config import load_tuning_file
+
+
+def test_tuning_file_is_applied(tmp_path):
+    """
+    @brief 调优结果文件的内容覆盖默认参数
+    @param tmp_path pytest提供的临时目录
+    """
+    path = tmp_path / "tuning.json"
+    path.write_text(json.dumps({"build_trees": 20}), encoding="utf-8")
+    assert load_tuning_file(str(path)) == {"build_trees": 20}
+
+
+def test_missing_or_corrupt_tuning_file_falls_back_to_defaults(tmp_path, caplog):
+    """
+    @brief 调优结果文件缺失、损坏或不是JSON对象时回退到默认参数
+    @param tmp_path pytest提供的临时目录
+    @param caplog pytest的日志捕获
+    """
+    assert load_tuning_file(str(tmp_path / "missing.json")) == {}
+
+    truncated = tmp_path / "truncated.json"
+    truncated.write_text('{"build_trees": 2', encoding="utf-8")
+    assert load_tuning_file(str(truncated)) == {}
+    assert "using defaults" in caplog.text
+
+    not_object = tmp_path / "list.json"
+    not_object.write_text("[1, 2]", encoding="utf-8")
+    assert load_tuning_file(str(not_object)) == {}
+
+    # 目录无法作为文件打开
+    assert load_tuning_file(str(tmp_path)) == {}
@@ -0,0 +1,78 @@
+import pickle
+
+from config import RAG_CONFIG
+from RAG import document_loader
+from RAG.document_loader import DocumentLoader
+
+
+def test_pool_does_not_fork():
+    """
+    @brief 解析进程池不使用fork启动，解析函数可以按名称导入
+    """
+    assert document_loader._pool_context().get_start_method() in ("forkserver", "spawn")
+    # 子进程按名称导入解析函数
+    assert pickle.loads(pickle.dumps(document_loader._load_file)) is document_loader._load_file
+
+
+def test_parallel_load_in_worker_processes(tmp_path, monkeypatch):
+    """
+    @brief 多个文档在子进程中解析，不支持的文件被跳过
+    @param tmp_path pytest提供的临时目录
+    @param monkeypatch pytest的monkeypatch
+    """
+    monkeypatch.setitem(RAG_CONFIG["document_loader"], "max_workers", 2)
+    monkeypatch.setitem(RAG_CONFIG["document_loader"], "max_in_flight", 2)
+    paths = []
+    for i in range(5):
+        path = tmp_path / f"doc{i}.txt"
+        path.write_text(f"document {i}", encoding="utf-8")
+        paths.append(str(path))
+    (tmp_path / "broken.xyz").write_text("unsupported", encoding="utf-8")
+
+    documents = DocumentLoader().load_documents(paths + [str(tmp_path / "broken.xyz")])
+    assert sorted((doc["file_path"], doc["content"]) for doc in documents) == [
+        (path, f"document {i}") for i, path in enumerate(paths)
+    ]
+
+
+def test_csv_rows_keep_extra_cells_and_stay_on_one_line(tmp_path):
+    """
+    @brief 超出表头的单元格以列序号命名，单元格内换行被折叠，每行数据占一行
+    @param tmp_path pytest提供的临时目录
+    """
+    path = tmp_path / "table.csv"
+    path.write_text('name,price\nwidget,3.14,blue,\n"multi\nline",2\n,\ngadget,5\n', encoding="utf-8")
+
+    units = list(DocumentLoader._iter_csv_rows(path, 2))
+    assert units == [
+        ("name: widget; price: 3.14; column_3: blue\nname: multi line; price: 2", {"rows": "1-2"}),
+        ("name: gadget; price: 5", {"rows": "3-4"})
+    ]
+
+
+def test_streamed_files_record_whether_content_was_read(tmp_path, monkeypatch):
+    """
+    @brief 流式读取的文件读完后记录是否读到内容，损坏或只有表头的文件不算读取完成
+    @param tmp_path pytest提供的临时目录
+    @param monkeypatch pytest的monkeypatch
+    """
+    monkeypatch.setitem(RAG_CONFIG["document_loader"], "pdf_stream_threshold_mb", 0)
+    table = tmp_path / "table.csv"
+    table.write_text("name,price\nwidget,3\n", encoding="utf-8")
+    header_only = tmp_path / "header.csv"
+    header_only.write_text("name,price\n", encoding="utf-8")
+    broken = tmp_path / "broken.pdf"
+    broken.write_bytes(b"not a pdf")
+
+    documents = DocumentLoader().load_documents([str(table), str(header_only), str(broken)])
+    units = {doc["file_path"]: list(doc["units"]) for doc in documents}
+    assert units == {
+        str(table): [("name: widget; price: 3", {"rows": "1-1"})],
+        str(header_only): [],
+        str(broken): []
+    }
+    assert {doc["file_path"]: doc["complete"] for doc in documents} == {
+        str(table): True,
+        str(header_only): False,
+        str(broken): False
+    }
@@ -0,0 +1,218 @@
+import asyncio
+import threading
+import time
+
+from RAG import _embed_in_batches, embeddings
+from RAG.embeddings import EmbeddingModel
+from config import RAG_CONFIG
+
+
+class SlowCache:
+    """
+    @brief 读写都会阻塞的嵌入缓存，记录执行读写的线程
+    """
+
+    def __init__(self):
+        """
+        @brief 初始化空缓存
+        """
+        self.data = {}
+        self.threads = []
+
+    def get_embeddings(self, model_name, dim, texts):
+        """
+        @brief 模拟缓慢的缓存读取
+        @param model_name 模型名称
+        @param dim 向量维度
+        @param texts 文本列表
+        @return 与texts对应的向量，未命中为None
+        """
+        self.threads.append(threading.get_ident())
+        time.sleep(0.2)
+        return [self.data.get(text) for text in texts]
+
+    def put_embeddings(self, model_name, dim, texts, vectors):
+        """
+        @brief 模拟缓慢的缓存写入
+        @param model_name 模型名称
+        @param dim 向量维度
+        @param texts 文本列表
+        @param vectors 向量列表
+        """
+        self.threads.append(threading.get_ident())
+        time.sleep(0.2)
+        self.data.update(zip(texts, vectors))
+
+
+def test_async_embedding_does_not_block_event_loop_on_cache(monkeypatch):
+    """
+    @brief 异步嵌入的缓存读写在线程中执行，不阻塞事件循环
+    @param monkeypatch pytest的monkeypatch
+    """
+    cache = SlowCache()
+    monkeypatch.setattr(embeddings, "get_embedding_cache", lambda: cache)
+    model = EmbeddingModel()
+    model.model_type = "ollama"
+
+    async def fake_embed(texts):
+        """
+        @brief 以文本长度作为向量的假嵌入
+        @param texts 文本列表
+        @return 向量列表
+        """
+        return [[float(len(text))] for text in texts]
+    monkeypatch.setattr(model, "_aembed_with_ollama", fake_embed)
+
+    async def main():
+        """
+        @brief 缓存读写期间运行计时任务
+        @return (事件循环线程, 计时次数, 第一次结果, 第二次结果)
+        """
+        ticks = 0
+
+        async def ticker():
+            """
+            @brief 每10毫秒计数一次，事件循环被阻塞时停止计数
+            """
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        task = asyncio.create_task(ticker())
+        first = await model.aembed_texts(["a", "bb"])
+        second = await model.aembed_texts(["bb"])
+        task.cancel()
+        return threading.get_ident(), ticks, first, second
+
+    loop_thread, ticks, first, second = asyncio.run(main())
+    assert first == [[1.0], [2.0]]
+    assert second == [[2.0]]
+    assert len(cache.threads) == 3
+    assert loop_thread not in cache.threads
+    # 缓存阻塞约0.6秒，其间事件循环仍在运行其他任务
+    assert ticks >= 20
+
+
+class FakeResponse:
+    """
+    @brief 模拟/api/embed的HTTP响应
+    """
+
+    def __init__(self, status_code, payload):
+        """
+        @brief 初始化响应
+        @param status_code HTTP状态码
+        @param payload JSON内容
+        """
+        self.status_code = status_code
+        self.payload = payload
+        self.text = str(payload)
+
+    def json(self):
+        """
+        @brief 返回JSON内容
+        @return JSON内容
+        """
+        return self.payload
+
+
+class FakeSession:
+    """
+    @brief 模拟/api/embed：文本"bad"返回维度错误的向量，包含"down"的批次返回500，其余返回[长度, 序号]
+    """
+
+    def __init__(self):
+        """
+        @brief 初始化请求记录
+        """
+        self.batches = []
+
+    def post(self, url, json, timeout):
+        """
+        @brief 处理一次批量嵌入请求
+        @param url 请求地址
+        @param json 请求体
+        @param timeout 超时时间
+        @return FakeResponse
+        """
+        texts = json["input"]
+        self.batches.append(texts)
+        if "down" in texts:
+            return FakeResponse(500, {"error": "unavailable"})
+        return FakeResponse(200, {"embeddings": [
+            [0.5] if text == "bad" else [float(len(text)), float(len(self.batches))] for text in texts
+        ]})
+
+
+def test_batch_failures_fall_back_to_single_requests_in_order(monkeypatch):
+    """
+    @brief 批量请求中无效的向量和失败批次中的文本逐条重试，结果顺序与输入一致，空白文本不发送请求
+    @param monkeypatch pytest的monkeypatch
+    """
+    monkeypatch.setattr(embeddings, "get_embedding_cache", lambda: None)
+    model = EmbeddingModel()
+    model.model_type = "ollama"
+    model.dim = 2
+    model.batch_size = 2
+    model.session = FakeSession()
+    singles = []
+    monkeypatch.setattr(model, "_embed_single", lambda text: singles.append(text) or [-1.0, float(len(singles))])
+
+    result = model.embed_texts(["a", "", "bad", "ccc", "down", "dd", "  "])
+
+    assert model.session.batches == [["a", "bad"], ["ccc", "down"], ["dd"]]
+    assert singles == ["bad", "ccc", "down"]
+    assert result == [[1.0, 1.0], [], [-1.0, 1.0], [-1.0, 2.0], [-1.0, 3.0], [2.0, 3.0], []]
+
+
+class ReversedBatchModel:
+    """
+    @brief 后提交的批次先完成的嵌入模型；包含"boom"的批次抛出异常，包含"short"的批次少返回一个向量
+    """
+
+    dim = 2
+    batch_size = 2
+
+    def __init__(self):
+        """
+        @brief 初始化完成顺序记录
+        """
+        self.completed = []
+        self._lock = threading.Lock()
+
+    def embed_texts(self, texts):
+        """
+        @brief 按批次序号倒序延迟后返回[批次首个文本序号, 批内位置]
+        @param texts 批次文本，以一位数字的文本序号结尾，形如"t3"
+        @return 向量列表
+        """
+        first = int(texts[0][-1])
+        time.sleep(0.05 * (10 - first) / self.batch_size)
+        with self._lock:
+            self.completed.append(first)
+        if "boom" in texts[0]:
+            raise RuntimeError("batch failed")
+        vectors = [[float(first), float(offset)] for offset in range(len(texts))]
+        return vectors[:-1] if "short" in texts[0] else vectors
+
+
+def test_embed_in_batches_keeps_input_order_when_batches_finish_out_of_order(monkeypatch):
+    """
+    @brief 批次乱序完成时结果仍与输入对齐；失败批次和缺失的向量以零向量填充并记录下标
+    @param monkeypatch pytest的monkeypatch
+    """
+    monkeypatch.setitem(RAG_CONFIG["embeddings"], "max_concurrency", 4)
+    model = ReversedBatchModel()
+    texts = ["t0", "t1", "boom2", "t3", "t4", "t5", "short6", "t7", "t8"]
+    events = []
+
+    result, failed = _embed_in_batches(model, texts, lambda **kwargs: events.append(kwargs))
+
+    assert model.completed != sorted(model.completed)
+    assert result == [
+        [0.0, 0.0], [0.0, 1.0], [0.0, 0.0], [0.0, 0.0], [4.0, 0.0],
+        [4.0, 1.0], [6.0, 0.0], [0.0, 0.0], [8.0, 0.0]
+    ]
+    assert failed == {2, 3, 7}
+    assert [event["current"] for event in events] == [0, 1, 2, 3, 4, 5]
@@ -0,0 +1,132 @@
+import numpy as np
+import pytest
+
+from config import RAG_CONFIG
+from RAG.index_backends import (
+    IVF_PQ_MIN_AUTO_ITEMS, BruteForceBackend, IVFPQBackend, load_backend, select_backend_type
+)
+
+DIM = 16
+
+
+@pytest.fixture
+def ivf_config(monkeypatch):
+    """
+    @brief 使用能整除测试维度的子量化器数
+    @param monkeypatch pytest的monkeypatch
+    """
+    monkeypatch.setitem(RAG_CONFIG["vector_store"], "pq_m", 4)
+    monkeypatch.setitem(RAG_CONFIG["vector_store"], "ivf_nlist", 0)
+    monkeypatch.setitem(RAG_CONFIG["vector_store"], "ivf_nprobe", 16)
+    monkeypatch.setitem(RAG_CONFIG["vector_store"], "ivf_rerank_factor", 10)
+
+
+def clustered(count, seed=0):
+    """
+    @brief 生成带聚类结构的归一化向量及其附近的查询
+    @param count 向量数
+    @param seed 随机种子
+    @return (向量矩阵, 查询矩阵)
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((20, DIM))
+    vectors = centers[rng.integers(0, 20, count)] + 0.5 * rng.standard_normal((count, DIM))
+    queries = vectors[rng.choice(count, 50, replace=False)] + 0.1 * rng.standard_normal((50, DIM))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vectors.astype(np.float32), queries.astype(np.float32)
+
+
+def build(backend_cls, vectors):
+    """
+    @brief 构建后端索引
+    @param backend_cls 后端类
+    @param vectors 向量矩阵
+    @return 已构建的后端
+    """
+    backend = backend_cls(DIM)
+    backend.add(vectors)
+    backend.build()
+    return backend
+
+
+def test_ivf_pq_recall_against_brute_force(ivf_config):
+    """
+    @brief IVF-PQ的召回率接近精确检索，返回的分数是精确内积
+    @param ivf_config IVF-PQ测试配置
+    """
+    vectors, queries = clustered(5000)
+    ivf = build(IVFPQBackend, vectors)
+    exact = build(BruteForceBackend, vectors)
+
+    recalls = []
+    for query in queries:
+        rows, scores = ivf.search(query, 10)
+        expected, _ = exact.search(query, 10)
+        recalls.append(len(set(rows) & set(expected)) / 10)
+        # 候选用原始向量重排，返回的分数是精确的内积
+        np.testing.assert_allclose(scores, vectors[rows] @ query, rtol=1e-5, atol=1e-6)
+    assert np.mean(recalls) >= 0.95
+
+
+def test_ivf_pq_save_load_round_trip(ivf_config, tmp_path):
+    """
+    @brief 内存映射的.ivfpq文件保存后重新加载，检索结果不变
+    @param ivf_config IVF-PQ测试配置
+    @param tmp_path pytest提供的临时目录
+    """
+    vectors, queries = clustered(2000, seed=1)
+    ivf = build(IVFPQBackend, vectors)
+    before = [ivf.search(query, 10) for query in queries]
+    prefix = tmp_path / "index_summary"
+    ivf.save(prefix)
+
+    loaded = load_backend(prefix, DIM)
+    assert isinstance(loaded, IVFPQBackend)
+    assert len(loaded) == len(vectors)
+    # 大数组以内存映射方式读取
+    assert isinstance(loaded.codes, np.memmap)
+    assert isinstance(loaded.vectors, np.memmap)
+    np.testing.assert_array_equal(loaded.get_vectors(np.arange(len(vectors))), vectors)
+    np.testing.assert_array_equal(loaded.centroids, ivf.centroids)
+    np.testing.assert_array_equal(loaded.codes, ivf.codes)
+    for query, (rows, scores) in zip(queries, before):
+        loaded_rows, loaded_scores = loaded.search(query, 10)
+        np.testing.assert_array_equal(loaded_rows, rows)
+        np.testing.assert_allclose(loaded_scores, scores)
+
+    with pytest.raises(ValueError):
+        load_backend(prefix, DIM * 2)
+
+
+def test_auto_selection_thresholds(monkeypatch):
+    """
+    @brief auto模式按默认阈值选择后端
+    @param monkeypatch pytest的monkeypatch
+    """
+    config = RAG_CONFIG["vector_store"]
+    monkeypatch.setitem(config, "type", "auto")
+    monkeypatch.setitem(config, "brute_force_max_items", 50000)
+    monkeypatch.setitem(config, "ivf_pq_min_items", 1000000)
+    assert select_backend_type(300) == "brute_force"
+    assert select_backend_type(50000) == "brute_force"
+    assert select_backend_type(50001) == "annoy"
+    assert select_backend_type(1000000) == "ivf_pq"
+
+
+def test_auto_never_selects_ivf_pq_for_small_corpora(monkeypatch):
+    """
+    @brief 配置的阈值很小时，auto模式也不会为小语料选择IVF-PQ
+    @param monkeypatch pytest的monkeypatch
+    """
+    config = RAG_CONFIG["vector_store"]
+    monkeypatch.setitem(config, "type", "auto")
+    monkeypatch.setitem(config, "brute_force_max_items", 0)
+    monkeypatch.setitem(config, "ivf_pq_min_items", 100)
+    for count in [1, 300, IVF_PQ_MIN_AUTO_ITEMS - 1]:
+        assert select_backend_type(count) != "ivf_pq"
+    assert select_backend_type(IVF_PQ_MIN_AUTO_ITEMS) == "ivf_pq"
+
+    # 显式配置的后端不受自动阈值限制
+    monkeypatch.setitem(config, "type", "ivf_pq")
+    assert select_backend_type(300) == "ivf_pq"
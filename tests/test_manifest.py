@@ -0,0 +1,182 @@
+import RAG
+from conftest import DIM, make_chunks
+from RAG import manifest as manifest_module
+from RAG.manifest import DocumentManifest
+from RAG.vector_store import VectorStore
+
+
+def write_file(path, text):
+    """
+    @brief 写入测试文档
+    @param path 文件路径
+    @param text 文件内容
+    @return 文件路径字符串
+    """
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def record(manifest, file_paths, chunks=()):
+    """
+    @brief 模拟一次成功构建：对比文件并把结果写入清单
+    @param manifest 文档清单
+    @param file_paths 当前文档路径
+    @param chunks 本次生成的文本块
+    @return 本次构建的差异
+    """
+    changes = manifest.diff(file_paths)
+    RAG._update_manifest(manifest, changes, changes.changed, list(chunks))
+    return changes
+
+
+def test_diff_classifies_added_modified_deleted_and_unchanged(tmp_path):
+    """
+    @brief 对比清单得出新增、修改、删除和未变化的文件
+    @param tmp_path pytest提供的临时目录
+    """
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    a = write_file(docs / "a.txt", "alpha")
+    b = write_file(docs / "b.txt", "beta")
+    c = write_file(docs / "c.txt", "gamma")
+    manifest = DocumentManifest(tmp_path / "manifest.json")
+    first = record(manifest, [a, b, c])
+    assert sorted(first.added) == [a, b, c]
+
+    # 重新加载清单，确认保存的是持久化结果
+    manifest = DocumentManifest(tmp_path / "manifest.json")
+    write_file(docs / "b.txt", "beta, edited")
+    (docs / "c.txt").unlink()
+    d = write_file(docs / "d.txt", "delta")
+    changes = manifest.diff([a, b, d])
+
+    assert changes.added == [d]
+    assert changes.modified == [b]
+    assert changes.deleted == [c]
+    assert changes.unchanged == [a]
+    assert sorted(changes.changed) == [b, d]
+    assert sorted(changes.removed_sources) == [b, c]
+    assert changes.has_changes()
+
+
+def test_unchanged_files_produce_no_changes(tmp_path):
+    """
+    @brief 文件未变化时没有需要处理的差异
+    @param tmp_path pytest提供的临时目录
+    """
+    a = write_file(tmp_path / "a.txt", "alpha")
+    manifest = DocumentManifest(tmp_path / "manifest.json")
+    record(manifest, [a])
+
+    changes = DocumentManifest(tmp_path / "manifest.json").diff([a])
+    assert changes.unchanged == [a]
+    assert not changes.has_changes()
+
+
+def test_rebuild_without_changes_skips_embedding(store_dir, monkeypatch):
+    """
+    @brief 文档未变化时增量构建直接返回，不生成嵌入
+    @param store_dir 临时向量存储目录
+    @param monkeypatch pytest的monkeypatch
+    """
+    docs = store_dir / "docs"
+    docs.mkdir()
+    a = write_file(docs / "a.txt", "alpha")
+    monkeypatch.setattr(manifest_module, "VECTOR_STORE_DIR", str(store_dir))
+    monkeypatch.setattr(RAG.DocumentLoader, "list_files", lambda self: [a])
+
+    chunks, vectors = make_chunks(a, 3)
+    assert VectorStore().add_chunks(chunks, vectors)
+    record(DocumentManifest(), [a], chunks)
+
+    def fail(*args, **kwargs):
+        """
+        @brief 未变化的文档不应生成嵌入
+        """
+        raise AssertionError("unchanged documents must not be re-embedded")
+    monkeypatch.setattr(RAG, "EmbeddingModel", fail)
+    events = []
+    assert RAG.build_vector_store(progress_callback=lambda **kwargs: events.append(kwargs))
+    assert events[-1]["status"] == "completed"
+
+
+def test_fallback_summary_is_retried_on_next_build(tmp_path):
+    """
+    @brief 含回退摘要的文件在下次构建时重新处理，重试成功后不再处理
+    @param tmp_path pytest提供的临时目录
+    """
+    a = write_file(tmp_path / "a.txt", "alpha")
+    b = write_file(tmp_path / "b.txt", "beta")
+    chunks = make_chunks(a, 2)[0] + make_chunks(b, 2)[0]
+    chunks[1]["summary_fallback"] = True
+    manifest = DocumentManifest(tmp_path / "manifest.json")
+    record(manifest, [a, b], chunks)
+
+    manifest = DocumentManifest(tmp_path / "manifest.json")
+    changes = manifest.diff([a, b])
+    assert changes.modified == [a]
+    assert changes.unchanged == [b]
+
+    # 重试成功后不再重复处理
+    retry_chunks = make_chunks(a, 2)[0]
+    RAG._update_manifest(manifest, changes, changes.changed, retry_chunks)
+    assert not DocumentManifest(tmp_path / "manifest.json").diff([a, b]).has_changes()
+
+
+class FlakyEmbeddingModel:
+    """
+    @brief 对含有"broken"的文本返回空向量的假嵌入模型
+    """
+    dim = DIM
+    batch_size = 1
+    cache = None
+
+    def embed_texts(self, texts):
+        """
+        @brief 以文本长度生成向量，含有"broken"的文本嵌入失败
+        @param texts 文本列表
+        @return 向量列表
+        """
+        return [[] if "broken" in text else [float(len(text))] + [1.0] * (DIM - 1) for text in texts]
+
+
+def test_failed_embeddings_are_retried_on_next_build(store_dir, monkeypatch):
+    """
+    @brief 文本块嵌入失败的文件记为需要重试，下次构建时重新处理
+    @param store_dir 临时向量存储目录
+    @param monkeypatch pytest的monkeypatch
+    """
+    docs = store_dir / "docs"
+    docs.mkdir()
+    a = write_file(docs / "a.txt", "alpha")
+    b = write_file(docs / "b.txt", "broken beta")
+    monkeypatch.setattr(manifest_module, "VECTOR_STORE_DIR", str(store_dir))
+    monkeypatch.setattr(RAG.DocumentLoader, "list_files", lambda self: [a, b])
+    monkeypatch.setattr(RAG.TextSplitter, "_summarize", lambda self, text: (text, False))
+    monkeypatch.setattr(RAG, "EmbeddingModel", FlakyEmbeddingModel)
+
+    assert RAG.build_vector_store(full_rebuild=True)
+    changes = DocumentManifest().diff([a, b])
+    assert changes.modified == [b]
+    assert changes.unchanged == [a]
+
+
+def test_streamed_file_without_content_is_not_recorded(store_dir, monkeypatch):
+    """
+    @brief 流式读取没有得到内容的文件不记入清单，下次构建时重试
+    @param store_dir 临时向量存储目录
+    @param monkeypatch pytest的monkeypatch
+    """
+    docs = store_dir / "docs"
+    docs.mkdir()
+    a = write_file(docs / "a.txt", "alpha")
+    header_only = write_file(docs / "header.csv", "name,price\n")
+    monkeypatch.setattr(manifest_module, "VECTOR_STORE_DIR", str(store_dir))
+    monkeypatch.setattr(RAG.DocumentLoader, "list_files", lambda self: [a, header_only])
+    monkeypatch.setattr(RAG.TextSplitter, "_summarize", lambda self, text: (text, False))
+    monkeypatch.setattr(RAG, "EmbeddingModel", FlakyEmbeddingModel)
+
+    assert RAG.build_vector_store(full_rebuild=True)
+    changes = DocumentManifest().diff([a, header_only])
+    assert changes.added == [header_only]
+    assert changes.unchanged == [a]
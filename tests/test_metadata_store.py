@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from RAG.metadata_store import MAGIC, MetadataReader, migrate_json_metadata, write_metadata
+
+
+def test_round_trip_keeps_unicode_and_empty_fields(tmp_path):
+    """
+    @brief 写出后读回的元数据与分块ID与原始数据一致，包括中文、emoji、空字符串和空元数据
+    @param tmp_path pytest提供的临时目录
+    """
+    records = [
+        {"source": "文档/说明.txt", "text": "你好，世界 🌏", "page": 1},
+        {},
+        {"source": "", "text": "", "tags": []},
+    ]
+    chunk_ids = ["说明.txt#0", "", "empty#2"]
+    path = tmp_path / "meta.bin"
+    write_metadata(path, iter(records), chunk_ids)
+
+    reader = MetadataReader(path)
+    assert len(reader) == 3
+    assert list(reader.records) == records
+    assert list(reader.chunk_ids) == chunk_ids
+    assert reader.records[-1] == records[-1]
+    assert reader.chunk_ids[1:] == chunk_ids[1:]
+    with pytest.raises(IndexError):
+        reader.records[3]
+    assert not (tmp_path / "meta.bin.tmp").exists()
+
+
+def test_empty_metadata_round_trips(tmp_path):
+    """
+    @brief 没有条目的元数据文件也能读回
+    @param tmp_path pytest提供的临时目录
+    """
+    path = tmp_path / "meta.bin"
+    write_metadata(path, [], [])
+    reader = MetadataReader(path)
+    assert len(reader) == 0
+    assert list(reader.records) == []
+
+
+@pytest.mark.parametrize("records", [[{"a": 1}], [{"a": 1}, {"b": 2}, {"c": 3}]])
+def test_record_count_mismatch_raises_and_keeps_existing_file(tmp_path, records):
+    """
+    @brief 元数据条数与分块ID数不一致时抛出异常，已有文件保持不变且不留下临时文件
+    @param tmp_path pytest提供的临时目录
+    @param records 条数少于或多于分块ID的元数据
+    """
+    path = tmp_path / "meta.bin"
+    write_metadata(path, [{"old": True}], ["old#0"])
+
+    with pytest.raises(ValueError):
+        write_metadata(path, records, ["a#0", "b#0"])
+
+    assert list(MetadataReader(path).records) == [{"old": True}]
+    assert not (tmp_path / "meta.bin.tmp").exists()
+
+
+def test_bad_magic_raises(tmp_path):
+    """
+    @brief 魔数不正确的文件被拒绝
+    @param tmp_path pytest提供的临时目录
+    """
+    path = tmp_path / "meta.bin"
+    write_metadata(path, [{"a": 1}], ["a#0"])
+    data = path.read_bytes()
+    path.write_bytes(b"NOTMETA1" + data[len(MAGIC):])
+
+    with pytest.raises(ValueError):
+        MetadataReader(path)
+
+
+def test_legacy_json_metadata_is_migrated(tmp_path):
+    """
+    @brief 旧版JSON元数据转换为二进制格式后可由MetadataReader读回，原JSON文件保持不变
+    @param tmp_path pytest提供的临时目录
+    """
+    legacy = {
+        "chunks": [{"source": "旧文档.txt", "text": "旧内容"}, {"source": "b.txt", "text": ""}],
+        "chunk_ids": ["旧文档.txt#0", "b.txt#0"],
+    }
+    json_path = tmp_path / "index_metadata.json"
+    json_path.write_text(json.dumps(legacy, ensure_ascii=False, indent=2), encoding="utf-8")
+    bin_path = tmp_path / "index_metadata.bin"
+
+    assert migrate_json_metadata(json_path, bin_path)
+
+    reader = MetadataReader(bin_path)
+    assert list(reader.records) == legacy["chunks"]
+    assert list(reader.chunk_ids) == legacy["chunk_ids"]
+    assert json.loads(json_path.read_text(encoding="utf-8")) == legacy
+
+
+def test_migrating_malformed_json_fails(tmp_path):
+    """
+    @brief 旧版JSON中条目数不一致时转换失败且不生成二进制文件
+    @param tmp_path pytest提供的临时目录
+    """
+    json_path = tmp_path / "index_metadata.json"
+    json_path.write_text(json.dumps({"chunks": [{"a": 1}], "chunk_ids": []}), encoding="utf-8")
+    bin_path = tmp_path / "index_metadata.bin"
+
+    assert not migrate_json_metadata(json_path, bin_path)
+    assert not bin_path.exists()
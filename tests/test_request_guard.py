@@ -0,0 +1,344 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import ai_service
+import main
+from RAG import async_http
+from request_guard import guard_request
+
+
+class FakeRequest:
+    """
+    @brief 模拟HTTP请求，is_disconnected返回预设值
+    """
+
+    def __init__(self, disconnected=False):
+        """
+        @brief 初始化模拟请求
+        @param disconnected 客户端是否已断开
+        """
+        self.disconnected = disconnected
+
+    async def is_disconnected(self):
+        """
+        @brief 返回客户端是否已断开
+        @return 预设的断开状态
+        """
+        return self.disconnected
+
+
+@pytest.fixture(autouse=True)
+def fresh_stats(monkeypatch):
+    """
+    @brief 每个测试使用独立的请求统计，并缩短断开检测间隔
+    """
+    monkeypatch.setattr(async_http, "_request_stats", {key: 0 for key in async_http._request_stats})
+    monkeypatch.setitem(async_http.SERVICE_CONFIG, "disconnect_poll_interval", 0.01)
+
+
+async def collect(request, stream):
+    """
+    @brief 迭代guard_request并收集产出
+    @param request 模拟请求
+    @param stream 被保护的异步迭代器
+    @return 产出列表
+    """
+    return [item async for item in guard_request(request, stream)]
+
+
+def test_completed_stream_is_recorded_as_completed():
+    """
+    @brief 正常结束的流记录为completed
+    """
+    async def tokens():
+        """
+        @brief 依次产出两个token
+        """
+        yield "a"
+        yield "b"
+
+    assert asyncio.run(collect(FakeRequest(), tokens())) == ["a", "b"]
+    assert async_http.cancellation_stats()["requests"]["completed"] == 1
+
+
+def test_upstream_error_is_recorded_as_failed_not_disconnected():
+    """
+    @brief 上游出错记录为failed，而不是disconnected
+    """
+    async def tokens():
+        """
+        @brief 产出一个token后模拟上游出错
+        """
+        yield "a"
+        raise RuntimeError("ollama error")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(collect(FakeRequest(), tokens()))
+    requests = async_http.cancellation_stats()["requests"]
+    assert requests["failed"] == 1
+    assert requests["disconnected"] == 0
+
+
+def test_disconnect_cancels_pending_call():
+    """
+    @brief 客户端断开时取消等待中的上游调用
+    """
+    cancelled = []
+
+    async def tokens():
+        """
+        @brief 长时间等待上游，记录是否被取消
+        """
+        try:
+            await asyncio.sleep(10)
+            yield "never"
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def run():
+        """
+        @brief 客户端已断开时消费流
+        @return 收到的token列表
+        """
+        result = await collect(FakeRequest(disconnected=True), tokens())
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(run()) == []
+    assert cancelled == [True]
+    assert async_http.cancellation_stats()["requests"]["disconnected"] == 1
+
+
+def test_closing_while_yielding_is_recorded_as_disconnected():
+    """
+    @brief 产出过程中被关闭记录为disconnected
+    """
+    async def tokens():
+        """
+        @brief 依次产出两个token
+        """
+        yield "a"
+        yield "b"
+
+    async def run():
+        """
+        @brief 读取一个token后关闭流
+        """
+        guarded = guard_request(FakeRequest(), tokens())
+        assert await guarded.__anext__() == "a"
+        await guarded.aclose()
+
+    asyncio.run(run())
+    assert async_http.cancellation_stats()["requests"]["disconnected"] == 1
+
+
+def test_deadline_exceeded(monkeypatch):
+    """
+    @brief 超过截止时间记录为deadline_exceeded
+    @param monkeypatch pytest的monkeypatch
+    """
+    monkeypatch.setitem(async_http.SERVICE_CONFIG, "request_deadline", 0.05)
+
+    async def tokens():
+        """
+        @brief 长时间等待上游
+        """
+        await asyncio.sleep(10)
+        yield "never"
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(collect(FakeRequest(), tokens()))
+    assert async_http.cancellation_stats()["requests"]["deadline_exceeded"] == 1
+
+
+class FakeStreamResponse:
+    """
+    @brief 模拟httpx的流式响应，逐行返回NDJSON
+    """
+
+    def __init__(self, lines):
+        """
+        @brief 初始化响应
+        @param lines 响应行
+        """
+        self.lines = lines
+
+    def raise_for_status(self):
+        """
+        @brief 状态码总是成功
+        """
+
+    async def aiter_lines(self):
+        """
+        @brief 逐行产出响应内容
+        """
+        for line in self.lines:
+            yield line
+
+
+class FakeStreamContext:
+    """
+    @brief client.stream(...)返回的异步上下文管理器
+    """
+
+    def __init__(self, lines):
+        """
+        @brief 初始化上下文
+        @param lines 响应行
+        """
+        self.response = FakeStreamResponse(lines)
+
+    async def __aenter__(self):
+        """
+        @brief 进入上下文
+        @return 模拟的流式响应
+        """
+        return self.response
+
+    async def __aexit__(self, *exc_info):
+        """
+        @brief 退出上下文
+        @param exc_info 异常信息
+        """
+        return False
+
+
+class FakeClient:
+    """
+    @brief 模拟共享的异步HTTP客户端
+    """
+
+    def __init__(self, lines):
+        """
+        @brief 初始化客户端
+        @param lines 每次流式请求返回的响应行
+        """
+        self.lines = lines
+
+    def stream(self, method, url, **kwargs):
+        """
+        @brief 发起流式请求
+        @param method HTTP方法
+        @param url 请求地址
+        @param kwargs 其他请求参数
+        @return 模拟的流式响应上下文
+        """
+        return FakeStreamContext(self.lines)
+
+
+def stream_ollama(monkeypatch, lines):
+    """
+    @brief 让_astream_ollama读取给定的NDJSON行并收集产出的token
+    @param monkeypatch pytest的monkeypatch
+    @param lines Ollama返回的行
+    @return token列表
+    """
+    client = FakeClient(lines)
+    monkeypatch.setattr(ai_service, "get_async_client", lambda: client)
+    service = ai_service.AIService.__new__(ai_service.AIService)
+    service.ollama_host = "http://ollama"
+    service.model_name = "test"
+    service.generation_timeout = 1
+
+    async def run():
+        """
+        @brief 消费token流
+        @return token列表
+        """
+        return [token async for token in service._astream_ollama("prompt")]
+
+    return asyncio.run(run())
+
+
+def test_astream_ollama_parses_ndjson_until_done(monkeypatch):
+    """
+    @brief 逐行解析NDJSON：跳过空行和空token，done之后的行不再产出
+    @param monkeypatch pytest的monkeypatch
+    """
+    lines = [
+        json.dumps({"response": "你好", "done": False}),
+        "",
+        "   ",
+        json.dumps({"response": "", "done": False}),
+        json.dumps({"response": ", world", "done": False}),
+        json.dumps({"response": "!", "done": True}),
+        json.dumps({"response": "ignored", "done": False}),
+    ]
+    assert stream_ollama(monkeypatch, lines) == ["你好", ", world", "!"]
+
+
+def test_astream_ollama_raises_on_error_line(monkeypatch):
+    """
+    @brief Ollama在流中返回错误时抛出异常
+    @param monkeypatch pytest的monkeypatch
+    """
+    lines = [json.dumps({"response": "a"}), json.dumps({"error": "model not found"})]
+    with pytest.raises(RuntimeError, match="model not found"):
+        stream_ollama(monkeypatch, lines)
+
+
+class FakeStreamingService:
+    """
+    @brief 逐个产出预设token的AI服务，可在最后抛出异常
+    """
+
+    def __init__(self, tokens, error=None):
+        """
+        @brief 初始化服务
+        @param tokens 预设token
+        @param error 产出全部token后抛出的异常
+        """
+        self.tokens = tokens
+        self.error = error
+
+    async def astream_response(self, message, use_rag, use_rerank=None):
+        """
+        @brief 产出预设token
+        @param message 用户消息
+        @param use_rag 是否使用RAG
+        @param use_rerank 是否重排序
+        """
+        for token in self.tokens:
+            yield token
+        if self.error is not None:
+            raise self.error
+
+
+def read_events(monkeypatch, service):
+    """
+    @brief 请求/chat_stream并解析SSE事件
+    @param monkeypatch pytest的monkeypatch
+    @param service 替代的AI服务
+    @return (响应, 事件列表)
+    """
+    monkeypatch.setattr(main, "ai_service", service)
+    response = TestClient(main.app).post("/chat_stream", json={"message": "hi", "use_rag": False})
+    body = response.text
+    assert body.endswith("\n\n")
+    frames = body[:-2].split("\n\n")
+    assert all(frame.startswith("data: ") and "\n" not in frame for frame in frames)
+    return response, [json.loads(frame[len("data: "):]) for frame in frames]
+
+
+def test_chat_stream_frames_tokens_as_sse_events(monkeypatch):
+    """
+    @brief 每个token一个SSE事件，包含换行的token被JSON转义而不会拆开事件，最后发送done
+    @param monkeypatch pytest的monkeypatch
+    """
+    response, events = read_events(monkeypatch, FakeStreamingService(["你好", "line\n\nbreak", " "]))
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["cache-control"] == "no-cache"
+    assert events == [{"token": "你好"}, {"token": "line\n\nbreak"}, {"token": " "}, {"done": True}]
+
+
+def test_chat_stream_reports_errors_before_done(monkeypatch):
+    """
+    @brief 生成出错时发送error事件，然后仍以done结束
+    @param monkeypatch pytest的monkeypatch
+    """
+    _, events = read_events(monkeypatch, FakeStreamingService(["a"], RuntimeError("upstream failed")))
+    assert events == [{"token": "a"}, {"error": "upstream failed"}, {"done": True}]
@@ -0,0 +1,162 @@
+import asyncio
+
+import pytest
+from pydantic import ValidationError
+
+from conftest import DIM, make_chunks
+from main import RetrieveBatchRequest
+from RAG.cache import TTLCache
+from RAG.retriever import Retriever
+from RAG.vector_store import VectorStore
+from config import SERVICE_CONFIG
+
+
+class FakeEmbeddingModel:
+    """
+    @brief 按预设表返回查询向量的嵌入模型，未知查询返回空向量
+    """
+
+    def __init__(self, vectors):
+        """
+        @brief 初始化嵌入模型
+        @param vectors 查询到向量的映射
+        """
+        self.vectors = vectors
+        self.model_name = "fake"
+        self.requests = []
+
+    def embed_texts(self, texts):
+        """
+        @brief 返回各文本的预设向量
+        @param texts 文本列表
+        @return 向量列表
+        """
+        self.requests.append(list(texts))
+        return [self.vectors.get(text, []) for text in texts]
+
+    async def aembed_texts(self, texts):
+        """
+        @brief embed_texts的异步版本
+        @param texts 文本列表
+        @return 向量列表
+        """
+        return self.embed_texts(texts)
+
+
+@pytest.fixture
+def retriever(store_dir):
+    """
+    @brief 基于两个文档的检索器，其中a.txt被修改过，旧分块已被墓碑删除
+    @param store_dir 临时向量存储目录
+    @return (检索器, 被删除的分块向量, 存活的分块向量)
+    """
+    store = VectorStore()
+    old_chunks, old_vectors = make_chunks("a.txt", 4, seed=1)
+    other_chunks, other_vectors = make_chunks("b.txt", 4, seed=2)
+    assert store.add_chunks(old_chunks + other_chunks, old_vectors + other_vectors)
+    new_chunks, new_vectors = make_chunks("a.txt", 2, seed=3)
+    for chunk in new_chunks:
+        chunk["chunk_id"] += "-v2"
+    assert store.merge_chunks(new_chunks, new_vectors)
+    store.close()
+
+    retriever = Retriever()
+    retriever.embedding_model = FakeEmbeddingModel({
+        "tombstoned": old_vectors[0],
+        "live": other_vectors[1],
+        "new": new_vectors[0],
+        "wrong dim": [0.5] * (DIM - 1),
+    })
+    retriever.query_cache = None
+    retriever.result_cache = None
+    yield retriever, old_chunks
+    retriever.close()
+
+
+QUERIES = ["live", "tombstoned", "empty", "wrong dim", "new", "live", "tombstoned"]
+
+
+def test_retrieve_batch_matches_single_queries(retriever):
+    """
+    @brief 批量检索与逐个retrieve_raw的结果一致，包括命中已删除分块的查询、嵌入为空或维度错误的查询和重复查询
+    @param retriever 检索器与被删除的分块
+    """
+    retriever, old_chunks = retriever
+    expected = [retriever.retrieve_raw(query, use_rerank=False) for query in QUERIES]
+
+    assert retriever.retrieve_batch(QUERIES, use_rerank=False) == expected
+    assert asyncio.run(retriever.aretrieve_batch(QUERIES, use_rerank=False)) == expected
+
+    old_ids = {chunk["chunk_id"] for chunk in old_chunks}
+    assert expected[0] and expected[4]
+    assert expected[2] == expected[3] == []
+    assert not {item["chunk_id"] for results in expected for item in results} & old_ids
+
+
+def test_retrieve_batch_with_caches_matches_uncached(retriever):
+    """
+    @brief 启用查询向量与结果缓存后，批量检索结果不变，重复查询只请求一次嵌入
+    @param retriever 检索器与被删除的分块
+    """
+    retriever, _ = retriever
+    expected = retriever.retrieve_batch(QUERIES, use_rerank=False)
+    retriever.query_cache = TTLCache()
+    retriever.result_cache = TTLCache()
+    retriever.embedding_model.requests.clear()
+
+    assert retriever.retrieve_batch(QUERIES, use_rerank=False) == expected
+    assert retriever.embedding_model.requests == [["live", "tombstoned", "empty", "wrong dim", "new"]]
+    assert retriever.retrieve_batch(QUERIES, use_rerank=False) == expected
+
+
+def test_query_embeddings_are_cached_by_normalized_query(retriever):
+    """
+    @brief 规范化后相同的查询共用缓存的查询向量，只请求一次嵌入；嵌入失败的查询不写入缓存
+    @param retriever 检索器与被删除的分块
+    """
+    retriever, _ = retriever
+    retriever.query_cache = TTLCache()
+    model = retriever.embedding_model
+
+    first = retriever.embed_query("live")
+    assert retriever.embed_query("  LIVE ") == first
+    assert retriever._embed_queries(["Live", "empty", "live  "]) == [first, None, first]
+    assert model.requests == [["live"], ["empty"]]
+    assert retriever.query_cache.stats()["entries"] == 1
+
+
+def test_result_cache_is_invalidated_by_new_index_version(retriever):
+    """
+    @brief 结果缓存键包含索引版本：版本不变时命中缓存，切换到新版本后重新检索，不返回已删除的分块
+    @param retriever 检索器与被删除的分块
+    """
+    retriever, _ = retriever
+    retriever.result_cache = TTLCache()
+    before = retriever.retrieve_raw("live", use_rerank=False)
+    assert retriever.retrieve_raw("live", use_rerank=False) == before
+    assert retriever.result_cache.stats()["hits"] == 1
+    live_id = before[0]["chunk_id"]
+    assert live_id.startswith("b.txt#")
+
+    # 另一个实例修改b.txt并发布新版本，检索器刷新后旧结果不再命中
+    writer = VectorStore()
+    chunks, vectors = make_chunks("b.txt", 1, seed=4)
+    chunks[0]["chunk_id"] += "-v2"
+    assert writer.merge_chunks(chunks, vectors)
+    writer.close()
+    assert retriever.vector_store.refresh()
+
+    after = retriever.retrieve_raw("live", use_rerank=False)
+    assert live_id not in {item["chunk_id"] for item in after}
+    assert retriever.result_cache.stats()["hits"] == 1
+    assert retriever.result_cache.stats()["misses"] == 2
+
+
+def test_retrieve_batch_request_limits_query_count():
+    """
+    @brief 批量检索请求的查询数不能超过配置的上限
+    """
+    limit = SERVICE_CONFIG["retrieve_batch_max_queries"]
+    assert len(RetrieveBatchRequest(queries=["q"] * limit).queries) == limit
+    with pytest.raises(ValidationError):
+        RetrieveBatchRequest(queries=["q"] * (limit + 1))
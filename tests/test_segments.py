@@ -0,0 +1,76 @@
+import numpy as np
+
+from conftest import DIM
+from config import RAG_CONFIG
+from RAG.index_backends import AnnoyBackend, BruteForceBackend
+from RAG.segments import IndexSegment
+
+
+def write_segment(directory, count=20, seed=0):
+    """
+    @brief 写入一个测试段
+    @param directory 段目录
+    @param count 条目数
+    @param seed 随机种子
+    @return (段, 正文向量, 摘要向量)
+    """
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((count, DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    summary = rng.standard_normal((count, DIM)).astype(np.float32)
+    summary /= np.linalg.norm(summary, axis=1, keepdims=True)
+    metadata = [{"text": f"t{i}", "summary": f"s{i}", "source": "doc.txt"} for i in range(count)]
+    chunk_ids = [f"c{i}" for i in range(count)]
+    segment = IndexSegment.write(directory, "seg", DIM, metadata, chunk_ids, vectors, summary)
+    return segment, vectors, summary
+
+
+def test_search_never_returns_tombstoned_rows(tmp_path):
+    """
+    @brief 单条与批量检索都不返回被墓碑删除的行
+    @param tmp_path pytest提供的临时目录
+    """
+    segment, _, summary = write_segment(tmp_path)
+    segment.deleted = {0, 3, 7}
+    for row in segment.deleted:
+        rows, _ = segment.search(summary[row], len(segment))
+        assert not set(rows.tolist()) & segment.deleted
+        assert len(rows) == segment.live_count
+    for rows, _ in segment.search_batch(summary[[0, 3, 7]], len(segment)):
+        assert not set(rows.tolist()) & segment.deleted
+        assert len(rows) == segment.live_count
+
+
+def test_live_items_returns_exactly_the_live_rows(tmp_path):
+    """
+    @brief live_items恰好返回未删除的行
+    @param tmp_path pytest提供的临时目录
+    """
+    segment, vectors, summary = write_segment(tmp_path)
+    segment.deleted = {1, 2, 19}
+    metadata, chunk_ids, live_vectors, live_summary = segment.live_items()
+    live = [row for row in range(20) if row not in segment.deleted]
+    assert chunk_ids == [f"c{row}" for row in live]
+    assert [item["text"] for item in metadata] == [f"t{row}" for row in live]
+    np.testing.assert_allclose(live_vectors, vectors[live], rtol=1e-6)
+    np.testing.assert_allclose(live_summary, summary[live], rtol=1e-6)
+
+
+def test_rewritten_segment_drops_index_files_of_other_backends(tmp_path, monkeypatch):
+    """
+    @brief 中断的构建留下的同名段文件被重写时，其他后端的旧索引文件被删除，加载到的是新索引
+    @param tmp_path pytest提供的临时目录
+    @param monkeypatch pytest的monkeypatch
+    """
+    monkeypatch.setitem(RAG_CONFIG["vector_store"], "type", "annoy")
+    write_segment(tmp_path, seed=0)
+    monkeypatch.setitem(RAG_CONFIG["vector_store"], "type", "brute_force")
+    _, _, summary = write_segment(tmp_path, seed=1)
+
+    prefix = IndexSegment(tmp_path, "seg", DIM).summary_index_prefix
+    assert not AnnoyBackend.path_for(prefix).exists()
+    segment = IndexSegment(tmp_path, "seg", DIM)
+    segment.load()
+    assert segment.summary_index.name == BruteForceBackend.name
+    rows, _ = segment.search(summary[5], 1)
+    assert rows.tolist() == [5]
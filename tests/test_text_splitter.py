@@ -0,0 +1,153 @@
+import random
+
+import pytest
+
+from benchmark import _legacy_smart_split, _synthetic_text
+from config import RAG_CONFIG
+from RAG import text_splitter
+from RAG.text_splitter import TextSplitter
+
+
+def make_splitter(monkeypatch, chunk_size, chunk_overlap):
+    """
+    @brief 创建不使用摘要缓存的分割器
+    @param monkeypatch pytest的monkeypatch
+    @param chunk_size 块大小
+    @param chunk_overlap 相邻块重叠字符数
+    @return TextSplitter实例
+    """
+    monkeypatch.setattr(text_splitter, "get_summary_cache", lambda: None)
+    monkeypatch.setitem(RAG_CONFIG, "text_splitter", {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap})
+    return TextSplitter()
+
+
+def random_text(seed, length):
+    """
+    @brief 生成句末标点、空白与无标点长段随机混合的文本
+    @param seed 随机种子
+    @param length 字符数
+    @return 文本
+    """
+    rng = random.Random(seed)
+    alphabet = "检索向量abc xyz" * 3 + "。？！；.?!;" + "\n\t"
+    return "".join(rng.choice(alphabet) for _ in range(length))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 10, 64, 1500])
+def test_matches_legacy_split_without_overlap(monkeypatch, chunk_size):
+    """
+    @brief 不重叠时与旧版逐字符分割的结果一致
+    @param monkeypatch pytest的monkeypatch
+    @param chunk_size 块大小
+    """
+    splitter = make_splitter(monkeypatch, chunk_size, 0)
+    texts = [_synthetic_text(0.05, seed=1), "", "   ", "无标点的长段落" * 50, "句子。" * 40 + "  "]
+    texts += [random_text(seed, 2000) for seed in range(10)]
+    for text in texts:
+        # 旧实现会在文本以空白结尾时追加空块，新实现不产出空块
+        legacy = [chunk for chunk in _legacy_smart_split(text, chunk_size) if chunk]
+        assert splitter._smart_split(text) == legacy
+
+
+def test_overlapping_chunks(monkeypatch):
+    """
+    @brief 相邻块按chunk_overlap重叠且覆盖整个文本
+    @param monkeypatch pytest的monkeypatch
+    """
+    splitter = make_splitter(monkeypatch, 100, 20)
+    # 不含空白的文本不会因去除首尾空白而移动偏移，便于精确校验重叠
+    text = "".join(random_text(0, 8000).split())
+    offsets = list(splitter._iter_split_offsets(text))
+
+    assert offsets[0][0] == 0
+    assert offsets[-1][1] == len(text)
+    for (start, end), (next_start, _) in zip(offsets, offsets[1:]):
+        assert 0 < end - start <= 100
+        # 下一块从上一块结尾回退chunk_overlap个字符开始；上一块不长于重叠时直接接续
+        assert next_start == (end - 20 if end - 20 > start else end)
+    assert any(end - start > 20 for start, end in offsets)
+
+
+def test_csv_units_keep_rows_and_split_on_row_boundaries(monkeypatch):
+    """
+    @brief CSV单元保留行分隔并按行切分，普通文档的空白被折叠
+    @param monkeypatch pytest的monkeypatch
+    """
+    splitter = make_splitter(monkeypatch, 60, 0)
+    monkeypatch.setattr(splitter, "_summarize", lambda text: (text[:5], False))
+    rows = [f"name: item {i}; price: {i}.5;  note:  x" for i in range(6)]
+    doc = {"file_path": "table.csv", "units": [("\n".join(rows), {"rows": "1-6"})]}
+    plain = {"file_path": "notes.txt", "content": "line one\nline   two"}
+
+    chunks = splitter.split_documents([doc, plain])
+    csv_chunks = [chunk["text"] for chunk in chunks if chunk["source"] == "table.csv"]
+    normalized = [" ".join(row.split()) for row in rows]
+    # 每块由完整的行组成，行之间保留换行，小数点不作为边界
+    assert "\n".join(csv_chunks) == "\n".join(normalized)
+    assert all(set(chunk.split("\n")) <= set(normalized) for chunk in csv_chunks)
+    assert len(csv_chunks) > 1
+    assert all(chunk["rows"] == "1-6" for chunk in chunks if chunk["source"] == "table.csv")
+    assert [chunk["text"] for chunk in chunks if chunk["source"] == "notes.txt"] == ["line one line two"]
+
+
+class FakeSummaryResponse:
+    """
+    @brief 模拟的/api/generate响应，内容为带引号和空白的摘要
+    """
+
+    def __init__(self, status_code):
+        """
+        @brief 初始化响应
+        @param status_code HTTP状态码
+        """
+        self.status_code = status_code
+        self.text = "error"
+
+    def json(self):
+        """
+        @brief 返回响应内容
+        @return 响应内容
+        """
+        return {"response": ' "核心内容" '}
+
+
+class FakeSummarySession:
+    """
+    @brief 记录摘要请求的会话，按预设状态码返回
+    """
+
+    def __init__(self, status_code):
+        """
+        @brief 初始化会话
+        @param status_code 返回的HTTP状态码
+        """
+        self.status_code = status_code
+        self.urls = []
+
+    def post(self, url, json, timeout):
+        """
+        @brief 记录请求地址并返回摘要响应
+        @param url 请求地址
+        @param json 请求体
+        @param timeout 超时时间
+        @return 模拟的响应
+        """
+        self.urls.append(url)
+        return FakeSummaryResponse(self.status_code)
+
+
+@pytest.mark.parametrize("status_code, expected", [(200, ("核心内容", False)), (500, ("alpha beta", True))])
+def test_summary_uses_configured_host_and_shared_session(monkeypatch, status_code, expected):
+    """
+    @brief 摘要请求发往配置的Ollama地址并复用共享会话，请求失败时回退为前几个词
+    @param monkeypatch pytest的monkeypatch
+    @param status_code 摘要服务返回的状态码
+    @param expected 期望的(摘要, 是否回退)
+    """
+    session = FakeSummarySession(status_code)
+    monkeypatch.setattr(text_splitter, "_get_session", lambda: session)
+    monkeypatch.setitem(text_splitter.SERVICE_CONFIG, "ollama_host", "http://ollama.internal:1234")
+    splitter = make_splitter(monkeypatch, 100, 0)
+
+    assert splitter._summarize("alpha beta") == expected
+    assert session.urls == ["http://ollama.internal:1234/api/generate"]
@@ -0,0 +1,252 @@
+import threading
+
+import numpy as np
+
+from conftest import make_chunks
+from RAG import vector_store
+from RAG.segments import IndexSegment
+from RAG.vector_store import VectorStore
+
+
+def ids(results):
+    """
+    @brief 取出检索结果中的分块ID
+    @param results similarity_search的结果
+    @return 分块ID集合
+    """
+    return {chunk_id for _, chunk_id, _ in results}
+
+
+def segment_files_exist(store_dir, name):
+    """
+    @brief 判断段文件是否仍在磁盘上
+    @param store_dir 向量存储目录
+    @param name 段名称
+    @return 存在任一文件时返回True
+    """
+    return bool(IndexSegment(store_dir, name, 8).files())
+
+
+def test_modified_source_is_tombstoned(store_dir):
+    """
+    @brief 修改过的来源文档的旧分块被墓碑删除，不再被检索到
+    @param store_dir 临时向量存储目录
+    """
+    store = VectorStore()
+    chunks, vectors = make_chunks("a.txt", 10, seed=1)
+    assert store.add_chunks(chunks, vectors)
+    
+    new_chunks, new_vectors = make_chunks("a.txt", 3, seed=2)
+    for chunk in new_chunks:
+        chunk["chunk_id"] += "-v2"
+    assert store.merge_chunks(new_chunks, new_vectors)
+    
+    assert len(store) == 3
+    old_ids = {chunk["chunk_id"] for chunk in chunks}
+    for results in [store.similarity_search(vector, 10) for vector in vectors]:
+        assert not ids(results) & old_ids
+    for results in store.similarity_search_batch(vectors, 10):
+        assert not ids(results) & old_ids
+
+
+def test_compact_keeps_exactly_the_live_rows(store_dir):
+    """
+    @brief 压缩后恰好保留未删除的分块
+    @param store_dir 临时向量存储目录
+    """
+    store = VectorStore()
+    expected = set()
+    for i in range(4):
+        chunks, vectors = make_chunks(f"doc{i}.txt", 5, seed=i)
+        assert store.merge_chunks(chunks, vectors)
+        expected |= {chunk["chunk_id"] for chunk in chunks}
+    # 删除一个文档，其分块只以墓碑形式存在
+    assert store.merge_chunks([], [], removed_sources=["doc1.txt"])
+    expected -= {f"doc1.txt#{i}" for i in range(5)}
+    assert len(store.segments) == 4
+    
+    store.min_small_segments = 2
+    assert store.compact()
+    assert len(store.segments) == 1
+    segment = store.segments[0]
+    assert not segment.deleted
+    assert set(segment.chunk_ids) == expected
+    assert len(segment) == len(expected)
+    
+    reloaded = VectorStore()
+    assert set(reloaded.segments[0].chunk_ids) == expected
+
+
+def test_merge_fails_when_published_index_cannot_be_read(store_dir):
+    """
+    @brief 已发布的段无法读取时增量合并失败，不会发布只含新段的版本
+    @param store_dir 临时向量存储目录
+    """
+    store = VectorStore()
+    assert store.add_chunks(*make_chunks("a.txt", 5, seed=1))
+    for path in store.segments[0].files():
+        path.unlink()
+    published = store.segments_path.read_bytes()
+    
+    assert not VectorStore().merge_chunks(*make_chunks("b.txt", 3, seed=2))
+    assert not store.compact()
+    assert store.segments_path.read_bytes() == published
+
+
+def test_failed_merge_leaves_live_segments_untouched(store_dir, monkeypatch):
+    """
+    @brief 新段写入失败时，当前段上不会留下新的墓碑
+    @param store_dir 临时向量存储目录
+    @param monkeypatch pytest的monkeypatch
+    """
+    store = VectorStore()
+    chunks, vectors = make_chunks("a.txt", 5, seed=1)
+    assert store.add_chunks(chunks, vectors)
+    published = store.segments_path.read_bytes()
+    
+    monkeypatch.setattr(store, "_write_segment", lambda items, progress_callback: None)
+    assert not store.merge_chunks(*make_chunks("a.txt", 3, seed=2))
+    assert not store.segments[0].deleted
+    assert ids(store.similarity_search(vectors[0], 5)) == {chunk["chunk_id"] for chunk in chunks}
+    assert store.segments_path.read_bytes() == published
+
+
+def test_full_rebuild_replaces_unreadable_segments(store_dir):
+    """
+    @brief 全量构建只需要段清单，旧段无法加载时仍能替换并退役旧段
+    @param store_dir 临时向量存储目录
+    """
+    store = VectorStore()
+    assert store.add_chunks(*make_chunks("a.txt", 5, seed=1))
+    old_name = store.segments[0].name
+    for path in store.segments[0].files():
+        path.unlink()
+    
+    writer = VectorStore()
+    chunks, vectors = make_chunks("b.txt", 3, seed=2)
+    assert writer.add_chunks(chunks, vectors)
+    assert writer.segments[0].name != old_name
+    assert ids(VectorStore().similarity_search(vectors[0], 3)) == {chunk["chunk_id"] for chunk in chunks}
+
+
+def test_refresh_switches_to_published_version(store_dir):
+    """
+    @brief refresh切换到磁盘上已发布的最新版本
+    @param store_dir 临时向量存储目录
+    """
+    writer = VectorStore()
+    chunks, vectors = make_chunks("a.txt", 5, seed=1)
+    assert writer.add_chunks(chunks, vectors)
+    
+    reader = VectorStore()
+    first_segment = reader.segments[0]
+    version = reader.version
+    assert reader.refresh() is False
+    
+    new_chunks, new_vectors = make_chunks("b.txt", 5, seed=2)
+    assert writer.merge_chunks(new_chunks, new_vectors)
+    # 发布前读者仍使用旧版本
+    assert "b.txt#0" not in ids(reader.similarity_search(new_vectors[0], 3))
+    
+    assert reader.refresh() is True
+    assert reader.version == writer.version > version
+    assert "b.txt#0" in ids(reader.similarity_search(new_vectors[0], 3))
+    # 未变化的段直接复用已映射的数据
+    assert reader.segments[0].vectors is first_segment.vectors
+
+
+def test_compaction_listener_lets_readers_switch_to_compacted_version(store_dir, monkeypatch):
+    """
+    @brief 压缩发布新版本后通知监听者，其他实例刷新后使用压缩后的段，旧的小段随即可被回收
+    @param store_dir 临时向量存储目录
+    @param monkeypatch pytest的monkeypatch
+    """
+    monkeypatch.setattr(VectorStore, "_compaction_listeners", [])
+    writer = VectorStore()
+    for i in range(3):
+        assert writer.merge_chunks(*make_chunks(f"doc{i}.txt", 2, seed=i))
+    reader = VectorStore()
+    small_names = [segment.name for segment in reader.segments]
+    assert len(small_names) == 3
+    
+    refreshed = []
+    VectorStore.add_compaction_listener(lambda: refreshed.append(reader.refresh()))
+    monkeypatch.setattr(writer, "min_small_segments", 2)
+    assert writer.compact()
+    
+    assert refreshed == [True]
+    assert reader.version == writer.version
+    assert len(reader.segments) == 1
+    assert len(reader) == 6
+    assert not any(vector_store._is_referenced(store_dir, name) for name in small_names)
+
+
+def test_released_segment_is_deleted_after_last_reader(store_dir):
+    """
+    @brief 被替换的段在最后一个读者释放后才被删除
+    @param store_dir 临时向量存储目录
+    """
+    writer = VectorStore()
+    chunks, vectors = make_chunks("a.txt", 5, seed=1)
+    assert writer.add_chunks(chunks, vectors)
+    reader = VectorStore()
+    old_name = reader.segments[0].name
+    
+    # 全量重建替换旧段；读者仍持有旧段，文件必须保留
+    assert writer.add_chunks(*make_chunks("a.txt", 5, seed=2))
+    assert segment_files_exist(store_dir, old_name)
+    
+    with reader._reading() as segments:
+        assert segments[0].name == old_name
+        assert reader.refresh()
+        # 进行中的检索仍持有旧段
+        assert segment_files_exist(store_dir, old_name)
+        assert len(reader.similarity_search(vectors[0], 3)) == 3
+    assert not segment_files_exist(store_dir, old_name)
+    
+    # 段清单中的退役记录在下一次保存时清理
+    writer.merge_chunks(*make_chunks("c.txt", 2, seed=3))
+    assert old_name not in writer._retired
+
+
+def test_del_while_refs_lock_is_held_does_not_deadlock(store_dir):
+    """
+    @brief 在持有_refs_lock的线程中触发__del__不会死锁
+    @param store_dir 临时向量存储目录
+    """
+    store = VectorStore()
+    chunks, vectors = make_chunks("a.txt", 5)
+    assert store.add_chunks(chunks, vectors)
+    name = store.segments[0].name
+    
+    def collect_inside_lock():
+        """
+        @brief 在持有_refs_lock时销毁实例
+        """
+        # 垃圾回收可能在持有_refs_lock的线程中触发__del__
+        with vector_store._refs_lock:
+            store.__del__()
+    
+    thread = threading.Thread(target=collect_inside_lock, daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert not vector_store._is_referenced(store_dir, name)
+
+
+def test_close_releases_segment_references(store_dir):
+    """
+    @brief close释放段引用，所有实例关闭后段不再被引用
+    @param store_dir 临时向量存储目录
+    """
+    store = VectorStore()
+    chunks, vectors = make_chunks("a.txt", 5)
+    assert store.add_chunks(chunks, vectors)
+    reader = VectorStore()
+    name = reader.segments[0].name
+    
+    store.close()
+    assert vector_store._is_referenced(store_dir, name)
+    reader.close()
+    assert not vector_store._is_referenced(store_dir, name)
+    assert reader.similarity_search(vectors[0], 5) == []